@@ -0,0 +1,62 @@
+"""
+Benchmark `get_state` against the previous implementation, which always saved the
+state to a temporary file and read it back.
+
+Runs in-process and therefore requires PyMOL to be installed. The structures are
+poly-alanine helices of increasing length, built with `cmd.fab`.
+
+Usage:
+    python benchmarks/get_state.py [--sizes 10 100 1000] [--n-calls 20]
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+
+from pymol import cmd as pymol_cmd
+
+from pymol_remote.server import _BINARY_STATE_FORMATS, _TEXT_STATE_FORMATS, get_state
+
+
+def get_state_tempfile(
+    selection: str = "(all)", state: int = -1, format: str = "pdb"
+) -> str | bytes:
+    """The previous `get_state`: save to a temporary file and read it back."""
+    with tempfile.NamedTemporaryFile(delete=True, suffix=f".{format}") as temp_file:
+        pymol_cmd.save(temp_file.name, selection, state, format)
+        mode = "r" if format in _TEXT_STATE_FORMATS else "rb"
+        with open(temp_file.name, mode) as file:
+            return file.read()
+
+
+def ms_per_call(fn, format: str, n_calls: int) -> float:
+    fn(format=format)  # ... warm up
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        fn(format=format)
+    return (time.perf_counter() - start) / n_calls * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--n-calls", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'residues':>8} {'format':>6} {'tempfile':>12} {'get_state':>12}")
+    for size in args.sizes:
+        pymol_cmd.reinitialize()
+        pymol_cmd.fab("A" * size, "helix", ss=1)
+        # ... `png` would benchmark the renderer rather than the transfer
+        for format in _TEXT_STATE_FORMATS + tuple(
+            f for f in _BINARY_STATE_FORMATS if f != "png"
+        ):
+            old = ms_per_call(get_state_tempfile, format, args.n_calls)
+            new = ms_per_call(get_state, format, args.n_calls)
+            print(f"{size:>8} {format:>6} {old:>9.2f} ms {new:>9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark the number of calls per second with and without persistent connections.
+
+By default, a `PymolXMLRPCServer` (without PyMOL) is started locally on a random port.
+To benchmark a real PyMOL server, e.g. through an SSH tunnel, pass its `--port`.
+
+Usage:
+    python benchmarks/keepalive.py [--host localhost] [--port 9123] [--n-calls 1000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from http.client import HTTPConnection
+from xmlrpc.client import ServerProxy
+
+from pymol_remote.client import TimeoutTransport
+from pymol_remote.server import PymolXMLRPCServer, is_alive
+
+
+class NewConnectionTransport(TimeoutTransport):
+    """Transport that opens a new connection for every request (the old behaviour)."""
+
+    def make_connection(self, host: str):
+        chost, self._extra_headers, _ = self.get_host_info(host)
+        return HTTPConnection(chost, timeout=self.timeout)
+
+
+def calls_per_second(proxy: ServerProxy, n_calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        proxy.is_alive()
+    return n_calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--n-calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    server = None
+    port = args.port
+    if port is None:
+        server = PymolXMLRPCServer(args.host, 0)
+        server.register_function(is_alive, "is_alive")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        _, port = server.server_address
+
+    url = f"http://{args.host}:{port}"
+    for label, transport in (
+        ("new connection per call", NewConnectionTransport(timeout=5.0)),
+        ("keep-alive", TimeoutTransport(timeout=5.0)),
+    ):
+        proxy = ServerProxy(url, transport=transport)
+        proxy.is_alive()  # ... warm up
+        rate = calls_per_second(proxy, args.n_calls)
+        print(f"{label:>24}: {rate:10.1f} calls/s")
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
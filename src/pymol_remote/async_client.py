@@ -0,0 +1,271 @@
+"""
+An asyncio client for the PyMOL RPC server.
+
+# NOTE: All code here will be executed on the client side (where you are running python & this file)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import socket
+from xmlrpc.client import Fault, ProtocolError, dumps, loads
+
+from pymol_remote.client import PymolSession
+from pymol_remote.common import (
+    BULK_METHODS,
+    BULK_PATH,
+    default,
+    log_level,
+    pymol_rpc_bulk_port,
+    pymol_rpc_compress_threshold,
+    pymol_rpc_host,
+    pymol_rpc_port,
+)
+from pymol_remote.encoding import compress, decompress
+
+logger = logging.getLogger("pymol-remote:async-client")
+logger.setLevel(log_level)
+
+_USER_AGENT = "pymol-remote-asyncio"
+
+
+class _Connection(object):
+    """A persistent HTTP/1.1 connection to the PyMOL RPC server."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        # ... whether the connection has already served a request (and may be stale)
+        self.reused = False
+
+    def close(self) -> None:
+        self.writer.close()
+
+    async def request(
+        self, host: str, handler: str, body: bytes, headers: dict
+    ) -> tuple[dict, bytes]:
+        """Send a single XML-RPC request and return the response headers and body."""
+        head = (
+            f"POST {handler} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            f"User-Agent: {_USER_AGENT}\r\n"
+            "Content-Type: text/xml\r\n"
+            + "".join(f"{key}: {value}\r\n" for key, value in headers.items())
+            + f"Content-Length: {len(body)}\r\n"
+            "\r\n"
+        )
+        self.writer.write(head.encode("ascii") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Server closed the connection.")
+        _, status, reason = status_line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        data = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        if int(status) != 200:
+            raise ProtocolError(host + handler, int(status), reason, headers)
+        return headers, data
+
+
+class AsyncPymolSession(object):
+    """
+    An asyncio counterpart of `PymolSession`.
+
+    All pymol commands can be awaited as methods of this object, and several requests
+    can be in flight at the same time: each request uses its own connection from a pool
+    of persistent connections, so that e.g. a long `ray` does not stall a concurrent
+    `get_names`.
+
+    ```python
+    >>> async with AsyncPymolSession(hostname="localhost", port=9123) as session:
+    ...     await session.fetch("6lyz")
+    ...     names, state = await asyncio.gather(
+    ...         session.get_names(), session.get_state(format="cif")
+    ...     )
+    ```
+
+    As with `PymolSession`, large transfers (see `BULK_METHODS`) are sent on the
+    server's bulk-data lane with the longer `bulk_timeout`.
+
+    Note that the server still executes PyMOL commands one at a time, the concurrency
+    is in the transfer of requests and responses.
+    """
+
+    def __init__(
+        self,
+        hostname: str = pymol_rpc_host,
+        port: int = pymol_rpc_port,
+        timeout: float | None = 5.0,
+        max_connections: int = 8,
+        bulk_port: int | None = pymol_rpc_bulk_port,
+        bulk_timeout: float | None = 120.0,
+        compression: str | None = "gzip",
+        compress_threshold: int | None = pymol_rpc_compress_threshold,
+    ):
+        """
+        Initializes an AsyncPymolSession. No connection is made until the first request
+        (or until the session is entered as an async context manager, which checks that
+        the server is alive).
+
+        Args:
+            - hostname (str): The hostname of the PyMol RPC server. Defaults to PYMOL_RPC_HOST.
+            - port (int): The port number of the PyMol RPC server. Defaults to PYMOL_RPC_PORT.
+            - timeout (float | None): The timeout in seconds for each request. None means
+                no timeout. Defaults to 5 seconds.
+            - max_connections (int): The maximum number of concurrent connections (and
+                thus requests in flight) to the server. Defaults to 8.
+            - bulk_port (int | None): The port of the server's bulk-data listener. If None,
+                bulk transfers use the `/bulk` path on `port`. Defaults to PYMOL_RPC_BULK_PORT.
+            - bulk_timeout (float | None): The timeout in seconds for bulk transfers. None
+                means no timeout. Defaults to 120 seconds.
+            - compression (str | None): The codec to compress requests and responses with,
+                see `PymolSession`. None disables compression. Defaults to "gzip".
+            - compress_threshold (int | None): Only compress requests larger than this many
+                bytes. Defaults to PYMOL_RPC_COMPRESS_THRESHOLD (1400).
+        """
+        self.hostname = hostname
+        self.port = int(port)
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.bulk_port = int(default(bulk_port, port))
+        self.bulk_timeout = bulk_timeout
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+        # ... the codecs the server accepts for requests, learnt from its responses
+        self._server_codecs = frozenset()
+        # ... idle connections by port
+        self._idle_connections = {}
+        self._semaphore = None
+
+    async def __aenter__(self) -> AsyncPymolSession:
+        try:
+            alive = await self.is_alive()
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"Connection to PyMol RPC server at `{self.hostname}:{self.port}` timed out after {self.timeout} seconds."
+            )
+        except Exception as e:
+            raise RuntimeError(f"Error connecting to PyMol RPC server: {str(e)}")
+        if not alive:
+            raise RuntimeError(
+                f"Failed to connect to PyMol RPC server at `{self.hostname}:{self.port}`."
+            )
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close all idle connections to the server."""
+        connections, self._idle_connections = self._idle_connections, {}
+        for connection in itertools.chain.from_iterable(connections.values()):
+            connection.close()
+
+    async def _open_connection(self, port: int) -> _Connection:
+        reader, writer = await asyncio.open_connection(self.hostname, port)
+        writer.get_extra_info("socket").setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+        )
+        return _Connection(reader, writer)
+
+    async def _request(self, body: bytes, port: int, handler: str) -> bytes:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+
+        accept_encoding = ", ".join(dict.fromkeys((self.compression, "gzip")))
+        if self.compression is None:
+            accept_encoding = "identity"
+        headers = {"Accept-Encoding": accept_encoding}
+        codec = self.compression if self.compression in self._server_codecs else None
+        payload = compress(body, codec, self.compress_threshold)
+        if payload.content_encoding != "identity":
+            headers["Content-Encoding"] = payload.content_encoding
+
+        async with self._semaphore:
+            host = f"{self.hostname}:{port}"
+            idle_connections = self._idle_connections.setdefault(port, [])
+            for attempt in (0, 1):
+                if idle_connections:
+                    connection = idle_connections.pop()
+                else:
+                    connection = await self._open_connection(port)
+                try:
+                    response_headers, data = await connection.request(
+                        host, handler, payload.body, headers
+                    )
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    connection.close()
+                    # ... retry once if a pooled connection has gone stale
+                    if attempt or not connection.reused:
+                        raise
+                    continue
+                except BaseException:
+                    # ... includes cancellation and timeouts, which leave the
+                    #  connection in an unknown state
+                    connection.close()
+                    raise
+                connection.reused = True
+                idle_connections.append(connection)
+                if "accept-encoding" in response_headers:
+                    self._server_codecs = frozenset(
+                        codec.strip().lower()
+                        for codec in response_headers["accept-encoding"].split(",")
+                    )
+                return decompress(
+                    data, response_headers.get("content-encoding", "identity")
+                )
+
+    async def _call_remote(self, name: str, params: tuple):
+        body = dumps(params, name, allow_none=True).encode("utf-8", "xmlcharrefreplace")
+        if name in BULK_METHODS:
+            request = self._request(body, self.bulk_port, BULK_PATH)
+            timeout = self.bulk_timeout
+        else:
+            request = self._request(body, self.port, "/RPC2")
+            timeout = self.timeout
+        data = await asyncio.wait_for(request, timeout)
+        response, _ = loads(data)
+        return response[0] if len(response) == 1 else response
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(
+                f"'{self.__class__.__name__}' object has no attribute '{name}'"
+            )
+
+        async def _call(*args, **kwargs):
+            try:
+                return await self._call_remote(name, (args, kwargs))
+            except Fault as fault:
+                # ... functions that are not registered with keyword arguments fail
+                #  with a `TypeError` when called with `(args, kwargs)`
+                if kwargs or "TypeError" not in fault.faultString:
+                    raise
+                return await self._call_remote(name, args)
+
+        return _call
+
+    async def python(self, cmd: str):
+        """Execute a Python command in PyMOL, see `PymolSession.python`."""
+        wrapped_cmd = f"python\n{cmd}\npython end"
+        await self.do(wrapped_cmd)
+
+    def __repr__(self):
+        attrs = f"hostname={self.hostname!r}, port={self.port!r}"
+        class_name = self.__class__.__name__
+        repr_str = f"{class_name}({attrs}) at {hex(id(self))}"
+        return repr_str
+
+    def print_help(self):
+        print(PymolSession.__doc__)
@@ -6,17 +6,63 @@ A client for the PyMOL RPC server.
 
 from __future__ import annotations
 
+import codecs
+import contextlib
+import copy
+import hashlib
+import inspect
 import logging
+import os
 import socket
+import textwrap
+import threading
+import time
+from collections import OrderedDict
 from http.client import HTTPConnection
-from xmlrpc.client import ServerProxy, Transport
+from typing import Callable, Iterator
+from xml.parsers.expat import ExpatError
+from xmlrpc.client import (
+    Binary,
+    Fault,
+    ProtocolError,
+    ServerProxy,
+    Transport,
+    dumps,
+    loads,
+)
 
 from pymol_remote.common import (
+    BULK_METHODS,
+    BULK_PATH,
+    CACHEABLE_METHODS,
+    FAULT_UNKNOWN_PRESET,
+    FAULT_UNKNOWN_PROCEDURE,
+    FLOAT_ATOM_FIELDS,
+    GENERATION_HEADER,
+    INTEGER_ATOM_FIELDS,
+    PRIORITY_JOB,
+    default,
     exists,
     log_level,
+    pymol_rpc_bulk_port,
+    pymol_rpc_compress_threshold,
     pymol_rpc_host,
+    pymol_rpc_keepalive_timeout,
     pymol_rpc_port,
 )
+from pymol_remote.encoding import (
+    AtomTable,
+    CompressionStats,
+    FrameEncoder,
+    Payload,
+    compress,
+    decode_array,
+    decode_indices,
+    decompress,
+    encode_array,
+    encode_indices,
+    preset_digest,
+)
 
 logger = logging.getLogger("pymol-remote:client")
 logger.setLevel(log_level)
@@ -28,17 +74,428 @@ logger.addHandler(handler)
 
 
 _GLOBAL_SERVER_PROXY = None
+_GLOBAL_BULK_SERVER_PROXY = None
 
 
 class TimeoutTransport(Transport):
-    def __init__(self, timeout):
+    """
+    XML-RPC transport with a socket timeout that reuses its HTTP/1.1 connection.
+
+    Each thread keeps its own persistent connection to the server (`HTTPConnection` sets
+    `TCP_NODELAY` on connect). Connections that have been idle for longer than
+    `idle_timeout` are re-opened before they are used, and connections that turn out to
+    be stale anyway are transparently re-opened by `Transport.request`.
+
+    Responses may be compressed with `codec` (or gzip), and requests larger than
+    `encode_threshold` bytes are compressed with `codec` once the server has advertised
+    that it accepts it.
+
+    The server's generation counter and `ETag` of the last response are kept per
+    thread, see `ResponseCache`.
+    """
+
+    def __init__(
+        self,
+        timeout: float,
+        idle_timeout: float = pymol_rpc_keepalive_timeout,
+        codec: str | None = "gzip",
+        encode_threshold: int | None = pymol_rpc_compress_threshold,
+        compression_stats: CompressionStats | None = None,
+    ):
         self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.codec = codec
+        self.encode_threshold = encode_threshold
+        self.compression_stats = default(compression_stats, CompressionStats())
+        self._local = threading.local()
+        # ... the codecs the server accepts for requests, learnt from its responses
+        self._server_codecs = frozenset()
+        # ... the highest generation of the server seen in any response
+        self.generation = 0
         super().__init__()
 
+    def _record_generation(self, generation: str | None) -> None:
+        self._local.generation = None if generation is None else int(generation)
+        if generation is not None:
+            self.generation = max(self.generation, int(generation))
+
+    @property
+    def _accept_encoding(self) -> str:
+        if self.codec is None:
+            return "identity"
+        return "gzip" if self.codec == "gzip" else f"{self.codec}, gzip"
+
+    @property
+    def _connection(self) -> tuple:
+        # ... `Transport` caches a single `(host, connection)` pair, keep one per thread
+        #  so that the transport can be shared between threads
+        return getattr(self._local, "connection", (None, None))
+
+    @_connection.setter
+    def _connection(self, connection: tuple) -> None:
+        self._local.connection = connection
+
     def make_connection(self, host: str):
-        conn = HTTPConnection(host, timeout=self.timeout)
+        now = time.monotonic()
+        idle_time = now - getattr(self._local, "last_used", now)
+        self._local.last_used = now
+
+        cached_host, conn = self._connection
+        if conn is not None and host == cached_host:
+            if idle_time < self.idle_timeout:
+                return conn
+            # ... the server has likely closed the idle connection already
+            self.close()
+
+        chost, self._extra_headers, _ = self.get_host_info(host)
+        conn = HTTPConnection(chost, timeout=self.timeout)
+        self._connection = host, conn
         return conn
 
+    def send_request(self, host, handler, request_body, debug):
+        connection = self.make_connection(host)
+        headers = self._headers + self._extra_headers
+        if debug:
+            connection.set_debuglevel(1)
+        connection.putrequest("POST", handler, skip_accept_encoding=True)
+        headers.append(("Accept-Encoding", self._accept_encoding))
+        if_none_match = getattr(self._local, "if_none_match", None)
+        if if_none_match is not None:
+            headers.append(("If-None-Match", if_none_match))
+        headers.append(("Content-Type", "text/xml"))
+        headers.append(("User-Agent", self.user_agent))
+        self.send_headers(connection, headers)
+        self.send_content(connection, request_body)
+        return connection
+
+    def send_content(self, connection, request_body):
+        codec = self.codec if self.codec in self._server_codecs else None
+        payload = compress(request_body, codec, self.encode_threshold)
+        if payload.content_encoding != "identity":
+            connection.putheader("Content-Encoding", payload.content_encoding)
+            self.compression_stats.record("request", payload, payload.cpu_time)
+        connection.putheader("Content-Length", str(len(payload.body)))
+        connection.endheaders(payload.body)
+
+    def parse_response(self, response):
+        self._local.etag = response.getheader("ETag")
+        self._record_generation(response.getheader(GENERATION_HEADER))
+        accept_encoding = response.getheader("Accept-Encoding")
+        if accept_encoding is not None:
+            self._server_codecs = frozenset(
+                codec.strip().lower() for codec in accept_encoding.split(",")
+            )
+
+        content_encoding = response.getheader("Content-Encoding", "identity")
+        if content_encoding == "identity":
+            return super().parse_response(response)
+
+        body = response.read()
+        start = time.thread_time()
+        data = decompress(body, content_encoding)
+        self.compression_stats.record(
+            "response",
+            Payload(body, content_encoding, len(data)),
+            time.thread_time() - start,
+        )
+        parser, unmarshaller = self.getparser()
+        parser.feed(data)
+        parser.close()
+        return unmarshaller.close()
+
+
+def _unwrap_binary(value):
+    """Get the bytes of an `xmlrpc.client.Binary` (any other value is returned as is)."""
+    return value.data if isinstance(value, Binary) else value
+
+
+class ResponseCache(object):
+    """
+    A bounded LRU cache of the responses of read-only calls (see `CACHEABLE_METHODS`).
+
+    Each response is stored with the server's `ETag` and generation counter at the time
+    of the call. A cached response is revalidated with an `If-None-Match` request, which
+    the server answers with a body-less `304 Not Modified` if nothing has changed since.
+    Responses evicted from memory are kept in `directory` if one is given, up to
+    `max_disk_size` files. They are stored as XML-RPC, like they were received, so that
+    reading them back cannot run code.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 128,
+        directory: str | None = None,
+        max_disk_size: int = 1024,
+    ):
+        """
+        Args:
+            - max_size (int): The maximum number of responses kept in memory.
+                Defaults to 128.
+            - directory (str | None): The directory of the on-disk tier. None disables it.
+                Defaults to None.
+            - max_disk_size (int): The maximum number of responses kept on disk.
+                Defaults to 1024.
+        """
+        self.max_size = max_size
+        self.directory = directory
+        self.max_disk_size = max_disk_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.reset_stats()
+
+    @staticmethod
+    def key(address: str, name: str, args: tuple, kwargs: dict) -> str:
+        """The key of a call, as the hash of the server address and the marshalled call."""
+        call = dumps((list(args), kwargs), name, allow_none=True)
+        return hashlib.sha256(f"{address}\n{call}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> tuple | None:
+        """Get the `(etag, generation, validated_at, response)` of a call, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        entry = self._read(key)
+        if entry is not None:
+            self._insert(key, entry)
+        return entry
+
+    def put(
+        self,
+        key: str,
+        etag: str,
+        generation: int,
+        response,
+        validated_at: float | None = None,
+    ) -> None:
+        """Cache the response of a call, validated at `validated_at` (defaults to now)."""
+        self._insert(
+            key, (etag, generation, default(validated_at, time.time()), response)
+        )
+
+    def _insert(self, key: str, entry: tuple) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_size:
+                evicted.append(self._entries.popitem(last=False))
+        for evicted_key, entry in evicted:
+            self._write(evicted_key, entry)
+
+    def record(self, counter: str) -> None:
+        """Increment one of the counters of `stats`."""
+        with self._lock:
+            self._stats[counter] += 1
+
+    def clear(self) -> None:
+        """Remove all cached responses, including those on disk."""
+        with self._lock:
+            self._entries.clear()
+        for path in self._disk_paths():
+            os.remove(path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+    def reset_stats(self) -> None:
+        self._stats = {"n_hits": 0, "n_not_modified": 0, "n_misses": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.xml")
+
+    def _disk_paths(self) -> list[str]:
+        if self.directory is None:
+            return []
+        return [
+            entry.path
+            for entry in os.scandir(self.directory)
+            if entry.name.endswith(".xml")
+        ]
+
+    def _read(self, key: str) -> tuple | None:
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), "rb") as file:
+                (entry,), _ = loads(file.read(), use_builtin_types=True)
+        except (OSError, ExpatError, ValueError, Fault):
+            return None
+        return tuple(entry)
+
+    def _write(self, key: str, entry: tuple) -> None:
+        if self.directory is None:
+            return
+        with open(self._path(key), "w", encoding="utf-8") as file:
+            file.write(dumps((list(entry),), allow_none=True))
+        paths = self._disk_paths()
+        if len(paths) > self.max_disk_size:
+            paths.sort(key=os.path.getmtime)
+            for path in paths[: len(paths) - self.max_disk_size]:
+                os.remove(path)
+
+
+class PymolBatch(object):
+    """
+    A queue of PyMOL commands that is sent to the server in a single request.
+
+    Commands are queued by calling them as methods of this object (with the same
+    signature as on a `PymolSession`) and are sent to the server as one
+    `system.multicall_kwargs` request when the batch is executed. The server runs them
+    in order and the results are available positionally in `results`, with failed calls
+    represented by an `xmlrpc.client.Fault`.
+
+    Create a batch with `PymolSession.batch`:
+
+    ```python
+    >>> with session.batch() as batch:
+    ...     batch.fetch("6lyz")
+    ...     batch.color("white", "6lyz")
+    ...     batch.get_names()
+    >>> batch.results
+    [None, None, ['6lyz']]
+    ```
+    """
+
+    def __init__(self, server: ServerProxy, raise_on_error: bool = True):
+        """
+        Args:
+            - server (ServerProxy): The server proxy to send the batch to.
+            - raise_on_error (bool): If True, the first failed call in the batch is
+                raised as an `xmlrpc.client.Fault` after the whole batch has been executed.
+                Defaults to True.
+        """
+        self._server = server
+        self._calls = []
+        self.raise_on_error = raise_on_error
+        self.results = None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(
+                f"'{self.__class__.__name__}' object has no attribute '{name}'"
+            )
+
+        def _queue(*args, **kwargs) -> int:
+            self._calls.append({"methodName": name, "args": args, "kwargs": kwargs})
+            # ... return the position of the call's result in `results`
+            return len(self._calls) - 1
+
+        return _queue
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __enter__(self) -> PymolBatch:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # ... do not send a half-built batch if the `with` block failed
+        if exc_type is None:
+            self.execute()
+
+    def execute(self) -> list:
+        """Send all queued calls to the server in a single request.
+
+        Returns:
+            list: The results of the queued calls, in the order they were queued. Failed
+                calls are represented by an `xmlrpc.client.Fault`.
+
+        Raises:
+            - xmlrpc.client.Fault: If `raise_on_error` is set and any call failed.
+        """
+        calls, self._calls = self._calls, []
+        responses = self._server.system.multicall_kwargs(calls) if calls else []
+        self.results = [
+            Fault(response["faultCode"], response["faultString"])
+            if isinstance(response, dict)
+            else response[0]
+            for response in responses
+        ]
+        if self.raise_on_error:
+            for result in self.results:
+                if isinstance(result, Fault):
+                    raise result
+        return self.results
+
+
+class TrajectoryUpload(object):
+    """
+    An upload of trajectory frames into a multi-state object on the server.
+
+    Frames are sent as packed float32 arrays in chunks of at most `chunk_size` bytes,
+    and each chunk is loaded as new states of the object as soon as it arrives, so the
+    trajectory can be viewed while it is being uploaded.
+
+    Create an upload with `PymolSession.begin_trajectory`:
+
+    ```python
+    >>> with session.begin_trajectory("traj", topology_pdb) as upload:
+    ...     upload.append_frames(frames)  # e.g. a (n_frames, n_atoms, 3) array
+    >>> upload.n_frames
+    5000
+    ```
+    """
+
+    def __init__(self, session: PymolSession, upload_id: str, chunk_size: int):
+        """
+        Args:
+            - session (PymolSession): The session to upload the frames through.
+            - upload_id (str): The id of the upload, as returned by `begin_trajectory`
+                on the server.
+            - chunk_size (int): The maximum size of each request in bytes.
+        """
+        self._session = session
+        self.upload_id = upload_id
+        self.chunk_size = chunk_size
+        self.n_frames = 0
+
+    def append_frames(self, frames) -> int:
+        """Append frames to the trajectory.
+
+        Args:
+            - frames (numpy.ndarray | list): The `(n_frames, n_atoms, 3)` coordinates of
+                the frames in Angstrom, in the atom order of the topology, or the
+                `(n_atoms, 3)` coordinates of a single frame.
+
+        Returns:
+            int: The number of frames uploaded so far.
+        """
+        if len(frames) and len(frames[0]) and not hasattr(frames[0][0], "__len__"):
+            frames = [frames]  # ... a single frame
+        n_atoms = len(frames[0]) if len(frames) else 0
+        if n_atoms and len(frames[0][0]) != 3:
+            raise ValueError(
+                "Frames must have shape (n_frames, n_atoms, 3) or (n_atoms, 3), got "
+                f"{len(frames[0][0])} coordinates per atom."
+            )
+        frames_per_chunk = max(1, self.chunk_size // max(1, n_atoms * 3 * 4))
+        for start in range(0, len(frames), frames_per_chunk):
+            self.n_frames = self._session._call_with_kwargs(
+                "append_frames",
+                self.upload_id,
+                encode_array(frames[start : start + frames_per_chunk]),
+            )
+        return self.n_frames
+
+    def commit(self) -> int:
+        """Finish the upload. Returns the number of frames that were uploaded."""
+        self.n_frames = self._session._call_with_kwargs(
+            "commit_trajectory", self.upload_id
+        )
+        return self.n_frames
+
+    def __enter__(self) -> TrajectoryUpload:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # ... the frames uploaded so far are kept even if the `with` block failed
+        self.commit()
+
 
 class PymolSession(object):
     """
@@ -77,6 +534,48 @@ class PymolSession(object):
     )  # returns the current state as .pdb string
     ```
 
+    Commands that transfer large payloads (`get_state`, `set_state`, `png`, ...) are
+    automatically sent on the server's bulk-data lane, over their own connection and
+    with the longer `bulk_timeout`, so they do not hold up small commands.
+
+    Requests and responses larger than `compress_threshold` bytes are compressed with
+    the `compression` codec (gzip by default), `compression_stats` reports the
+    compression ratio and CPU time.
+
+    Very large exports can be streamed in chunks with `iter_state`, which takes the
+    same arguments as `get_state`.
+
+    Coordinates are best fetched with `get_coords`, which transfers them as a packed
+    float32 array and returns a NumPy array (if NumPy is installed), and updated in
+    place with `set_coords`.
+
+    Python code can be run next to PyMOL, and its result returned, with `run_python`.
+    Functions that are called repeatedly can be registered once with
+    `register_procedure` and then called by name.
+
+    With `cache_size` > 0, responses of read-only calls such as `get_state`,
+    `get_names` or `count_atoms` are cached, and only re-sent by the server if the
+    session has changed since (see `ResponseCache`). Changes made in PyMOL's GUI or
+    console are not tracked by the server, so only enable the cache if the session is
+    changed through this client, or use `clear_cache` after changing it in PyMOL itself.
+
+    To send many commands in a single round trip, you can queue them in a batch.
+    For example:
+
+    ```python
+    >>> with session.batch() as batch:
+    ...     batch.set("ray_trace_mode", 1)
+    ...     batch.set("antialias", 3)
+    ```
+
+    Long-running commands (e.g. `ray` or `png` on big sessions) can be run as jobs that
+    are not subject to the connection timeout:
+
+    ```python
+    >>> job_id = session.submit("ray", 2000, 2000)
+    >>> session.result(job_id, timeout=120)
+    ```
+
     To get help with a specific command, you can use the `help` method.
     For example:
 
@@ -92,6 +591,13 @@ class PymolSession(object):
         port: int = pymol_rpc_port,
         force_new: bool = False,
         timeout: float = 5.0,  # Default timeout of 5 seconds
+        bulk_port: int | None = pymol_rpc_bulk_port,
+        bulk_timeout: float = 120.0,
+        compression: str | None = "gzip",
+        compress_threshold: int | None = pymol_rpc_compress_threshold,
+        cache_size: int = 0,
+        cache_dir: str | None = None,
+        cache_max_age: float = 0.0,
     ):
         """
         Initializes a PymolSession object to interact with a PyMol RPC server.
@@ -101,6 +607,24 @@ class PymolSession(object):
             - port (int): The port number of the PyMol RPC server. Defaults to PYMOL_RPC_DEFAULT_PORT.
             - force_new (bool): If True, forces the creation of a new server connection. Defaults to False.
             - timeout (float): The timeout duration in seconds for the server connection. Defaults to 5 seconds.
+            - bulk_port (int | None): The port of the server's bulk-data listener. If None, bulk
+                transfers use the `/bulk` path on `port`. Defaults to PYMOL_RPC_BULK_PORT.
+            - bulk_timeout (float): The timeout duration in seconds for bulk transfers (see
+                `BULK_METHODS`). Defaults to 120 seconds.
+            - compression (str | None): The codec to compress requests and responses with,
+                one of "gzip", "deflate", "xz" or "x-pdb-deflate" (deflate with a preset
+                dictionary for PDB records). None disables compression. Defaults to "gzip".
+            - compress_threshold (int | None): Only compress requests larger than this many
+                bytes. Defaults to PYMOL_RPC_COMPRESS_THRESHOLD (1400).
+            - cache_size (int): The number of responses of read-only calls (see
+                `CACHEABLE_METHODS`) to cache in memory, e.g. 128. Defaults to 0 (no
+                cache).
+            - cache_dir (str | None): A directory to keep responses evicted from the
+                memory cache in. Defaults to None (no on-disk cache).
+            - cache_max_age (float): Cached responses validated less than this many
+                seconds ago are returned without asking the server, unless this client has
+                since seen the session change. Defaults to 0 (always ask the server, which
+                answers with a small "not modified" response if nothing has changed).
 
         Raises:
             - RuntimeError: If the connection to the PyMol RPC server fails.
@@ -109,14 +633,29 @@ class PymolSession(object):
         """
         self.hostname = hostname
         self.port = port
-        global _GLOBAL_SERVER_PROXY
+        self.timeout = timeout
+        # ... the encoders of the objects streamed with `stream_frame`
+        self._frame_encoders = {}
+        # ... the sources of the procedures registered with `register_procedure`
+        self._procedure_sources = {}
+        self.cache = ResponseCache(cache_size, cache_dir) if cache_size else None
+        self.cache_max_age = cache_max_age
+        global _GLOBAL_SERVER_PROXY, _GLOBAL_BULK_SERVER_PROXY
         if force_new or not exists(_GLOBAL_SERVER_PROXY):
             logger.info(f"Connecting to PyMol RPC server at `{hostname}:{port}`")
             _GLOBAL_SERVER_PROXY = None
 
             # Create a ServerProxy with a custom Transport that includes a timeout
-            transport = TimeoutTransport(timeout)
-            server = ServerProxy(f"http://{hostname}:{port}", transport=transport)
+            compression_stats = CompressionStats()
+            transport = TimeoutTransport(
+                timeout,
+                codec=compression,
+                encode_threshold=compress_threshold,
+                compression_stats=compression_stats,
+            )
+            server = ServerProxy(
+                f"http://{hostname}:{port}", transport=transport, allow_none=True
+            )
 
             try:
                 if not server.is_alive():
@@ -133,9 +672,19 @@ class PymolSession(object):
                 raise RuntimeError(f"Error connecting to PyMol RPC server: {str(e)}")
 
             _GLOBAL_SERVER_PROXY = server
-            self._server = server
-        else:
-            self._server = _GLOBAL_SERVER_PROXY
+            # ... a separate transport, so bulk transfers use their own connection
+            _GLOBAL_BULK_SERVER_PROXY = ServerProxy(
+                f"http://{hostname}:{default(bulk_port, port)}{BULK_PATH}",
+                transport=TimeoutTransport(
+                    bulk_timeout,
+                    codec=compression,
+                    encode_threshold=compress_threshold,
+                    compression_stats=compression_stats,
+                ),
+                allow_none=True,
+            )
+        self._server = _GLOBAL_SERVER_PROXY
+        self._bulk_server = _GLOBAL_BULK_SERVER_PROXY
 
     def __getattr__(self, name):
         # First, check if the attribute exists in the instance
@@ -151,12 +700,12 @@ class PymolSession(object):
         if name == "cmd":
             return getattr(self._server, name)
 
-        # If not, get the attribute from the server proxy
-        call_proxy = getattr(self._server, name)
+        # If not, get the attribute from the server proxy of the method's lane
+        call_proxy = getattr(self._get_proxy(name), name)
 
         def _call(*args, **kwargs):
             try:
-                return call_proxy(args, kwargs)
+                return self._call_remote(name, call_proxy, args, kwargs)
             except Exception:
                 if args and kwargs:
                     return call_proxy(*args, **kwargs)
@@ -169,6 +718,551 @@ class PymolSession(object):
 
         return _call
 
+    def batch(self, raise_on_error: bool = True) -> PymolBatch:
+        """Create a batch that sends all queued commands to the server in one request.
+
+        Use it as a context manager, the batch is executed when the `with` block exits:
+
+        ```python
+        >>> with session.batch() as batch:
+        ...     batch.alter("elem C", "vdw=1.70")
+        ...     batch.rebuild()
+        ```
+
+        Args:
+            - raise_on_error (bool): If True, raise the first failed call of the batch as
+                an `xmlrpc.client.Fault` once the batch has been executed. The results of
+                all calls remain available in `batch.results`. Defaults to True.
+
+        Returns:
+            PymolBatch: The (empty) batch.
+        """
+        return PymolBatch(self._server, raise_on_error=raise_on_error)
+
+    def submit(self, name: str, *args, priority: int = PRIORITY_JOB, **kwargs) -> str:
+        """Queue a long-running command as a job and return the job's id immediately.
+
+        Jobs are not subject to the connection timeout. Regular calls jump ahead of queued
+        jobs with the default priority, so the session stays interactive while e.g. a
+        render is waiting to run.
+
+        ```python
+        >>> job_id = session.submit("png", "/tmp/image.png", width=2000, ray=1)
+        >>> session.poll(job_id)
+        'pending'
+        >>> session.result(job_id, timeout=60)
+        ```
+
+        Args:
+            - name (str): The name of the command to run, e.g. "ray" or "get_state".
+            - *args: The positional arguments of the command.
+            - priority (int): The priority of the job, lower values run first. Regular
+                calls have priority 0. Defaults to 10.
+            - **kwargs: The keyword arguments of the command.
+
+        Returns:
+            str: The id of the job.
+        """
+        return self._call_with_kwargs("submit_job", name, args, kwargs, priority)
+
+    def poll(self, job_id: str) -> str:
+        """Get the status of a job: "pending", "running", "done", "failed" or "cancelled"."""
+        return self._call_with_kwargs("poll_job", job_id)
+
+    def result(self, job_id: str, timeout: float | None = None):
+        """Wait for a job to finish and return its result.
+
+        Args:
+            - job_id (str): The id of the job, as returned by `submit`.
+            - timeout (float | None): The maximum time in seconds to wait. None means
+                wait forever. Defaults to None.
+
+        Returns:
+            The result of the job's command.
+
+        Raises:
+            - TimeoutError: If the job did not finish within `timeout` seconds.
+            - xmlrpc.client.Fault: If the job failed or was cancelled.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # ... wait on the server in slices that are well within the connection timeout
+            wait_time = self.timeout / 2
+            if deadline is not None:
+                wait_time = max(0.0, min(wait_time, deadline - time.monotonic()))
+            response = self._call_with_kwargs("get_job_result", job_id, wait_time)
+            if response["status"] == "done":
+                return response.get("result")
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(
+                    f"Job `{job_id}` did not finish within {timeout} seconds."
+                )
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet. Returns True if it was cancelled."""
+        return self._call_with_kwargs("cancel_job", job_id)
+
+    def get_coords(self, selection: str = "all", state: int = 1):
+        """Get the coordinates of a selection as an `(n_atoms, 3)` float32 array.
+
+        The coordinates are transferred as a packed binary buffer rather than as text
+        or nested lists:
+
+        ```python
+        >>> coords = session.get_coords("name CA", state=1)
+        >>> coords.shape
+        (129, 3)
+        ```
+
+        Args:
+            - selection (str): The selection of atoms. Defaults to "all".
+            - state (int): The state to get the coordinates of. Defaults to 1, -1 means
+                the current state.
+
+        Returns:
+            numpy.ndarray | memoryview: A read-only NumPy array that shares the memory of
+                the response if NumPy is installed, otherwise a memoryview of the same
+                shape (use `.tolist()` to get nested lists).
+        """
+        return decode_array(
+            _unwrap_binary(self._call_with_kwargs("get_coords", selection, state))
+        )
+
+    def get_ensemble_coords(
+        self,
+        selection: str = "all",
+        start: int = 1,
+        stop: int | None = None,
+        step: int = 1,
+    ):
+        """Get the coordinates of a selection in several states in a single call.
+
+        ```python
+        >>> ensemble = session.get_ensemble_coords("name CA", step=10)
+        >>> ensemble.shape  # ... every 10th of 5000 states
+        (500, 129, 3)
+        ```
+
+        Args:
+            - selection (str): The selection of atoms. Defaults to "all".
+            - start (int): The first state (1-based). Defaults to 1.
+            - stop (int | None): The last state, inclusive. Defaults to None (the last
+                state of the selection).
+            - step (int): The stride between states. Defaults to 1.
+
+        Returns:
+            numpy.ndarray | memoryview: The `(n_states, n_atoms, 3)` coordinates, see
+                `get_coords`.
+        """
+        return decode_array(
+            _unwrap_binary(
+                self._call_with_kwargs(
+                    "get_ensemble_coords", selection, start, stop, step
+                )
+            )
+        )
+
+    def begin_trajectory(
+        self,
+        object: str,
+        topology: str | bytes,
+        format: str = "pdb",
+        chunk_size: int = 4 << 20,
+    ) -> TrajectoryUpload:
+        """Start uploading a trajectory into a multi-state object.
+
+        The topology is loaded into `object` (replacing any existing object of that
+        name), and frame `i` of the trajectory becomes state `i` of the object:
+
+        ```python
+        >>> with session.begin_trajectory("traj", topology_pdb) as upload:
+        ...     for frames in simulation.run(n_steps=100):
+        ...         upload.append_frames(frames)
+        ```
+
+        Args:
+            - object (str): The name of the object to create.
+            - topology (str | bytes): The structure that defines the atoms, e.g. a PDB
+                string.
+            - format (str): The format of the topology. Defaults to "pdb".
+            - chunk_size (int): The maximum size of each request in bytes. Defaults to
+                4 MiB.
+
+        Returns:
+            TrajectoryUpload: The upload, to append frames to.
+        """
+        upload_id = self._call_with_kwargs("begin_trajectory", object, topology, format)
+        return TrajectoryUpload(self, upload_id, chunk_size)
+
+    def get_atom_table(
+        self,
+        selection: str = "all",
+        fields: list[str] | None = None,
+        state: int = -1,
+    ) -> AtomTable:
+        """Get per-atom properties of a selection as a columnar table.
+
+        The properties are transferred as packed arrays, one per field, instead of as
+        text or per-atom Python objects:
+
+        ```python
+        >>> table = session.get_atom_table("polymer", fields=["chain", "resi", "b"])
+        >>> table["b"]  # ... a float32 array with one value per atom
+        ```
+
+        Args:
+            - selection (str): The selection of atoms. Defaults to "all".
+            - fields (list[str]): The properties to get: any property available in
+                PyMOL's `iterate` (e.g. "chain", "resi", "resn", "name", "elem", "b",
+                "q", "partial_charge", "vdw", "ss", "index") as well as the coordinates
+                "x", "y" and "z". Defaults to chain, resi, resn, name, elem, b and q.
+            - state (int): The state of the coordinates. Defaults to -1 (the current
+                state).
+
+        Returns:
+            AtomTable: The table, with one row per atom in the order of the selection.
+        """
+        table = self._call_with_kwargs("get_atom_table", selection, fields, state)
+        table["columns"] = {
+            name: _unwrap_binary(data) for name, data in table["columns"].items()
+        }
+        return AtomTable(table)
+
+    def set_coords(self, selection: str, coords, state: int = 1) -> int:
+        """Update the coordinates of a selection in place, without reloading it.
+
+        ```python
+        >>> coords = session.get_coords("chain A")
+        >>> session.set_coords("chain A", coords + [1.0, 0.0, 0.0])
+        ```
+
+        Args:
+            - selection (str): The selection of atoms to update.
+            - coords (numpy.ndarray | list): The `(n_atoms, 3)` coordinates in Angstrom,
+                in the order of the selection. Sent as a packed float32 array.
+            - state (int): The state to update. Defaults to 1, -1 means the current state.
+
+        Returns:
+            int: The number of atoms that were updated.
+        """
+        return self._call_with_kwargs(
+            "set_coords", selection, encode_array(coords), state
+        )
+
+    def set_atom_property(
+        self, selection: str, field: str, values, key_field: str = "elem"
+    ) -> int:
+        """Set a property of all atoms in a selection with a single `alter` and `rebuild`.
+
+        ```python
+        >>> session.set_atom_property("all", "b", scores)  # ... one value per atom
+        >>> session.set_atom_property("all", "vdw", {"C": 1.7, "N": 1.55})  # ... by element
+        ```
+
+        Args:
+            - selection (str): The selection of atoms to update.
+            - field (str): The property to set, e.g. "b", "q", "vdw" or "label".
+            - values (numpy.ndarray | list | dict): Either one value per atom in the order
+                of the selection (sent as a packed int32 array for the
+                `INTEGER_ATOM_FIELDS`, e.g. "color", as a packed float32 array for the
+                `FLOAT_ATOM_FIELDS`, e.g. "b", and as a list for the string fields,
+                e.g. "resi"), or a mapping from the value of `key_field` to the new
+                value.
+            - key_field (str): The property to look up in a mapping. Defaults to "elem".
+
+        Returns:
+            int: The number of atoms that were visited.
+        """
+        if isinstance(values, dict):
+            # ... XML-RPC only allows string keys, the server compares `str(key_field)`
+            values = {str(key): value for key, value in values.items()}
+        elif field in INTEGER_ATOM_FIELDS:
+            values = encode_array(values, "<i4")
+        elif field in FLOAT_ATOM_FIELDS:
+            values = encode_array(values, "<f4")
+        else:
+            values = [str(value) for value in values]
+        return self._call_with_kwargs(
+            "set_atom_property", selection, field, values, key_field
+        )
+
+    def set_atom_colors(self, selection: str, colors) -> int:
+        """Color each atom of a selection with its own RGB color, in a single call.
+
+        ```python
+        >>> rgb = matplotlib.colormaps["viridis"](scores)[:, :3]
+        >>> session.set_atom_colors("all", rgb)
+        ```
+
+        Args:
+            - selection (str): The selection of atoms to color.
+            - colors (numpy.ndarray | list): The `(n_atoms, 3)` colors in the order of the
+                selection, either integers in 0-255 (sent as uint8) or floats in 0-1.
+
+        Returns:
+            int: The number of atoms that were colored.
+        """
+        dtype = getattr(colors, "dtype", None)
+        if dtype is not None:
+            is_integer = dtype.kind in "ui"
+        else:
+            first = colors
+            while isinstance(first, (list, tuple)) and first:
+                first = first[0]
+            is_integer = isinstance(first, int)
+        return self._call_with_kwargs(
+            "set_atom_colors",
+            selection,
+            encode_array(colors, "|u1" if is_integer else "<f4"),
+        )
+
+    def select_indices(
+        self, name: str, object: str, indices, encoding: str | None = None
+    ) -> int:
+        """Define a selection from the atom indices of an object.
+
+        The indices are sent compactly (as a packed array, runs of consecutive indices
+        or a bitset, whichever is smallest) rather than as an `index 1+5+9+...` string.
+
+        ```python
+        >>> session.select_indices("pocket", "6lyz", [12, 13, 14, 58, 59, 108])
+        6
+        ```
+
+        Args:
+            - name (str): The name of the selection to create (or replace).
+            - object (str): The object the indices refer to.
+            - indices (numpy.ndarray | list[int]): The (1-based) atom indices within
+                `object`, as e.g. returned by `get_selection_indices`.
+            - encoding (str | None): Force one of
+                `pymol_remote.encoding.INDEX_ENCODINGS`. Defaults to None (the smallest).
+
+        Returns:
+            int: The number of atoms in the selection.
+        """
+        return self._call_with_kwargs(
+            "select_indices", name, object, encode_indices(indices, encoding)
+        )
+
+    def get_selection_indices(
+        self, selection: str = "sele", encoding: str | None = None
+    ) -> dict[str, list[int]]:
+        """Get the atom indices of a selection, by object.
+
+        ```python
+        >>> session.get_selection_indices("resn HOH")
+        {'6lyz': [1002, 1003, ...]}
+        ```
+
+        Args:
+            - selection (str): The selection. Defaults to "sele".
+            - encoding (str | None): Force one of
+                `pymol_remote.encoding.INDEX_ENCODINGS`. Defaults to None (the smallest).
+
+        Returns:
+            dict[str, list[int]]: The sorted (1-based) atom indices of each object in the
+                selection, which can be passed to `select_indices`.
+        """
+        indices_by_object = self._call_with_kwargs(
+            "get_selection_indices", selection, encoding
+        )
+        return {
+            object: decode_indices({**indices, "data": _unwrap_binary(indices["data"])})
+            for object, indices in indices_by_object.items()
+        }
+
+    def stream_frame(self, object: str, coords, state: int = 1) -> dict:
+        """Show a new frame of coordinates of an object, e.g. of a running simulation.
+
+        The server keeps only the newest frame of each object that is waiting to be
+        shown and drops older ones, so calling this faster than PyMOL can redraw does
+        not pile up calls on the server. Frames are sent quantized to 0.001 Angstrom,
+        as deltas to the previous frame where possible. Requires NumPy.
+
+        ```python
+        >>> for step in optimizer.run():
+        ...     session.stream_frame("ligand", step.coords)
+        >>> session.close_stream("ligand")
+        ```
+
+        Args:
+            - object (str): The name of the object to update.
+            - coords (numpy.ndarray | list): The `(n_atoms, 3)` coordinates in Angstrom,
+                in the atom order of the object.
+            - state (int): The state to update. Defaults to 1.
+
+        Returns:
+            dict: The counters of the object's stream on the server: `n_received`,
+                `n_applied` and `n_dropped` frames.
+        """
+        encoder = self._frame_encoders.get(object)
+        if encoder is None:
+            encoder = self._frame_encoders[object] = FrameEncoder()
+        seq, buffer = encoder.encode(coords)
+        stats = self._call_with_kwargs("stream_frame", object, buffer, seq, state)
+        if stats.pop("keyframe_required"):
+            # ... the server lost track of the stream (e.g. it was restarted)
+            encoder.reset()
+            seq, buffer = encoder.encode(coords)
+            stats = self._call_with_kwargs("stream_frame", object, buffer, seq, state)
+            stats.pop("keyframe_required")
+        return stats
+
+    def close_stream(self, object: str) -> None:
+        """Close the stream of an object, see `stream_frame`."""
+        self._frame_encoders.pop(object, None)
+        self._call_with_kwargs("close_stream", object)
+
+    def iter_state(
+        self,
+        selection: str = "(all)",
+        state: int = -1,
+        format: str = "pdb",
+        chunk_size: int = 1 << 20,
+    ) -> Iterator[str | bytes]:
+        """Stream the state of the PyMOL session in chunks, see `get_state`.
+
+        The state is exported once to a server-side cursor and read in chunks of at
+        most `chunk_size` bytes, so that memory use on both ends is bounded by the
+        chunk size rather than by the size of the export (e.g. of a multi-state file
+        with `state=0` or a large `.pse`):
+
+        ```python
+        >>> with open("trajectory.pdb", "w") as file:
+        ...     for chunk in session.iter_state("all", state=0, format="pdb"):
+        ...         file.write(chunk)
+        ```
+
+        Args:
+            - selection (str): The selection of atoms to export. Defaults to "(all)".
+            - state (int): The state to export. Defaults to -1 (the current state).
+            - format (str): The format to export. Defaults to "pdb".
+            - chunk_size (int): The maximum size of each chunk in bytes. Defaults to 1 MiB.
+
+        Yields:
+            str | bytes: The chunks of the export, `str` for text formats (decoded
+                incrementally, so multi-byte characters are never split) and `bytes`
+                for binary formats.
+        """
+        cursor = self._call_with_kwargs("open_state_cursor", selection, state, format)
+        decoder = codecs.getincrementaldecoder("utf-8")() if cursor["text"] else None
+        exhausted = False
+        try:
+            while not exhausted:
+                chunk = self._call_with_kwargs(
+                    "read_state_chunk", cursor["id"], chunk_size
+                )
+                chunk = _unwrap_binary(chunk)
+                exhausted = not chunk
+                if decoder is not None:
+                    chunk = decoder.decode(chunk, final=exhausted)
+                if chunk:
+                    yield chunk
+        finally:
+            if not exhausted:
+                # ... e.g. the caller stopped iterating early
+                self._call_with_kwargs("close_state_cursor", cursor["id"])
+
+    @contextlib.contextmanager
+    def suspend_updates(self) -> Iterator[None]:
+        """Suspend PyMOL's screen updates while sending a series of commands.
+
+        PyMOL then redraws (and rebuilds, if `rebuild` was called) once at the end
+        instead of after every command. The server does this by itself for commands
+        that queue up or are sent in a batch; use this when sending many commands one
+        at a time. `get_update_stats` reports how many redraws were saved.
+
+        ```python
+        >>> with session.suspend_updates():
+        ...     for chain, color in colors.items():
+        ...         session.color(color, f"chain {chain}")
+        ```
+        """
+        self._call_with_kwargs("suspend_updates")
+        try:
+            yield
+        finally:
+            self._call_with_kwargs("resume_updates")
+
+    def compression_stats(self, reset: bool = False) -> dict:
+        """Get the totals of the compressed requests and responses of this client.
+
+        Args:
+            - reset (bool): If True, reset the totals after reading them. Defaults to False.
+
+        Returns:
+            dict: The totals by `"<direction>:<codec>"`, each with the keys `n_calls`,
+                `raw_size` and `size` (in bytes), `ratio` and `cpu_time` (in seconds).
+                The CPU time is the time spent compressing requests and decompressing
+                responses on the client, see `get_compression_stats` for the server side.
+        """
+        compression_stats = self._server("transport").compression_stats
+        stats = compression_stats.summary()
+        if reset:
+            compression_stats.reset()
+        return stats
+
+    def _get_proxy(self, name: str) -> ServerProxy:
+        """Get the server proxy of the lane that `name` is sent on."""
+        return self._bulk_server if name in BULK_METHODS else self._server
+
+    def _call_with_kwargs(self, name: str, *args, **kwargs):
+        """Call a server function registered with keyword arguments."""
+        return self._call_remote(
+            name, getattr(self._get_proxy(name), name), args, kwargs
+        )
+
+    def _call_remote(self, name: str, call_proxy: Callable, args: tuple, kwargs: dict):
+        """Call `name` with `(args, kwargs)`, answering from the cache where possible."""
+        if self.cache is None or name not in CACHEABLE_METHODS:
+            return call_proxy(args, kwargs)
+
+        transport = self._get_proxy(name)("transport")
+        key = self.cache.key(f"{self.hostname}:{self.port}", name, args, kwargs)
+        entry = self.cache.get(key)
+        if entry is not None:
+            etag, generation, validated_at, response = entry
+            latest_generation = max(
+                self._server("transport").generation,
+                self._bulk_server("transport").generation,
+            )
+            if (
+                time.time() - validated_at < self.cache_max_age
+                and generation >= latest_generation
+            ):
+                self.cache.record("n_hits")
+                return copy.deepcopy(response)
+            transport._local.if_none_match = etag
+
+        try:
+            response = call_proxy(args, kwargs)
+        except ProtocolError as error:
+            if entry is None or error.errcode != 304:
+                raise
+            transport._record_generation(error.headers.get(GENERATION_HEADER))
+            self.cache.record("n_not_modified")
+            self.cache.put(key, etag, transport._local.generation, response)
+            return copy.deepcopy(response)
+        finally:
+            transport._local.if_none_match = None
+
+        self.cache.record("n_misses")
+        etag = getattr(transport._local, "etag", None)
+        if etag is not None:
+            self.cache.put(
+                key, etag, transport._local.generation, copy.deepcopy(response)
+            )
+        return response
+
+    def clear_cache(self) -> None:
+        """Remove all cached responses, e.g. after changing the session in PyMOL itself.
+
+        Changes made in PyMOL's GUI or console are not seen by the server's generation
+        counter, so cached responses are not invalidated by them.
+        """
+        if self.cache is not None:
+            self.cache.clear()
+
     def python(self, cmd: str):
         """Execute a Python command as if it were typed in the PyMOL command line,
         wrapped in pymol's python block:
@@ -182,6 +1276,114 @@ class PymolSession(object):
         wrapped_cmd = f"python\n{cmd}\npython end"
         self.do(wrapped_cmd)
 
+    def apply_preset(self, preset: dict) -> dict:
+        """Apply a style preset (colors, settings and per-element atom properties).
+
+        The preset is uploaded once and cached on the server by its content hash, after
+        which applying it again is a single small call. The server skips colors and
+        settings that already have the value of the preset, and rebuilds the
+        representations at most once.
+
+        ```python
+        >>> session.apply_preset({
+        ...     "element_properties": {"vdw": {"C": 1.7, "N": 1.55, "O": 1.52}},
+        ...     "colors": {"coral": [1.0, 0.5, 0.31]},
+        ...     "settings": {"antialias": 3, "ray_trace_mode": 1},
+        ...     "commands": [["bg_color", ["grey19"]]],
+        ... })
+        ```
+
+        Args:
+            - preset (dict): The preset, see `pymol_remote.server.upload_preset` for its
+                keys.
+
+        Returns:
+            dict: What was applied and skipped, see `pymol_remote.server.apply_preset`.
+        """
+        digest = preset_digest(preset)
+        try:
+            return self._call_with_kwargs("apply_preset", digest)
+        except Fault as fault:
+            if fault.faultCode != FAULT_UNKNOWN_PRESET:
+                raise
+        self._call_with_kwargs("upload_preset", preset)
+        return self._call_with_kwargs("apply_preset", digest)
+
+    def run_python(self, source: str):
+        """Execute Python code in PyMOL and return the value of its last expression.
+
+        ```python
+        >>> session.run_python("[cmd.count_atoms(name) for name in cmd.get_names()]")
+        [1102, 64]
+        ```
+
+        Args:
+            - source (str): The Python code to execute, with `cmd` in its globals.
+
+        Returns:
+            The value of the last statement if it is an expression, otherwise None.
+        """
+        return self._call_with_kwargs("run_python", source)
+
+    def register_procedure(
+        self, procedure: str | Callable, name: str | None = None
+    ) -> Callable:
+        """Register a Python function on the server, to run it next to PyMOL.
+
+        The source is sent and compiled once, after which the procedure is called by
+        name with only its arguments, e.g. to loop over objects or states on the server
+        instead of making one round trip per iteration. Procedures are re-registered
+        automatically if the server has been restarted.
+
+        ```python
+        >>> def count_atoms_per_state(selection):
+        ...     return [cmd.count_atoms(selection, state=state)
+        ...             for state in range(1, cmd.count_states(selection) + 1)]
+        >>> count = session.register_procedure(count_atoms_per_state)
+        >>> count("6lyz")
+        [1102]
+        ```
+
+        Args:
+            - procedure (str | Callable): The function to register, or its source. The
+                function runs on the server with `cmd` in its globals, so it must not
+                refer to other names of the client.
+            - name (str | None): The name of the procedure. Defaults to the name of the
+                function (required if `procedure` is source code).
+
+        Returns:
+            Callable: A function that calls the procedure, see `call_procedure`.
+        """
+        if callable(procedure):
+            name = default(name, procedure.__name__)
+            procedure = textwrap.dedent(inspect.getsource(procedure))
+        if name is None:
+            raise ValueError("A name is required to register source code.")
+        self._call_with_kwargs("register_procedure", name, procedure)
+        self._procedure_sources[name] = procedure
+
+        def _call_procedure(*args, **kwargs):
+            return self.call_procedure(name, *args, **kwargs)
+
+        _call_procedure.__name__ = name
+        return _call_procedure
+
+    def call_procedure(self, name: str, /, *args, **kwargs):
+        """Call a procedure registered with `register_procedure` with the given arguments."""
+        try:
+            return self._server.call_procedure((name, *args), kwargs)
+        except Fault as fault:
+            if (
+                name not in self._procedure_sources
+                or fault.faultCode != FAULT_UNKNOWN_PROCEDURE
+            ):
+                raise
+        # ... the server has been restarted since the procedure was registered
+        self._call_with_kwargs(
+            "register_procedure", name, self._procedure_sources[name]
+        )
+        return self._server.call_procedure((name, *args), kwargs)
+
     def __repr__(self):
         attrs = f"hostname={self.hostname!r}, port={self.port!r}"
         class_name = self.__class__.__name__
@@ -19,8 +19,90 @@ DEFAULT_HOST: Final[str] = (
 )
 DEFAULT_PORT: Final[int] = 9123
 DEFAULT_N_PORTS_TO_TRY: Final[int] = 5
+DEFAULT_KEEPALIVE_TIMEOUT: Final[float] = (
+    30.0  # ... seconds an idle connection is kept open
+)
+DEFAULT_EXECUTOR: Final[str] = (
+    "thread"  # ... or "gui" to run calls on PyMOL's GUI thread
+)
+DEFAULT_GUI_TIME_BUDGET: Final[float] = 0.008  # ... seconds of calls per GUI timer tick
+DEFAULT_COMPRESS_THRESHOLD: Final[int] = 1400  # ... bytes, a common MTU
+DEFAULT_MARSHAL_POOL: Final[str] = "thread"  # ... or "process" for very large payloads
+PRIORITY_INTERACTIVE: Final[int] = 0  # ... priority of regular calls (lower runs first)
+PRIORITY_BULK: Final[int] = 5  # ... priority of calls on the bulk-data lane
+PRIORITY_JOB: Final[int] = 10  # ... default priority of jobs (see `submit_job`)
+BULK_PATH: Final[str] = "/bulk"  # ... path of the bulk-data lane on the control port
+# ... fault codes that clients react to, any other error of a call has fault code 1
+FAULT_UNKNOWN_PROCEDURE: Final[int] = 2  # ... see `call_procedure`
+FAULT_UNKNOWN_PRESET: Final[int] = 3  # ... see `apply_preset`
+# ... methods that transfer large payloads and are sent on the bulk-data lane
+BULK_METHODS: Final[frozenset[str]] = frozenset(
+    {
+        "get_state",
+        "set_state",
+        "png",
+        "get_session",
+        "set_session",
+        "get_coords",
+        "get_ensemble_coords",
+        "set_coords",
+        "get_atom_table",
+        "set_atom_property",
+        "set_atom_colors",
+        "select_indices",
+        "get_selection_indices",
+        "begin_trajectory",
+        "append_frames",
+        "stream_frame",
+        "open_state_cursor",
+        "read_state_chunk",
+    }
+)
+# ... integer atom properties, which `set_atom_property` sends as int32 (float32
+#  cannot represent e.g. RGB colors `0x40RRGGBB` exactly)
+INTEGER_ATOM_FIELDS: Final[frozenset[str]] = frozenset(
+    {"resv", "index", "ID", "rank", "formal_charge", "color", "numeric_type"}
+)
+# ... float atom properties, which `set_atom_property` sends as float32 (the other
+#  properties, e.g. "resi" or "label", are strings and are sent as lists)
+FLOAT_ATOM_FIELDS: Final[frozenset[str]] = frozenset(
+    {"b", "q", "vdw", "partial_charge", "x", "y", "z"}
+)
+# ... header with the server's mutation counter, which validates cached responses
+GENERATION_HEADER: Final[str] = "X-PyMOL-Generation"
+# ... read-only methods whose responses the client may cache, see `ResponseCache`
+CACHEABLE_METHODS: Final[frozenset[str]] = frozenset(
+    {
+        "get_state",
+        "get_session",
+        "get_names",
+        "get_object_list",
+        "get_chains",
+        "get_fastastr",
+        "get_extent",
+        "get_view",
+        "count_atoms",
+        "count_states",
+        "get_coords",
+        "get_ensemble_coords",
+        "get_atom_table",
+        "get_selection_indices",
+    }
+)
 
 log_level = os.getenv("PYMOL_RPC_LOG_LEVEL", "INFO")
 pymol_rpc_host = os.getenv("PYMOL_RPC_HOST", DEFAULT_HOST)
 pymol_rpc_port = os.getenv("PYMOL_RPC_PORT", DEFAULT_PORT)
 pymol_rpc_n_ports_to_try = os.getenv("PYMOL_RPC_N_PORTS_TO_TRY", DEFAULT_N_PORTS_TO_TRY)
+pymol_rpc_keepalive_timeout = float(
+    os.getenv("PYMOL_RPC_KEEPALIVE_TIMEOUT", DEFAULT_KEEPALIVE_TIMEOUT)
+)
+pymol_rpc_executor = os.getenv("PYMOL_RPC_EXECUTOR", DEFAULT_EXECUTOR)
+pymol_rpc_gui_time_budget = float(
+    os.getenv("PYMOL_RPC_GUI_TIME_BUDGET", DEFAULT_GUI_TIME_BUDGET)
+)
+pymol_rpc_compress_threshold = int(
+    os.getenv("PYMOL_RPC_COMPRESS_THRESHOLD", DEFAULT_COMPRESS_THRESHOLD)
+)
+pymol_rpc_marshal_pool = os.getenv("PYMOL_RPC_MARSHAL_POOL", DEFAULT_MARSHAL_POOL)
+pymol_rpc_bulk_port = os.getenv("PYMOL_RPC_BULK_PORT")  # ... None: `BULK_PATH` only
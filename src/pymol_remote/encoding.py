@@ -0,0 +1,686 @@
+"""
+Encoding of the payloads sent between the client and the PyMOL RPC server.
+
+NOTE: This module is used on both sides and must not import PyMOL, so that its functions
+can be run in worker processes.
+"""
+
+from __future__ import annotations
+
+import array
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import lzma
+import math
+import struct
+import sys
+import threading
+import time
+import zlib
+from typing import NamedTuple
+from xmlrpc.client import Fault, dumps, loads
+
+try:
+    import numpy as np
+except ImportError:
+    # ... arrays are decoded into memoryviews instead
+    np = None
+
+logger = logging.getLogger("pymol-remote:encoding")
+
+# ... a preset dictionary for `x-pdb-deflate`: typical PDB (and mmCIF) records, with the
+#  most common strings last, where they are cheapest to reference
+_PDB_DICTIONARY = (
+    b"HEADER    TITLE     COMPND    SOURCE    KEYWDS    EXPDTA    AUTHOR    REVDAT    "
+    b"JRNL        REMARK   2 RESOLUTION.    ANGSTROMS.\nREMARK 465 MISSING RESIDUES\n"
+    b"SEQRES   1 A  129  LYS VAL PHE GLY ARG CYS GLU LEU ALA ALA ALA MET LYS ARG\n"
+    b"HELIX    1   1 SHEET    1   A SSBOND   1 CYS A   6    CYS A 127\n"
+    b"CRYST1   79.100   79.100   37.900  90.00  90.00  90.00 P 43 21 2     8\n"
+    b"data_\nloop_\n_atom_site.group_PDB\n_atom_site.id\n_atom_site.type_symbol\n"
+    b"_atom_site.label_atom_id\n_atom_site.label_alt_id\n_atom_site.label_comp_id\n"
+    b"_atom_site.label_asym_id\n_atom_site.label_entity_id\n_atom_site.label_seq_id\n"
+    b"_atom_site.pdbx_PDB_ins_code\n_atom_site.Cartn_x\n_atom_site.Cartn_y\n"
+    b"_atom_site.Cartn_z\n_atom_site.occupancy\n_atom_site.B_iso_or_equiv\n"
+    b"_atom_site.auth_seq_id\n_atom_site.auth_asym_id\n_atom_site.pdbx_PDB_model_num\n"
+    b"HETATM 1001  O   HOH A 201      12.345  23.456  34.567  1.00 30.00           O  \n"
+    b"HETATM 1002  C1  LIG A 301      -1.234  -2.345  -3.456  1.00 20.00           C  \n"
+    b"CONECT 1002 1003 1004\nMODEL        1\nENDMDL\nTER    1001      LEU A 129\n"
+    b"ATOM      1  N   ALA A   1      11.104   6.134  -6.504  1.00 20.00           N  \n"
+    b"ATOM      2  CA  GLY A   2      11.639   6.071  -5.147  1.00 20.00           C  \n"
+    b"ATOM      3  C   SER A   3      13.175   6.115  -5.191  1.00 20.00           C  \n"
+    b"ATOM      4  O   THR A   4      13.886   6.232  -4.188  1.00 20.00           O  \n"
+    b"ATOM      5  CB  ASP A   5      11.091   7.235  -4.332  1.00 20.00           C  \n"
+    b"ATOM      6  CG  GLU A   6      10.547   8.401  -5.103  1.00 20.00           C  \n"
+    b"ATOM      7  CD  ASN A   7       9.972   9.517  -4.248  1.00 20.00           C  \n"
+    b"ATOM      8  OG1 GLN A   8      10.710  10.517  -4.028  1.00 20.00           O  \n"
+    b"ATOM      9  CD1 ILE A   9       8.763   9.412  -3.801  1.00 20.00           C  \n"
+    b"ATOM     10  CG2 VAL A  10       9.310  10.101  -2.911  1.00 20.00           C  \n"
+    b"ATOM     11  CE  MET A  11       8.410   8.995  -1.830  1.00 20.00           C  \n"
+    b"ATOM     12  NZ  LYS A  12       7.982   9.847  -0.711  1.00 20.00           N  \n"
+    b"ATOM     13  NE2 HIS A  13       6.515  10.016   0.104  1.00 20.00           N  \n"
+    b"ATOM     14  OH  TYR A  14       5.866  11.184   0.812  1.00 20.00           O  \n"
+    b"ATOM     15  CZ  PHE A  15       4.399  11.295   1.227  1.00 20.00           C  \n"
+    b"ATOM     16  NH1 ARG A  16       3.720  12.463   1.935  1.00 20.00           N  \n"
+    b"ATOM     17  CE2 TRP A  17       2.253  12.574   2.350  1.00 20.00           C  \n"
+    b"ATOM     18  SG  CYS A  18       1.574  13.742   3.058  1.00 20.00           S  \n"
+    b"ATOM     19  CD2 LEU A  19       0.107  13.853   3.473  1.00 20.00           C  \n"
+    b"ATOM     20  CD  PRO A  20      -0.572  15.021   4.181  1.00 20.00           C  \n"
+)
+
+# ... header of packed arrays: magic, dtype (e.g. "<f4"), number of dimensions and
+#  padding to 16 bytes, followed by one uint64 per dimension. The data that follows is
+#  thus 8-byte aligned.
+_ARRAY_MAGIC = b"PMRA"
+_ARRAY_HEADER = struct.Struct("<4s4sI4x")
+
+# ... the resolution of streamed coordinates in Angstrom, see `FrameEncoder`
+STREAM_QUANTUM = 0.001
+
+# ... encodings of sets of atom indices, see `encode_indices`
+INDEX_ENCODINGS = ("uint32", "runs", "bitset")
+
+# ... content codings that can be negotiated, in order of preference
+CODECS = ("gzip", "deflate", "xz", "x-pdb-deflate")
+
+_RESPONSE_HEAD = b"<?xml version='1.0'?>\n<methodResponse>\n<params>\n<param>\n"
+_RESPONSE_TAIL = b"</param>\n</params>\n</methodResponse>\n"
+
+
+class Payload(NamedTuple):
+    """An encoded (and possibly compressed) message body."""
+
+    body: bytes
+    content_encoding: str = "identity"
+    # ... the size of the body before compression
+    raw_size: int = 0
+    # ... the CPU time in seconds spent compressing the body
+    cpu_time: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        """The compression ratio, i.e. the raw size over the compressed size."""
+        return self.raw_size / max(len(self.body), 1)
+
+
+def compress(data: bytes, codec: str | None, threshold: int | None = None) -> Payload:
+    """Compress `data` with `codec` if it is larger than `threshold` bytes.
+
+    Args:
+        - data (bytes): The data to compress.
+        - codec (str | None): The content coding to use, one of `CODECS`. None means
+            no compression.
+        - threshold (int | None): Only compress data larger than this many bytes.
+            Defaults to None (always compress).
+
+    Returns:
+        Payload: The (possibly) compressed data, its content encoding, raw size and the
+            CPU time spent compressing it.
+    """
+    if codec is None or (threshold is not None and len(data) <= threshold):
+        return Payload(data, "identity", len(data))
+
+    start = time.thread_time()
+    if codec == "gzip":
+        body = gzip.compress(data, compresslevel=1)
+    elif codec == "deflate":
+        body = zlib.compress(data, 6)
+    elif codec == "xz":
+        body = lzma.compress(data, preset=1)
+    elif codec == "x-pdb-deflate":
+        compressor = zlib.compressobj(6, zdict=_PDB_DICTIONARY)
+        body = compressor.compress(data) + compressor.flush()
+    else:
+        raise ValueError(f"Codec {codec} not supported. Please use one of {CODECS}.")
+    return Payload(body, codec, len(data), time.thread_time() - start)
+
+
+def decompress(data: bytes, content_encoding: str) -> bytes:
+    """Decompress `data` that was compressed with the content coding `content_encoding`."""
+    if content_encoding == "identity":
+        return data
+    if content_encoding == "gzip":
+        return gzip.decompress(data)
+    if content_encoding == "deflate":
+        return zlib.decompress(data)
+    if content_encoding == "xz":
+        return lzma.decompress(data, format=lzma.FORMAT_XZ)
+    if content_encoding == "x-pdb-deflate":
+        decompressor = zlib.decompressobj(zdict=_PDB_DICTIONARY)
+        return decompressor.decompress(data) + decompressor.flush()
+    raise ValueError(f"Content encoding {content_encoding} not supported.")
+
+
+def negotiate_codec(accept_encoding: str) -> str | None:
+    """Pick the first supported codec of an `Accept-Encoding` header, None if there is none.
+
+    The codecs are considered in the order in which they are listed, codecs with a
+    `q=0` parameter are ignored.
+    """
+    for item in accept_encoding.split(","):
+        codec, _, params = item.strip().partition(";")
+        codec = codec.strip().lower()
+        if codec in CODECS and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            return codec
+    return None
+
+
+class CompressionStats(object):
+    """Thread-safe totals of the compressed payloads, by direction and codec."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, direction: str, payload: Payload, cpu_time: float) -> None:
+        """Record a compressed payload sent or received in `direction`.
+
+        Args:
+            - direction (str): "request" or "response".
+            - payload (Payload): The compressed payload.
+            - cpu_time (float): The CPU time in seconds spent (de)compressing it.
+        """
+        logger.debug(
+            f"{direction} {payload.content_encoding}: {payload.raw_size} -> "
+            f"{len(payload.body)} bytes (ratio {payload.ratio:.1f}) "
+            f"in {cpu_time * 1000:.2f} ms CPU"
+        )
+        key = f"{direction}:{payload.content_encoding}"
+        with self._lock:
+            totals = self._totals.setdefault(
+                key, {"n_calls": 0, "raw_size": 0, "size": 0, "cpu_time": 0.0}
+            )
+            totals["n_calls"] += 1
+            totals["raw_size"] += payload.raw_size
+            totals["size"] += len(payload.body)
+            totals["cpu_time"] += cpu_time
+
+    def summary(self) -> dict:
+        """Get the totals as `{"<direction>:<codec>": {...}}`, including the ratio."""
+        with self._lock:
+            return {
+                key: {**totals, "ratio": totals["raw_size"] / max(totals["size"], 1)}
+                for key, totals in self._totals.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+
+
+def load_request(
+    data: bytes, content_encoding: str = "identity", use_builtin_types: bool = True
+) -> tuple[tuple, str]:
+    """Decode an XML-RPC request body into its parameters and method name."""
+    return loads(
+        decompress(data, content_encoding), use_builtin_types=use_builtin_types
+    )
+
+
+def dump_response(
+    response: tuple | Fault,
+    allow_none: bool = True,
+    encoding: str = "utf-8",
+    codec: str | None = None,
+    compress_threshold: int | None = None,
+) -> Payload:
+    """Encode the result of a call (a 1-tuple) or a fault into an XML-RPC response body.
+
+    Large `str` and `bytes` results (e.g. from `get_state`) are encoded without going
+    through the generic `xmlrpc.client.Marshaller`: strings are escaped after encoding
+    them, and bytes are base64 encoded in one go rather than line by line.
+
+    Args:
+        - response (tuple | Fault): The result of the call, wrapped in a 1-tuple, or a fault.
+        - allow_none (bool): Whether `None` may be marshalled. Defaults to True.
+        - encoding (str): The encoding of the XML document. Defaults to "utf-8".
+        - codec (str | None): The codec to compress the body with, see `compress`.
+            Defaults to None (no compression).
+        - compress_threshold (int | None): Only compress bodies larger than this many
+            bytes. Defaults to None (always compress if `codec` is set).
+
+    Returns:
+        Payload: The body, its content encoding, raw size and compression CPU time.
+    """
+    body = None
+    if not isinstance(response, Fault) and encoding.lower() in ("utf-8", "utf8"):
+        body = _dump_buffer_response(response[0])
+
+    if body is None:
+        try:
+            body = dumps(
+                response,
+                methodresponse=not isinstance(response, Fault),
+                allow_none=allow_none,
+                encoding=encoding,
+            )
+        except BaseException as exc:
+            # ... e.g. the result of the call cannot be marshalled
+            body = dumps(
+                Fault(1, f"{type(exc)}:{exc}"),
+                allow_none=allow_none,
+                encoding=encoding,
+            )
+        body = body.encode(encoding, "xmlcharrefreplace")
+
+    return compress(body, codec, compress_threshold)
+
+
+def _dump_buffer_response(value) -> bytes | None:
+    """Fast path of `dump_response` for `str` and `bytes` results, None otherwise."""
+    if isinstance(value, str):
+        try:
+            value = value.encode("utf-8")
+        except UnicodeEncodeError:
+            return None  # ... e.g. lone surrogates, let the marshaller handle them
+        # ... `&`, `<` and `>` are ASCII, so they can safely be escaped in UTF-8 bytes
+        value = value.replace(b"&", b"&amp;").replace(b"<", b"&lt;")
+        value = value.replace(b">", b"&gt;")
+        return b"".join(
+            (
+                _RESPONSE_HEAD,
+                b"<value><string>",
+                value,
+                b"</string></value>\n",
+                _RESPONSE_TAIL,
+            )
+        )
+    if isinstance(value, (bytes, bytearray)):
+        return b"".join(
+            (
+                _RESPONSE_HEAD,
+                b"<value><base64>\n",
+                base64.b64encode(value),
+                b"\n</base64></value>\n",
+                _RESPONSE_TAIL,
+            )
+        )
+    return None
+
+
+def pack_array(data, shape: tuple[int, ...], dtype: str = "<f4") -> bytes:
+    """Pack a C-contiguous buffer into a binary array with a shape header.
+
+    Args:
+        - data (bytes-like): The items of the array, e.g. `ndarray.tobytes()` or the
+            array itself.
+        - shape (tuple[int, ...]): The shape of the array, e.g. `(n_atoms, 3)`.
+        - dtype (str): The item type as a NumPy type string. Defaults to "<f4"
+            (little-endian float32).
+
+    Returns:
+        bytes: The packed array, see `unpack_array`.
+
+    Raises:
+        ValueError: If the size of `data` does not match `shape` and `dtype`.
+    """
+    shape = tuple(int(n) for n in shape)
+    data = memoryview(data).cast("B")
+    if len(data) != int(dtype[2:]) * math.prod(shape):
+        raise ValueError(
+            f"Buffer of {len(data)} bytes does not match shape {shape} of {dtype}."
+        )
+    header = _ARRAY_HEADER.pack(_ARRAY_MAGIC, dtype.encode("ascii"), len(shape))
+    return b"".join((header, struct.pack(f"<{len(shape)}Q", *shape), data))
+
+
+def encode_array(values, dtype: str = "<f4") -> bytes:
+    """Pack a NumPy array (or anything array-like) or nested lists of numbers.
+
+    Args:
+        - values (numpy.ndarray | list): The values to pack, e.g. `(n_atoms, 3)`
+            coordinates. Nested lists must be rectangular.
+        - dtype (str): The item type to pack the values as. Defaults to "<f4"
+            (little-endian float32).
+
+    Returns:
+        bytes: The packed array, see `pack_array`.
+    """
+    if np is not None:
+        values = np.ascontiguousarray(values, dtype=dtype)
+        return pack_array(values, values.shape, dtype)
+
+    shape = []
+    items = values
+    while isinstance(items, (list, tuple)):
+        shape.append(len(items))
+        items = items[0] if items else None
+    for _ in shape[1:]:
+        values = [item for sublist in values for item in sublist]
+    item_format = _MEMORYVIEW_FORMATS[dtype[1:]]
+    # ... single-byte types have no byte order ("|")
+    byte_order = "<" if dtype[0] == "|" else dtype[0]
+    data = struct.pack(f"{byte_order}{len(values)}{item_format}", *values)
+    return pack_array(data, shape, dtype)
+
+
+def unpack_array(data) -> tuple[memoryview, tuple[int, ...], str]:
+    """Split a packed array into its (zero-copy) data, shape and dtype.
+
+    Raises:
+        ValueError: If `data` is not a packed array.
+    """
+    if len(data) < _ARRAY_HEADER.size:
+        raise ValueError("Buffer is too short to be a packed array.")
+    magic, dtype, ndim = _ARRAY_HEADER.unpack_from(data)
+    if magic != _ARRAY_MAGIC:
+        raise ValueError("Buffer is not a packed array.")
+    shape = struct.unpack_from(f"<{ndim}Q", data, _ARRAY_HEADER.size)
+    offset = _ARRAY_HEADER.size + 8 * ndim
+    return memoryview(data)[offset:], shape, dtype.rstrip(b"\x00").decode("ascii")
+
+
+def decode_array(data):
+    """Decode a packed array, see `pack_array`.
+
+    Returns:
+        numpy.ndarray | memoryview: A read-only NumPy array that shares the memory of
+            `data` if NumPy is installed, otherwise a memoryview of the same shape
+            (use `.tolist()` to get nested lists).
+    """
+    buffer, shape, dtype = unpack_array(data)
+    if np is not None:
+        return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+    # ... memoryviews only support native byte order
+    item_format = _MEMORYVIEW_FORMATS[dtype[1:]]
+    if dtype[0] != {"little": "<", "big": ">"}[sys.byteorder] and dtype[0] != "|":
+        items = array.array(item_format)
+        items.frombytes(buffer)
+        items.byteswap()
+        buffer = memoryview(items)
+    buffer = buffer.cast("B").cast(item_format)
+    # ... memoryviews cannot have zeros in their shape, empty arrays stay 1-dimensional
+    return buffer.cast("B").cast(item_format, shape) if len(buffer) else buffer
+
+
+# ... NumPy type strings to `struct` formats for `decode_array` without NumPy
+_MEMORYVIEW_FORMATS = {
+    "f4": "f",
+    "f8": "d",
+    "i1": "b",
+    "u1": "B",
+    "i2": "h",
+    "u2": "H",
+    "i4": "i",
+    "u4": "I",
+    "i8": "q",
+    "u8": "Q",
+}
+
+
+def encode_table(columns: dict, dtypes: dict) -> dict:
+    """Encode columns of values as packed arrays.
+
+    Numeric columns are packed as arrays of their dtype. String columns (with dtype
+    None) are dictionary-encoded: the unique strings are sent once, in order of first
+    appearance, and the column is packed as the codes of its values.
+
+    Args:
+        - columns (dict[str, list]): The values of each column, all of the same length.
+        - dtypes (dict[str, str | None]): The dtype of each column, e.g. "<f4", or None
+            for strings.
+
+    Returns:
+        dict: The encoded table, `{"n_rows": int, "columns": {name: bytes},
+            "categories": {name: list[str]}}`, see `AtomTable`.
+    """
+    n_rows = len(next(iter(columns.values()), []))
+    table = {"n_rows": n_rows, "columns": {}, "categories": {}}
+    for name, values in columns.items():
+        dtype = dtypes[name]
+        if dtype is None:
+            codes_by_value = {}
+            values = [codes_by_value.setdefault(v, len(codes_by_value)) for v in values]
+            table["categories"][name] = list(codes_by_value)
+            n_categories = len(codes_by_value)
+            dtype = "<u1" if n_categories <= 1 << 8 else "<u2"
+            dtype = dtype if n_categories <= 1 << 16 else "<u4"
+        table["columns"][name] = encode_array(values, dtype)
+    return table
+
+
+class AtomTable(object):
+    """
+    A columnar table of per-atom properties, see `PymolSession.get_atom_table`.
+
+    Columns are accessed by name and are backed by (read-only) NumPy arrays if NumPy is
+    installed, otherwise by memoryviews. String columns are dictionary-encoded: their
+    `codes` index into their `categories`, and are only expanded to strings when the
+    column itself is accessed.
+
+    ```python
+    >>> table = session.get_atom_table("polymer", fields=["chain", "resi", "b"])
+    >>> len(table), table.fields
+    (1001, ['chain', 'resi', 'b'])
+    >>> table["b"].mean()
+    >>> table.categories["chain"], table.codes("chain")
+    ```
+    """
+
+    def __init__(self, table: dict):
+        """
+        Args:
+            - table (dict): The encoded table, see `encode_table`.
+        """
+        self.n_rows = table["n_rows"]
+        self.categories = table["categories"]
+        self._columns = {
+            name: decode_array(data) for name, data in table["columns"].items()
+        }
+
+    @property
+    def fields(self) -> list[str]:
+        return list(self._columns)
+
+    def codes(self, field: str):
+        """Get the codes of a string column (its values are `categories[field][codes]`)."""
+        if field not in self.categories:
+            raise KeyError(f"`{field}` is not a string column.")
+        return self._columns[field]
+
+    def __getitem__(self, field: str):
+        column = self._columns[field]
+        if field not in self.categories:
+            return column
+        categories = self.categories[field]
+        if np is not None:
+            return np.asarray(categories, dtype=str)[column]
+        return [categories[code] for code in column.tolist()]
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def __contains__(self, field: str) -> bool:
+        return field in self._columns
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(n_rows={self.n_rows}, fields={self.fields})"
+
+
+def encode_indices(indices, encoding: str | None = None) -> dict:
+    """Encode a set of atom indices compactly, e.g. to define a selection.
+
+    The indices are sorted and deduplicated, and then encoded as one of
+    `INDEX_ENCODINGS`:
+     - "uint32": a packed uint32 array of the indices.
+     - "runs": a packed `(n_runs, 2)` uint32 array of `(start, length)` runs of
+        consecutive indices, for contiguous ranges such as chains or residues.
+     - "bitset": a bitmap in which bit `i` (least significant bit first) is set if
+        index `i` is included, for dense scattered masks.
+
+    Args:
+        - indices (Iterable[int]): The indices to encode.
+        - encoding (str | None): The encoding to use. Defaults to None, which uses the
+            smallest one.
+
+    Returns:
+        dict: The encoded indices, `{"encoding": str, "n_indices": int, "data": bytes}`,
+            see `decode_indices`.
+    """
+    if hasattr(indices, "tolist"):
+        indices = indices.tolist()  # ... NumPy arrays
+    indices = sorted(set(indices))
+    runs = []
+    for index in indices:
+        if runs and runs[-1][0] + runs[-1][1] == index:
+            runs[-1][1] += 1
+        else:
+            runs.append([index, 1])
+
+    sizes = {
+        "uint32": 4 * len(indices),
+        "runs": 8 * len(runs),
+        "bitset": (indices[-1] >> 3) + 1 if indices else 0,
+    }
+    if encoding is None:
+        encoding = min(sizes, key=sizes.get)
+    if encoding == "uint32":
+        data = encode_array(indices, "<u4")
+    elif encoding == "runs":
+        data = encode_array(runs, "<u4")
+    elif encoding == "bitset":
+        bits = bytearray(sizes["bitset"])
+        for index in indices:
+            bits[index >> 3] |= 1 << (index & 7)
+        data = bytes(bits)
+    else:
+        raise ValueError(
+            f"Index encoding `{encoding}` not supported. Please use any of the "
+            f"following: {list(INDEX_ENCODINGS)}"
+        )
+    return {"encoding": encoding, "n_indices": len(indices), "data": data}
+
+
+def decode_indices(encoded: dict) -> list[int]:
+    """Decode indices encoded with `encode_indices` into a sorted list."""
+    encoding, data = encoded["encoding"], encoded["data"]
+    if encoding == "uint32":
+        return decode_array(data).tolist()
+    if encoding == "runs":
+        runs = decode_array(data).tolist()
+        return [
+            index for start, length in runs for index in range(start, start + length)
+        ]
+    if encoding == "bitset":
+        if np is not None:
+            bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder="little")
+            return np.flatnonzero(bits).tolist()
+        return [
+            8 * offset + bit
+            for offset, byte in enumerate(data)
+            if byte
+            for bit in range(8)
+            if byte >> bit & 1
+        ]
+    raise ValueError(f"Index encoding `{encoding}` not supported.")
+
+
+def preset_digest(preset: dict) -> str:
+    """Get the content hash of a preset, by which the server caches it.
+
+    The preset is hashed in a canonical JSON form, so that the client and the server
+    agree on the hash although XML-RPC turns e.g. tuples into lists.
+
+    Args:
+        - preset (dict): The preset, see `pymol_remote.server.upload_preset`.
+
+    Returns:
+        str: The sha256 hash of the preset.
+    """
+    canonical = json.dumps(preset, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class KeyframeRequiredError(ValueError):
+    """Raised when a delta frame cannot be decoded because its base frame is missing."""
+
+
+class FrameEncoder(object):
+    """
+    Encode consecutive frames of coordinates compactly, for `stream_frame`.
+
+    Coordinates are quantized to multiples of `quantum` (0.001 Angstrom by default).
+    A frame is sent as the difference to the previous frame, packed as int8 or int16
+    if the differences fit, and as an int32 keyframe otherwise. Since the differences
+    are taken between quantized frames, errors do not accumulate. Requires NumPy.
+    """
+
+    def __init__(self, quantum: float = STREAM_QUANTUM):
+        if np is None:
+            raise ImportError("Encoding frames requires NumPy to be installed.")
+        self.quantum = quantum
+        # ... the sequence number of the last encoded frame
+        self.seq = 0
+        self._previous = None
+
+    def encode(self, coords) -> tuple[int, bytes]:
+        """Encode the next frame.
+
+        Args:
+            - coords (numpy.ndarray | list): The `(n_atoms, 3)` coordinates in Angstrom.
+
+        Returns:
+            tuple[int, bytes]: The sequence number of the frame and the packed frame.
+        """
+        quantized = np.rint(np.asarray(coords, dtype=np.float64) / self.quantum)
+        quantized = quantized.astype("<i4")
+        data, dtype = quantized, "<i4"
+        if self._previous is not None and self._previous.shape == quantized.shape:
+            delta = quantized - self._previous
+            max_delta = int(np.abs(delta).max()) if delta.size else 0
+            for delta_dtype, limit in (("<i1", 127), ("<i2", 32767)):
+                if max_delta <= limit:
+                    data, dtype = delta.astype(delta_dtype), delta_dtype
+                    break
+        self.seq += 1
+        self._previous = quantized
+        return self.seq, pack_array(data, data.shape, dtype)
+
+    def reset(self) -> None:
+        """Send the next frame as a keyframe."""
+        self._previous = None
+
+
+class FrameDecoder(object):
+    """Decode the frames of a `FrameEncoder`. Requires NumPy."""
+
+    def __init__(self, quantum: float = STREAM_QUANTUM):
+        if np is None:
+            raise ImportError("Decoding frames requires NumPy to be installed.")
+        self.quantum = quantum
+        # ... the sequence number of the last decoded frame
+        self.seq = None
+        self._previous = None
+
+    def decode(self, seq: int, data: bytes):
+        """Decode a frame.
+
+        Args:
+            - seq (int): The sequence number of the frame.
+            - data (bytes): The packed frame.
+
+        Returns:
+            numpy.ndarray: The `(n_atoms, 3)` float32 coordinates in Angstrom.
+
+        Raises:
+            KeyframeRequiredError: If the frame is a delta to a frame that was not
+                decoded, i.e. the encoder has to send a keyframe.
+        """
+        frame = decode_array(data)
+        if frame.dtype.itemsize == 4:
+            quantized = frame.astype("<i4")
+        elif (
+            self._previous is None
+            or seq != self.seq + 1
+            or self._previous.shape != frame.shape
+        ):
+            raise KeyframeRequiredError(
+                f"Frame {seq} is a delta to frame {seq - 1}, which was not decoded."
+            )
+        else:
+            quantized = self._previous + frame
+        self.seq, self._previous = seq, quantized
+        return (quantized * self.quantum).astype(np.float32)
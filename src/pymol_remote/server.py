@@ -8,22 +8,73 @@ NOTE: All code here will be executed on the PyMol server side (where you are run
 
 from __future__ import annotations
 
+import ast
+import asyncio
+import atexit
+import functools
+import hashlib
 import inspect
+import itertools
 import logging
+import math
+import multiprocessing
+import os
+import queue
+import shutil
 import socket
 import tempfile
 import threading
-from typing import Callable
+import time
+import uuid
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from http import HTTPStatus
+from typing import Callable, NamedTuple
+from xmlrpc.client import Fault
 from xmlrpc.server import SimpleXMLRPCServer
 
 from pymol_remote.common import (
     ALL_INTERFACES,
+    BULK_PATH,
+    CACHEABLE_METHODS,
     DEFAULT_HOST,
+    FAULT_UNKNOWN_PRESET,
+    FAULT_UNKNOWN_PROCEDURE,
+    GENERATION_HEADER,
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_JOB,
     default,
+    pymol_rpc_bulk_port,
+    pymol_rpc_compress_threshold,
+    pymol_rpc_executor,
+    pymol_rpc_gui_time_budget,
     pymol_rpc_host,
+    pymol_rpc_keepalive_timeout,
+    pymol_rpc_marshal_pool,
     pymol_rpc_n_ports_to_try,
     pymol_rpc_port,
 )
+from pymol_remote.encoding import (
+    CODECS,
+    CompressionStats,
+    FrameDecoder,
+    KeyframeRequiredError,
+    decode_array,
+    decode_indices,
+    dump_response,
+    encode_indices,
+    encode_table,
+    load_request,
+    negotiate_codec,
+    pack_array,
+    preset_digest,
+)
 
 logger = logging.getLogger("pymol-remote:server")
 
@@ -35,17 +86,541 @@ except ImportError:
     #  enable extracting the docstrings of registered
     #  functions
     logger.warning("PyMOL not installed. Some functions will not be available.")
-    pass
+    pymol_api = pymol_cmd = None
 
 
 _GLOBAL_PYMOL_XMLRPC_SERVER = None
+_MAX_HTTP_HEADERS = 100
+# ... the largest request body accepted, larger requests are answered with 413
+_MAX_HTTP_BODY = 1 << 30
+_JOBS = {}
+# ... when each finished job finished, see `_expire_jobs`
+_FINISHED_JOBS = {}
+# ... seconds after which finished jobs whose result was not fetched are forgotten
+_JOB_TTL = 3600.0
+_SCRATCH_DIR = None
+# ... open cursors of `iter_state`, as `(file, path, time of the last read)`
+_STATE_CURSORS = {}
+# ... seconds after which idle cursors are closed and their scratch files removed
+_STATE_CURSOR_TTL = 600.0
+# ... cursors are read from the I/O threads and expired from the command queue
+_STATE_CURSORS_LOCK = threading.Lock()
+_TRAJECTORY_UPLOADS = {}
+# ... seconds after which uploads that received no frames are forgotten
+_TRAJECTORY_UPLOAD_TTL = 600.0
+_STREAMS = {}
+_STREAMS_LOCK = threading.Lock()
+# ... the globals of `run_python` and of procedures, like PyMOL's `python` blocks
+_PYTHON_NAMESPACE = {}
+# ... registered procedures by name, as `(sha256 of the source, function)`
+_PROCEDURES = {}
+# ... uploaded presets by their content hash, see `upload_preset`
+_PRESETS = {}
+# ... atom properties of `get_atom_table` and their dtypes (None for strings)
+_ATOM_TABLE_FIELDS = {
+    "model": None,
+    "segi": None,
+    "chain": None,
+    "resn": None,
+    "resi": None,
+    "name": None,
+    "alt": None,
+    "elem": None,
+    "type": None,
+    "text_type": None,
+    "ss": None,
+    "label": None,
+    "resv": "<i4",
+    "index": "<i4",
+    "ID": "<i4",
+    "rank": "<i4",
+    "formal_charge": "<i4",
+    "color": "<i4",
+    "numeric_type": "<i4",
+    "b": "<f4",
+    "q": "<f4",
+    "vdw": "<f4",
+    "partial_charge": "<f4",
+    "x": "<f4",
+    "y": "<f4",
+    "z": "<f4",
+}
+# ... fields returned by `get_atom_table` when none are given
+_ATOM_TABLE_DEFAULT_FIELDS = ("chain", "resi", "resn", "name", "elem", "b", "q")
+# ... fields that depend on the state, read with `iterate_state`
+_ATOM_TABLE_STATE_FIELDS = ("x", "y", "z")
+# ... fields that `alter` cannot change (the coordinates need `alter_state`)
+_READ_ONLY_ATOM_FIELDS = ("model", "index", "rank") + _ATOM_TABLE_STATE_FIELDS
+# ... the result of a cacheable call that has not changed since the client cached it
+_NOT_MODIFIED = object()
+# ... calls that only read or render the scene, before which suspended updates are
+#  flushed, and which do not change the session (see `_may_change_session`)
+_READ_METHOD_PREFIXES = (
+    "get_",
+    "count_",
+    "iterate",
+    "png",
+    "ray",
+    "draw",
+    "save",
+    "export",
+    "index",
+    "identify",
+    "open_state_cursor",
+)
+# ... calls that run arbitrary code, which may both read and change the scene
+_SCRIPT_METHODS = ("run_python", "call_procedure")
+_UPDATE_CONTROL_METHODS = (
+    "suspend_updates",
+    "resume_updates",
+    "system.multicall_kwargs",
+)
+# ... PyMOL formats that `get_state` exports in memory / through a file
+_TEXT_STATE_FORMATS = ("pdb", "cif", "mol", "sdf")
+_BINARY_STATE_FORMATS = ("png", "pkl", "pse")
+# ... PyMOL formats that `set_state` loads from memory (with `cmd.load_raw`)
+_RAW_LOAD_FORMATS = ("pdb", "pqr", "cif", "mol", "mol2", "sdf", "xyz", "mmtf")
+
+
+class _HTTPRequest(NamedTuple):
+    method: str
+    path: str
+    version: str
+    headers: dict
+    body: bytes
+
+
+class _HTTPRequestError(ValueError):
+    """An invalid request, answered with `status` before closing the connection."""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+async def _read_http_request(
+    request_line: bytes, reader: asyncio.StreamReader
+) -> _HTTPRequest:
+    """Read the headers and body of an HTTP request whose request line has been read.
+
+    Raises:
+        ValueError: If the request is malformed, or `_HTTPRequestError` if its headers
+            or body are too large.
+    """
+    method, path, version = request_line.decode("latin-1").rstrip("\r\n").split(" ")
+    headers = {}
+    while True:
+        try:
+            line = await reader.readline()
+        except ValueError:
+            # ... longer than the limit of the stream reader (64 KiB)
+            raise _HTTPRequestError(
+                HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Header line too long."
+            )
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= _MAX_HTTP_HEADERS:
+            raise _HTTPRequestError(
+                HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many headers."
+            )
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    content_length = int(headers.get("content-length", 0))
+    if content_length < 0:
+        raise ValueError(f"Invalid Content-Length {content_length}.")
+    if content_length > _MAX_HTTP_BODY:
+        raise _HTTPRequestError(
+            HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            f"Content-Length {content_length} exceeds {_MAX_HTTP_BODY} bytes.",
+        )
+    body = await reader.readexactly(content_length)
+    return _HTTPRequest(method, path, version, headers, body)
+
+
+def _may_change_session(method: str) -> bool:
+    """Whether a call may change the session, which invalidates cached responses."""
+    return method not in CACHEABLE_METHODS and not method.startswith(
+        _READ_METHOD_PREFIXES
+    )
+
+
+def _exceeds_size(obj, limit: int) -> bool:
+    """Whether the (approximate) marshalled size of `obj` exceeds `limit` elements/bytes."""
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, (str, bytes, bytearray)):
+            size += len(item)
+        elif isinstance(item, (list, tuple, dict)):
+            size += len(item)
+            if size <= limit:
+                stack.extend(item.values() if isinstance(item, dict) else item)
+        else:
+            size += 1
+        if size > limit:
+            return True
+    return False
+
+
+class _CommandQueue(Executor):
+    """
+    Executor that runs the submitted calls one at a time, by priority.
+
+    Calls with a lower priority value run first, calls of the same priority run in
+    submission order. `submit` queues calls with `PRIORITY_INTERACTIVE`, so that e.g.
+    a `get_names` jumps ahead of renders that were queued as jobs (see `submit_job`).
+
+    The queue is drained either by a dedicated worker thread (`start_worker_thread`) or
+    in batches by a Qt timer on PyMOL's main (GUI) thread (`start_gui_timer`). In the
+    latter case at most `time_budget` seconds are spent per timer tick, so that the GUI
+    stays responsive and calls do not contend with the GUI thread for PyMOL's API lock.
+
+    If given, `after_run` is called with each function that ran (or failed) and its
+    positional arguments, before the result is set on its future.
+    """
+
+    def __init__(
+        self,
+        time_budget: float = pymol_rpc_gui_time_budget,
+        after_run: Callable[[Callable, tuple], None] | None = None,
+    ):
+        self.time_budget = time_budget
+        self.after_run = after_run
+        self.mode = None
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._timer = None
+        self._thread = None
+        self._is_shut_down = False
+        self.reset_stats()
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        return self.submit_with_priority(PRIORITY_INTERACTIVE, fn, *args, **kwargs)
+
+    def submit_with_priority(
+        self, priority: int, fn: Callable, /, *args, **kwargs
+    ) -> Future:
+        """Queue a call with the given priority (lower values run first)."""
+        if self._is_shut_down:
+            raise RuntimeError("Cannot submit calls after shutdown.")
+        future = Future()
+        item = (future, fn, args, kwargs, time.monotonic())
+        self._queue.put((priority, next(self._counter), item))
+        with self._lock:
+            self._stats["max_queue_depth"] = max(
+                self._stats["max_queue_depth"], self._queue.qsize()
+            )
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        """Stop accepting calls, and stop the worker thread or GUI timer.
+
+        Args:
+            - wait (bool): Whether to wait until the worker thread has run the calls
+                that are still queued. The GUI timer does not run them after shutdown.
+            - cancel_futures (bool): Whether to cancel the calls that are still queued.
+        """
+        self._is_shut_down = True
+        if self._timer is not None:
+            self._timer.stop()
+        if cancel_futures:
+            while True:
+                try:
+                    _, _, item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+        # ... wake up the worker thread, if any, once the queued calls have run
+        self._queue.put((math.inf, next(self._counter), None))
+        if (
+            wait
+            and self._thread is not None
+            and self._thread is not threading.current_thread()
+        ):
+            self._thread.join()
+
+    def start_worker_thread(self) -> None:
+        """Drain the queue on a dedicated worker thread."""
+        self.mode = "thread"
+        self._thread = threading.Thread(
+            target=self._work, name="pymol-rpc-dispatch", daemon=True
+        )
+        self._thread.start()
+
+    def start_gui_timer(self, interval: float = 0.005) -> None:
+        """Drain the queue from a Qt timer on the calling (GUI) thread.
+
+        Args:
+            - interval (float): The interval in seconds between timer ticks.
+
+        Raises:
+            - RuntimeError: If Qt is not available, or if not called from the main thread
+                of a running Qt application.
+        """
+        try:
+            from pymol.Qt import QtCore, QtWidgets
+        except ImportError as e:
+            raise RuntimeError(f"Qt is not available: {e}")
+        if QtWidgets.QApplication.instance() is None:
+            raise RuntimeError("No Qt application is running.")
+        if threading.current_thread() is not threading.main_thread():
+            raise RuntimeError("The GUI timer must be started from the main thread.")
+
+        self.mode = "gui"
+        self._timer = QtCore.QTimer()
+        self._timer.timeout.connect(self.drain)
+        self._timer.start(max(1, int(interval * 1000)))
+
+    def drain(self, time_budget: float | None = None) -> int:
+        """Run queued calls until the queue is empty or the time budget is used up.
+
+        Args:
+            - time_budget (float | None): The maximum number of seconds to spend. At
+                least one call is run if the queue is not empty. Defaults to `time_budget`.
+
+        Returns:
+            int: The number of calls that were run.
+        """
+        deadline = time.monotonic() + default(time_budget, self.time_budget)
+        n_calls = 0
+        while True:
+            try:
+                _, _, item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            self._run(item)
+            n_calls += 1
+            if time.monotonic() >= deadline:
+                break
+
+        if n_calls:
+            with self._lock:
+                self._stats["n_batches"] += 1
+                self._stats["max_batch_size"] = max(
+                    self._stats["max_batch_size"], n_calls
+                )
+        return n_calls
+
+    def qsize(self) -> int:
+        """The number of calls waiting in the queue."""
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        """Counters of the queue, e.g. to tune the time budget."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["mode"] = self.mode
+        stats["queue_depth"] = self.qsize()
+        stats["mean_wait_time"] = (
+            stats["total_wait_time"] / stats["n_calls"] if stats["n_calls"] else 0.0
+        )
+        return stats
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {
+                "n_calls": 0,
+                "n_batches": 0,
+                "max_batch_size": 0,
+                "max_queue_depth": 0,
+                "total_wait_time": 0.0,
+                "max_wait_time": 0.0,
+                "total_run_time": 0.0,
+            }
+
+    def _work(self) -> None:
+        while True:
+            _, _, item = self._queue.get()
+            if item is None:
+                break
+            self._run(item)
+
+    def _run(self, item: tuple) -> None:
+        future, fn, args, kwargs, submitted_at = item
+        if not future.set_running_or_notify_cancel():
+            return
+
+        started_at = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            self._after_run(fn, args)
+            future.set_exception(exc)
+        else:
+            self._after_run(fn, args)
+            future.set_result(result)
+        finished_at = time.monotonic()
+
+        wait_time = started_at - submitted_at
+        with self._lock:
+            self._stats["n_calls"] += 1
+            self._stats["total_wait_time"] += wait_time
+            self._stats["max_wait_time"] = max(self._stats["max_wait_time"], wait_time)
+            self._stats["total_run_time"] += finished_at - started_at
+
+    def _after_run(self, fn: Callable, args: tuple) -> None:
+        if self.after_run is None:
+            return
+        try:
+            self.after_run(fn, args)
+        except Exception as e:
+            logger.warning(f"Error after running {fn}: {e}")
+
+
+class _UpdateSuspension(object):
+    """
+    Suspends PyMOL's screen updates and console feedback during bursts of calls.
+
+    Each call that changes the scene (e.g. `set`, `color`, `show` or `alter`) would
+    otherwise trigger a redraw, and `rebuild` a rebuild of all representations. While
+    updates are suspended, `rebuild` calls are deferred and coalesced, and a single
+    rebuild and refresh is done when the burst ends (`resume`), or before a call that
+    reads or renders the scene (`flush`).
+
+    Without PyMOL (`cmd` is None) only the bookkeeping is done.
+    """
+
+    def __init__(self, cmd=None):
+        """
+        Args:
+            - cmd (module | None): PyMOL's `cmd` module.
+        """
+        self.cmd = cmd
+        # ... None, "burst" (detected by the server) or "explicit" (`suspend_updates`)
+        self.mode = None
+        self._rebuild_pending = False
+        # ... the number of calls run since the last refresh
+        self._n_calls = 0
+        self.reset_stats()
+
+    @property
+    def suspended(self) -> bool:
+        return self.mode is not None
+
+    def suspend(self, mode: str = "burst") -> None:
+        """Suspend updates, unless they are already suspended."""
+        if self.mode is None:
+            if self.cmd is not None:
+                self.cmd.set("suspend_updates", 1)
+                self.cmd.feedback("disable", "all", "actions")
+            self._n_calls = 0
+            self._stats["n_suspensions"] += 1
+        # ... an explicit suspension is not ended by the end of a burst
+        if mode == "explicit" or self.mode is None:
+            self.mode = mode
+
+    def record_call(self) -> None:
+        """Count a call that ran while updates were suspended."""
+        self._n_calls += 1
+
+    def defer_rebuild(self) -> None:
+        self._rebuild_pending = True
+        self._stats["n_deferred_rebuilds"] += 1
+
+    def flush(self) -> None:
+        """Do the deferred rebuild and a refresh, and keep updates suspended."""
+        if self.mode is None:
+            return
+        self._refresh()
+        if self.cmd is not None:
+            self.cmd.set("suspend_updates", 1)
+
+    def resume(self) -> None:
+        """Do the deferred rebuild and a refresh, and resume updates."""
+        if self.mode is None:
+            return
+        self._refresh()
+        if self.cmd is not None:
+            self.cmd.feedback("enable", "all", "actions")
+        self.mode = None
+
+    def _refresh(self) -> None:
+        if self.cmd is not None:
+            if self._rebuild_pending:
+                self.cmd.rebuild()
+            self.cmd.set("suspend_updates", 0)
+            self.cmd.refresh()
+        if self._rebuild_pending:
+            self._stats["n_rebuilds"] += 1
+        self._stats["n_refreshes"] += 1
+        self._stats["n_saved_redraws"] += max(self._n_calls - 1, 0)
+        self._rebuild_pending = False
+        self._n_calls = 0
+
+    def stats(self) -> dict:
+        """Counters of the suspensions, e.g. the number of redraws that were saved."""
+        return dict(self._stats, mode=self.mode)
+
+    def reset_stats(self) -> None:
+        self._stats = {
+            "n_suspensions": 0,
+            "n_refreshes": 0,
+            "n_saved_redraws": 0,
+            "n_deferred_rebuilds": 0,
+            "n_rebuilds": 0,
+        }
 
 
 class PymolXMLRPCServer(SimpleXMLRPCServer):
+    """
+    XML-RPC server for PyMOL with a non-blocking I/O core.
+
+    Sockets are read and written concurrently on an asyncio event loop, with persistent
+    HTTP/1.1 (keep-alive) connections that are closed after `keepalive_timeout` seconds
+    of inactivity. Large requests are parsed and responses marshalled on a thread pool,
+    and only the dispatch of the call itself (i.e. the PyMOL command) is serialized on a
+    command queue. A client pulling a large response through a slow connection therefore
+    does not stall other clients. Small payloads are marshalled directly on the event
+    loop.
+
+    The command queue is drained by a dedicated thread (`executor="thread"`) or in
+    batches on PyMOL's GUI thread (`executor="gui"`), see `_CommandQueue`. Large payloads
+    are marshalled and compressed on a pool of `n_marshal_workers` threads
+    (`marshal_pool="thread"`) or processes (`marshal_pool="process"`), which keeps the
+    GIL-bound XML encoding of very large responses away from the event loop.
+
+    Requests are served on two lanes: bulk-data transfers on `BULK_PATH` (or on the
+    optional `bulk_port` listener) and everything else on the control lane. Each lane
+    has its own connections and marshal pool, and control-lane calls jump ahead of
+    queued bulk-lane calls, so a large `set_state` upload does not delay `is_alive`.
+
+    When at least `burst_size` calls are waiting in the command queue (or sent in one
+    batch), PyMOL's updates are suspended until the queue has been drained, see
+    `_UpdateSuspension`.
+
+    Every queued call that may change the session (including jobs and the application
+    of streamed frames, but not calls that only read it, see `_may_change_session`)
+    increments the `generation` counter, which is sent in the `GENERATION_HEADER` (and
+    as the `ETag`) of each response. A request for a cacheable method whose
+    `If-None-Match` header matches the current `ETag` is answered with
+    `304 Not Modified`, without running the call. Note that changes made in PyMOL's
+    GUI or console do not increment the counter.
+    """
+
+    rpc_paths = ("/", "/RPC2", BULK_PATH)
+    # ... compress responses larger than this, with the first codec the client accepts
+    encode_threshold = pymol_rpc_compress_threshold
+    # ... payloads smaller than this are marshalled directly on the event loop, as the
+    #  hand-off to the thread pool would cost more than the marshalling itself
+    inline_marshal_threshold = 64 * 1024
+    # ... suspend PyMOL's updates when this many calls are queued (or batched)
+    burst_size = 4
+
     def __init__(
         self,
         hostname: str,
         port: int,
+        keepalive_timeout: float = pymol_rpc_keepalive_timeout,
+        n_marshal_workers: int = 4,
+        marshal_pool: str = "thread",
+        executor: str = "thread",
+        time_budget: float = pymol_rpc_gui_time_budget,
+        bulk_port: int | None = None,
     ):
         super().__init__(
             addr=(hostname, port),
@@ -53,14 +628,332 @@ class PymolXMLRPCServer(SimpleXMLRPCServer):
             allow_none=True,
             use_builtin_types=True,
         )
+        self.bulk_socket = None
+        if bulk_port is not None:
+            try:
+                self.bulk_socket = socket.create_server((hostname, bulk_port))
+            except OSError:
+                super().server_close()
+                raise
+        self.keepalive_timeout = keepalive_timeout
+        self.compression_stats = CompressionStats()
+        # ... names of the functions that follow the `(args, kwargs)` calling convention
+        self._kwargs_functions = set()
+        # ... names of the functions that are called directly instead of being queued
+        self._unqueued_functions = set()
+
+        if executor not in ("thread", "gui"):
+            raise ValueError(
+                f"Executor {executor} not supported. Please use `thread` or `gui`."
+            )
+        self._command_queue = _CommandQueue(
+            time_budget=time_budget, after_run=self._after_queued_call
+        )
+        self.updates = _UpdateSuspension(pymol_cmd)
+        # ... the number of calls that may have changed the session
+        self.generation = 0
+        # ... distinguishes the generations of this server from those of a restarted one
+        self._instance_id = uuid.uuid4().hex[:12]
+        if executor == "gui":
+            try:
+                self._command_queue.start_gui_timer()
+            except RuntimeError as e:
+                print(f"Warning: Cannot run calls on the GUI thread ({e}).")
+                executor = "thread"
+        if executor == "thread":
+            self._command_queue.start_worker_thread()
+        if marshal_pool == "process":
+            # ... `spawn` rather than forking the PyMOL (GUI) process
+            self._marshal_executor = ProcessPoolExecutor(
+                max_workers=n_marshal_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        elif marshal_pool == "thread":
+            self._marshal_executor = ThreadPoolExecutor(
+                max_workers=n_marshal_workers, thread_name_prefix="pymol-rpc-marshal"
+            )
+        else:
+            raise ValueError(
+                f"Marshal pool {marshal_pool} not supported. "
+                "Please use `thread` or `process`."
+            )
+        # ... the (rare) large control-lane payloads never wait behind bulk transfers
+        self._control_marshal_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="pymol-rpc-control-marshal"
+        )
+        self._loop = None
+        self._stop_serving = None
+        self._connections = set()
+        self._shutdown_request = threading.Event()
+        self._is_shut_down = threading.Event()
+        self._is_shut_down.set()
+
+    def serve_forever(self, poll_interval: float = 0.5) -> None:
+        """Serve requests on the event loop until `shutdown` is called.
+
+        Args:
+            - poll_interval (float, optional): The interval in seconds at which the
+                shutdown request is checked, in addition to being woken up by
+                `shutdown`. Defaults to 0.5.
+        """
+        self._is_shut_down.clear()
+        try:
+            asyncio.run(self._serve(poll_interval))
+        finally:
+            self._loop = None
+            # ... the server can be served again after `shutdown`
+            self._shutdown_request.clear()
+            self._is_shut_down.set()
+
+    def shutdown(self) -> None:
+        """Stop `serve_forever` and wait until it has returned."""
+        self._shutdown_request.set()
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._stop_serving.set)
+            except RuntimeError:
+                pass  # ... the loop has already been closed
+        self._is_shut_down.wait()
+
+    @property
+    def bulk_port(self) -> int | None:
+        """The port of the bulk-data listener, None if there is none."""
+        if self.bulk_socket is None:
+            return None
+        return self.bulk_socket.getsockname()[1]
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.bulk_socket is not None:
+            self.bulk_socket.close()
+        self._command_queue.shutdown(wait=False)
+        self._marshal_executor.shutdown(wait=False)
+        self._control_marshal_executor.shutdown(wait=False)
+
+    async def _serve(self, poll_interval: float) -> None:
+        self._stop_serving = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if self._shutdown_request.is_set():
+            return
+
+        # ... closing the asyncio servers closes their sockets, serve duplicates so
+        #  that the listeners stay open until `server_close`
+        servers = [
+            await asyncio.start_server(self._handle_connection, sock=self.socket.dup())
+        ]
+        if self.bulk_socket is not None:
+            servers.append(
+                await asyncio.start_server(
+                    functools.partial(self._handle_connection, lane="bulk"),
+                    sock=self.bulk_socket.dup(),
+                )
+            )
+        try:
+            while not self._shutdown_request.is_set():
+                try:
+                    await asyncio.wait_for(self._stop_serving.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for server in servers:
+                server.close()
+            # ... idle keep-alive connections would otherwise outlive the server
+            for writer in list(self._connections):
+                writer.close()
+
+    async def _handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        lane: str = "control",
+    ) -> None:
+        """Serve the requests of a single (persistent) connection.
+
+        Connections to the bulk-data listener serve all their requests on the `"bulk"`
+        lane, connections to the main listener serve requests on `BULK_PATH` on the
+        `"bulk"` lane and all others on the `"control"` lane.
+        """
+        self._connections.add(writer)
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(
+                        reader.readline(), self.keepalive_timeout
+                    )
+                    if not request_line:
+                        break
+                    request = await _read_http_request(request_line, reader)
+                except ValueError as e:
+                    # ... e.g. a request line longer than the limit of the stream reader
+                    status = (
+                        e.status
+                        if isinstance(e, _HTTPRequestError)
+                        else HTTPStatus.BAD_REQUEST
+                    )
+                    await self._send_response(
+                        writer, status, {"Connection": "close"}, b""
+                    )
+                    break
+
+                keep_alive = (
+                    request.version == "HTTP/1.1"
+                    and request.headers.get("connection", "").lower() != "close"
+                )
+                request_lane = "bulk" if request.path == BULK_PATH else lane
+                status, headers, body = await self._handle_request(
+                    request, request_lane
+                )
+                if not keep_alive:
+                    headers["Connection"] = "close"
+                await self._send_response(writer, status, headers, body)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass  # ... idle timeout, or the client went away
+        except asyncio.CancelledError:
+            pass  # ... the server is shutting down
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _send_response(
+        self, writer: asyncio.StreamWriter, status: int, headers: dict, body: bytes
+    ) -> None:
+        status = HTTPStatus(status)
+        head = f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        headers["Content-Length"] = str(len(body))
+        head += "".join(f"{key}: {value}\r\n" for key, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        # ... yields to other connections while the response is being written
+        await writer.drain()
+
+    async def _handle_request(
+        self, request: _HTTPRequest, lane: str = "control"
+    ) -> tuple[int, dict, bytes]:
+        """Handle an XML-RPC request and return the status, headers and body to send.
+
+        Requests on the `"bulk"` lane are marshalled on the marshal pool and queued
+        behind the control-lane calls, so that transferring large payloads (e.g. for
+        `get_state` or `set_state`) does not hold up small, interactive calls.
+        """
+        if request.method != "POST":
+            return HTTPStatus.NOT_IMPLEMENTED, {}, b""
+        if self.rpc_paths and request.path not in self.rpc_paths:
+            return HTTPStatus.NOT_FOUND, {"Content-Type": "text/plain"}, b"No such page"
+
+        loop = asyncio.get_running_loop()
+        if lane == "bulk":
+            marshal_executor, priority = self._marshal_executor, PRIORITY_BULK
+        else:
+            marshal_executor = self._control_marshal_executor
+            priority = PRIORITY_INTERACTIVE
+        encoding = request.headers.get("content-encoding", "identity").lower()
+        if encoding not in ("identity", *CODECS):
+            return HTTPStatus.NOT_IMPLEMENTED, {}, b""
+        try:
+            load_args = (request.body, encoding, self.use_builtin_types)
+            if len(request.body) > self.inline_marshal_threshold:
+                params, method = await loop.run_in_executor(
+                    marshal_executor, load_request, *load_args
+                )
+            else:
+                params, method = load_request(*load_args)
+        except Exception as e:
+            logger.debug(f"Failed to parse request: {e}")
+            return HTTPStatus.BAD_REQUEST, {}, b""
+
+        # ... only the call itself is serialized, unless it does not touch PyMOL
+        generation = self.generation
+        if method in self._unqueued_functions:
+            future = loop.run_in_executor(None, self._dispatch, method, params)
+        else:
+            future = asyncio.wrap_future(
+                self._command_queue.submit_with_priority(
+                    priority,
+                    self._dispatch_queued,
+                    method,
+                    params,
+                    request.headers.get("if-none-match"),
+                )
+            )
+        try:
+            result = await future
+            if method not in self._unqueued_functions:
+                generation, result = result
+            if result is _NOT_MODIFIED:
+                headers = {
+                    GENERATION_HEADER: str(generation),
+                    "ETag": self._etag(generation),
+                }
+                return HTTPStatus.NOT_MODIFIED, headers, b""
+            response = (result,)
+        except Fault as fault:
+            response = fault
+            generation = self.generation
+        except BaseException as exc:
+            response = Fault(1, f"{type(exc)}:{exc}")
+            generation = self.generation
+
+        dump_args = (
+            response,
+            self.allow_none,
+            self.encoding,
+            negotiate_codec(request.headers.get("accept-encoding", "")),
+            self.encode_threshold,
+        )
+        # ... the command queue is free again, marshalling (and compressing) large
+        #  responses happens on the marshal pool
+        if _exceeds_size(response, self.inline_marshal_threshold):
+            payload = await loop.run_in_executor(
+                marshal_executor, dump_response, *dump_args
+            )
+        else:
+            payload = dump_response(*dump_args)
+        # ... advertises the codecs that requests may be compressed with (RFC 7694)
+        headers = {
+            "Content-Type": "text/xml",
+            "Accept-Encoding": ", ".join(CODECS),
+            GENERATION_HEADER: str(generation),
+            "ETag": self._etag(generation),
+        }
+        if payload.content_encoding != "identity":
+            headers["Content-Encoding"] = payload.content_encoding
+            self.compression_stats.record("response", payload, payload.cpu_time)
+        return HTTPStatus.OK, headers, payload.body
+
+    def register_function(
+        self, function: Callable = None, name: str = None, queued: bool = True
+    ):
+        """
+        Register a function with the server.
 
-    def register_function_with_kwargs(self, func: Callable, name: str = None):
+        Args:
+            - function: The function to register.
+            - name (str, optional): The name to register the function under. If None, uses the function's name.
+            - queued (bool, optional): If False, the function is called directly on a thread
+                pool instead of being queued with the PyMOL commands. Use this for functions
+                that do not call PyMOL and must answer while PyMOL is busy. Defaults to True.
+        """
+        if not queued:
+            self._unqueued_functions.add(default(name, function.__name__))
+        return super().register_function(function, name)
+
+    def register_function_with_kwargs(
+        self, func: Callable, name: str = None, queued: bool = True
+    ):
         """
         Register a function with the server while enabling keyword arguments.
 
         Args:
             - func: The function to register.
             name (str, optional): The name to register the function under. If None, uses the function's name.
+            queued (bool, optional): If False, the function is called directly instead of being
+                queued with the PyMOL commands (see `register_function`). Defaults to True.
 
         Reference:
             - https://stackoverflow.com/questions/119802/using-kwargs-with-simplexmlrpcserver-in-python
@@ -73,7 +966,111 @@ class PymolXMLRPCServer(SimpleXMLRPCServer):
         _function.__name__ = func.__name__
         _function.__doc__ = func.__doc__
         _function.__signature__ = inspect.signature(func)
-        super().register_function(_function, default(name, func.__name__))
+        name = default(name, func.__name__)
+        self.register_function(_function, name, queued=queued)
+        self._kwargs_functions.add(name)
+
+    def register_multicall_functions(self):
+        """
+        Register the `system.multicall` method as well as its keyword-argument aware
+        counterpart `system.multicall_kwargs`.
+        """
+        super().register_multicall_functions()
+        self.funcs["system.multicall_kwargs"] = self.system_multicall_kwargs
+
+    def system_multicall_kwargs(self, call_list: list) -> list:
+        """
+        Execute several calls in a single request, honouring keyword arguments.
+
+        This is the counterpart of `system.multicall` for the `(args, kwargs)` calling
+        convention of `register_function_with_kwargs`. Calls are executed in order and
+        the results are returned positionally: `[result]` for a successful call and a
+        fault struct for a failed one, exactly as `system.multicall` does.
+
+        Args:
+            - call_list (list): A list of structs of the form
+                `{"methodName": str, "args": list, "kwargs": dict}`. `args` and `kwargs`
+                are optional.
+
+        Returns:
+            list: One entry per call, either `[result]` or
+                `{"faultCode": int, "faultString": str}`.
+        """
+        results = []
+        for call in call_list:
+            try:
+                result = self._dispatch_with_kwargs(
+                    call["methodName"], call.get("args", []), call.get("kwargs", {})
+                )
+                results.append([result])
+            except Fault as fault:
+                results.append(
+                    {"faultCode": fault.faultCode, "faultString": fault.faultString}
+                )
+            except BaseException as exc:
+                results.append({"faultCode": 1, "faultString": f"{type(exc)}:{exc}"})
+        return results
+
+    def _etag(self, generation: int) -> str:
+        """The entity tag of all responses at a generation of this server."""
+        return f'"{self._instance_id}-{generation}"'
+
+    def _dispatch_queued(
+        self, method: str, params: tuple, if_none_match: str | None = None
+    ) -> tuple:
+        """Dispatch a call from the command queue, suspending updates during bursts.
+
+        Returns:
+            tuple: The generation after the call and its result, which is `_NOT_MODIFIED`
+                if the method is cacheable and `if_none_match` is the current generation.
+        """
+        cacheable = method in CACHEABLE_METHODS
+        if cacheable and if_none_match == self._etag(self.generation):
+            return self.generation, _NOT_MODIFIED
+
+        n_calls = 1 + self._command_queue.qsize()
+        if method == "system.multicall_kwargs":
+            n_calls += len(params[0]) - 1
+        if n_calls >= self.burst_size:
+            self.updates.suspend("burst")
+        try:
+            result = self._dispatch(method, params)
+        finally:
+            if _may_change_session(method):
+                self.generation += 1
+        return self.generation, result
+
+    def _after_queued_call(self, fn: Callable, args: tuple) -> None:
+        """Count a call from the command queue, and end the burst it was part of."""
+        # ... `_dispatch_queued` counts its own calls, jobs are counted by their method
+        if fn == self._dispatch_with_kwargs:
+            if _may_change_session(args[0]):
+                self.generation += 1
+        elif fn != self._dispatch_queued:
+            self.generation += 1
+        # ... the burst has ended once the queue is empty, whatever call ran last
+        if self.updates.mode == "burst" and not self._command_queue.qsize():
+            self.updates.resume()
+
+    def _dispatch(self, method: str, params: tuple):
+        # ... unqueued functions do not touch PyMOL and run outside the command queue
+        if self.updates.suspended and method not in self._unqueued_functions:
+            if method == "rebuild":
+                self.updates.defer_rebuild()
+                return None
+            if method.startswith(_READ_METHOD_PREFIXES) or method in _SCRIPT_METHODS:
+                self.updates.flush()
+            elif method not in _UPDATE_CONTROL_METHODS:
+                self.updates.record_call()
+        return super()._dispatch(method, params)
+
+    def _dispatch_with_kwargs(self, method: str, args: list, kwargs: dict):
+        """Dispatch a call with positional and keyword arguments to `method`."""
+        if method in self._kwargs_functions:
+            return self._dispatch(method, (list(args), dict(kwargs)))
+        if kwargs:
+            raise TypeError(f"Method `{method}` does not accept keyword arguments.")
+        return self._dispatch(method, tuple(args))
 
 
 def _get_local_ip() -> str:
@@ -140,6 +1137,8 @@ def get_state(
             thus ignored).
         - format (str, optional): The format of the file to save. Defaults to "pdb".
             Supported formats: "pdb", "sdf", "mol", "png", "cif", "pkl", "pse"
+            Text formats are exported in memory, binary formats are written to a
+            scratch file on tmpfs (if available) and read back.
 
     Returns:
         str | bytes: The PDB string or binary file content.
@@ -147,36 +1146,73 @@ def get_state(
     References:
      - https://pymolwiki.org/index.php/Save
     """
-    _ALLOWED_TEXT_FORMATS = ("pdb", "cif", "mol", "sdf")
-    _ALLOWED_BINARY_FORMATS = ("png", "pkl", "pse")
-    if format not in _ALLOWED_TEXT_FORMATS + _ALLOWED_BINARY_FORMATS:
-        raise ValueError(
-            f"Format {format} not supported. Please use one of the following: {_ALLOWED_TEXT_FORMATS + _ALLOWED_BINARY_FORMATS}"
-        )
+    _check_state_format(format)
 
-    # Create a temporary file to write to
-    # (pymol does not appear to support writing to in-memory buffers)
-    with tempfile.NamedTemporaryFile(delete=True, suffix=f".{format}") as temp_pdb_file:
-        pymol_cmd.save(temp_pdb_file.name, selection, state, format)
+    if format in _TEXT_STATE_FORMATS and hasattr(pymol_cmd, "get_str"):
+        # ... exported in memory, without a round trip through the file system
+        return pymol_cmd.get_str(format, selection, state)
 
-        if format in _ALLOWED_TEXT_FORMATS:
-            with open(temp_pdb_file.name, "r") as file:
+    # Binary formats (and text formats on PyMOL versions without `get_str`) can only
+    #  be written to a file, use the (tmpfs) scratch directory if possible
+    try:
+        scratch_dir = _get_scratch_dir()
+    except OSError:
+        scratch_dir = None  # ... fall back to the default temporary directory
+    with tempfile.NamedTemporaryFile(
+        delete=True, suffix=f".{format}", dir=scratch_dir
+    ) as temp_file:
+        pymol_cmd.save(temp_file.name, selection, state, format)
+
+        if format in _TEXT_STATE_FORMATS:
+            with open(temp_file.name, "r") as file:
                 buffer = file.read()
         else:
-            with open(temp_pdb_file.name, "rb") as file:
+            with open(temp_file.name, "rb") as file:
                 buffer = file.read()
     return buffer
 
 
+def _check_state_format(format: str) -> None:
+    _ALLOWED_FORMATS = _TEXT_STATE_FORMATS + _BINARY_STATE_FORMATS
+    if format not in _ALLOWED_FORMATS:
+        raise ValueError(
+            f"Format {format} not supported. Please use one of the following: {_ALLOWED_FORMATS}"
+        )
+
+
+def _get_scratch_dir() -> str:
+    """
+    Get the scratch directory for files that PyMOL can only read or write on disk.
+
+    The directory is created on first use, on tmpfs (`/dev/shm`) where available so
+    that the files never touch the disk (or a network-mounted `/tmp`), and is removed
+    when the process exits.
+
+    Raises:
+        OSError: If the directory cannot be created.
+    """
+    global _SCRATCH_DIR
+    if _SCRATCH_DIR is None:
+        parent = "/dev/shm" if os.access("/dev/shm", os.W_OK) else None
+        _SCRATCH_DIR = tempfile.mkdtemp(prefix="pymol-remote-", dir=parent)
+        atexit.register(shutil.rmtree, _SCRATCH_DIR, ignore_errors=True)
+    return _SCRATCH_DIR
+
+
 def set_state(
     buffer: str | bytes, object: str = "", state: int = 0, format: str = "pse"
-) -> None:
+) -> str:
     """Set the state of the PyMOL session using the provided buffer.
 
     This function sets the state of the PyMOL session using the provided buffer,
     which contains the state information in the appropriate format (e.g. pse bytes or
     pdb string).
 
+    Buffers in formats that PyMOL can load from memory (see `_RAW_LOAD_FORMATS`) are
+    handed to `cmd.load_raw` directly. All other formats, or buffers that `load_raw`
+    rejects, are written to a scratch file (on tmpfs, if available) and loaded from
+    there.
+
     Args:
         - buffer (str | bytes): The buffer containing the state information to load.
         - object (str, optional): The name of the object to load the state into.
@@ -187,25 +1223,1066 @@ def set_state(
             Supports all PyMOL supported formats: https://pymolwiki.org/index.php/Load
 
     Returns:
-        None
+        str: How the buffer was loaded, "memory" or "file".
 
     References:
      - https://pymolwiki.org/index.php/Load
+     - https://pymolwiki.org/index.php/Load_Raw
     """
-    # Create a temporary file to write to
-    # (pymol does not appear to support loading from in-memory buffers)
-    with tempfile.NamedTemporaryFile(delete=True, suffix=f".{format}") as temp_pdb_file:
+    if not isinstance(buffer, (str, bytes)):
+        raise ValueError(
+            f"Invalid buffer type: {type(buffer)}. Must be `str` or `bytes`."
+        )
+
+    if format in _RAW_LOAD_FORMATS and hasattr(pymol_cmd, "load_raw"):
+        try:
+            pymol_cmd.load_raw(buffer, format, object, state)
+        except Exception as e:
+            logger.debug(f"Failed to load {format} from memory, using a file: {e}")
+        else:
+            return "memory"
+
+    try:
+        scratch_dir = _get_scratch_dir()
+    except OSError:
+        scratch_dir = None  # ... fall back to the default temporary directory
+    with tempfile.NamedTemporaryFile(
+        delete=True, suffix=f".{format}", dir=scratch_dir
+    ) as temp_file:
         if isinstance(buffer, str):
-            with open(temp_pdb_file.name, "w") as file:
-                file.write(buffer)
-        elif isinstance(buffer, bytes):
-            with open(temp_pdb_file.name, "wb") as file:
+            with open(temp_file.name, "w") as file:
                 file.write(buffer)
         else:
+            with open(temp_file.name, "wb") as file:
+                file.write(buffer)
+        pymol_cmd.load(temp_file.name, object, state, format)
+    return "file"
+
+
+def get_coords(selection: str = "all", state: int = 1) -> bytes:
+    """Get the coordinates of a selection as a packed float32 array.
+
+    Unlike `cmd.get_coords` (which returns a NumPy array that cannot be sent over
+    XML-RPC), the coordinates are returned as a packed little-endian float32 buffer
+    with a shape header, see `pymol_remote.encoding.pack_array`. The client decodes
+    it with `pymol_remote.encoding.decode_array`.
+
+    Args:
+        - selection (str, optional): The selection of atoms. Defaults to "all".
+        - state (int, optional): The state to get the coordinates of. Defaults to 1,
+            -1 means the current state.
+
+    Returns:
+        bytes: The packed `(n_atoms, 3)` array of coordinates in Angstrom.
+
+    References:
+     - https://pymolwiki.org/index.php/Get_Coords
+    """
+    coords = pymol_cmd.get_coords(selection, state)
+    if coords is None:
+        # ... e.g. an empty selection
+        return pack_array(b"", (0, 3))
+    return pack_array(coords.astype("<f4", copy=False), coords.shape)
+
+
+def get_ensemble_coords(
+    selection: str = "all", start: int = 1, stop: int | None = None, step: int = 1
+) -> bytes:
+    """Get the coordinates of a selection in several states as one packed float32 array.
+
+    Args:
+        - selection (str, optional): The selection of atoms. Defaults to "all".
+        - start (int, optional): The first state (1-based). Defaults to 1.
+        - stop (int | None, optional): The last state, inclusive. Defaults to None (the
+            last state of the selection).
+        - step (int, optional): The stride between states. Defaults to 1.
+
+    Returns:
+        bytes: The packed `(n_states, n_atoms, 3)` array of coordinates in Angstrom,
+            see `get_coords`.
+
+    Raises:
+        ValueError: If `start` or `step` is smaller than 1, or if the selection does not
+            have coordinates for all of its atoms in one of the states.
+    """
+    if start < 1 or step < 1:
+        raise ValueError(f"`start` and `step` must be at least 1, got {start}, {step}.")
+    n_states = pymol_cmd.count_states(selection)
+    stop = n_states if stop is None else min(stop, n_states)
+    states = range(start, stop + 1, step)
+    n_atoms = pymol_cmd.count_atoms(selection)
+
+    if len(states) == n_states:
+        # ... all states at once
+        coords = pymol_cmd.get_coords(selection, 0)
+        blocks = [] if coords is None else [coords.astype("<f4", copy=False)]
+        n_coords = 0 if coords is None else len(coords)
+        if n_coords != n_states * n_atoms:
+            raise ValueError(
+                f"Selection `{selection}` does not have coordinates for all of its "
+                f"{n_atoms} atoms in all {n_states} states."
+            )
+    else:
+        blocks = []
+        for state in states:
+            coords = pymol_cmd.get_coords(selection, state)
+            if coords is None or len(coords) != n_atoms:
+                raise ValueError(
+                    f"Selection `{selection}` does not have coordinates for all of its "
+                    f"{n_atoms} atoms in state {state}."
+                )
+            blocks.append(coords.astype("<f4", copy=False))
+    return pack_array(b"".join(blocks), (len(states), n_atoms, 3))
+
+
+def get_atom_table(
+    selection: str = "all",
+    fields: list[str] | None = None,
+    state: int = -1,
+) -> dict:
+    """Get per-atom properties of a selection as a columnar table of packed arrays.
+
+    Numeric properties are packed as int32 or float32 arrays, and string properties
+    are dictionary-encoded (see `pymol_remote.encoding.encode_table`). The client
+    decodes the table into an `AtomTable`.
+
+    Args:
+        - selection (str, optional): The selection of atoms. Defaults to "all".
+        - fields (list[str], optional): The properties to get, any of the keys of
+            `_ATOM_TABLE_FIELDS` (the properties available in `iterate`, plus the
+            coordinates `x`, `y` and `z`). Defaults to chain, resi, resn, name, elem,
+            b and q.
+        - state (int, optional): The state of the coordinates (only used for `x`, `y`
+            and `z`). Defaults to -1 (the current state).
+
+    Returns:
+        dict: The encoded table, with one row per atom in the order of the selection.
+
+    References:
+     - https://pymolwiki.org/index.php/Iterate
+    """
+    fields = list(default(fields, _ATOM_TABLE_DEFAULT_FIELDS))
+    if not fields:
+        raise ValueError("Please request at least one field.")
+    unknown_fields = [field for field in fields if field not in _ATOM_TABLE_FIELDS]
+    if unknown_fields:
+        raise ValueError(
+            f"Fields {unknown_fields} not supported. Please use any of the following: "
+            f"{list(_ATOM_TABLE_FIELDS)}"
+        )
+
+    rows = []
+    expression = f"_append(({', '.join(fields)},))"
+    if any(field in _ATOM_TABLE_STATE_FIELDS for field in fields):
+        pymol_cmd.iterate_state(
+            state, selection, expression, space={"_append": rows.append}
+        )
+    else:
+        pymol_cmd.iterate(selection, expression, space={"_append": rows.append})
+    columns = dict(zip(fields, map(list, zip(*rows)))) if rows else {}
+    return encode_table(
+        {field: columns.get(field, []) for field in fields},
+        {field: _ATOM_TABLE_FIELDS[field] for field in fields},
+    )
+
+
+def set_coords(selection: str, buffer: bytes, state: int = 1) -> int:
+    """Update the coordinates of a selection in place from a packed array.
+
+    The atoms keep their topology and representations (unlike reloading them with
+    `set_state`), which makes it cheap to e.g. follow the steps of an optimizer.
+
+    Args:
+        - selection (str): The selection of atoms to update.
+        - buffer (bytes): The packed `(n_atoms, 3)` array of coordinates in Angstrom,
+            see `pymol_remote.encoding.encode_array`. The atoms are updated in the order
+            of the selection.
+        - state (int, optional): The state to update. Defaults to 1, -1 means the
+            current state.
+
+    Returns:
+        int: The number of atoms that were updated.
+
+    References:
+     - https://pymolwiki.org/index.php/Load_Coords
+    """
+    coords = decode_array(buffer)
+    if len(coords.shape) != 2 or coords.shape[1] != 3:
+        raise ValueError(
+            f"Coordinates must have shape (n_atoms, 3), got {coords.shape}."
+        )
+    if isinstance(coords, memoryview):
+        coords = coords.tolist()  # ... NumPy is not installed
+    pymol_cmd.load_coords(coords, selection, state)
+    return len(coords)
+
+
+def set_atom_property(
+    selection: str,
+    field: str,
+    values: bytes | list | dict,
+    key_field: str = "elem",
+    rebuild: bool = True,
+) -> int:
+    """Set a property of all atoms in a selection in a single pass.
+
+    Replaces one `alter` call per value (e.g. per element) with a single `alter` over
+    the selection, followed by a single `rebuild`.
+
+    ```python
+    >>> session.set_atom_property("all", "b", per_atom_scores)
+    >>> session.set_atom_property("all", "vdw", {"C": 1.7, "N": 1.55, "O": 1.52})
+    ```
+
+    Args:
+        - selection (str): The selection of atoms to update.
+        - field (str): The property to set, any of the keys of `_ATOM_TABLE_FIELDS`
+            except `_READ_ONLY_ATOM_FIELDS`.
+        - values (bytes | list | dict): Either one value per atom in the order of the
+            selection, as a packed 1-D array (see `pymol_remote.encoding.encode_array`,
+            numeric fields only) or a list, or a mapping from the value of `key_field`
+            (as a string, since XML-RPC only allows string keys) to the new value.
+            Atoms whose key is not in the mapping keep their value. Elements are
+            matched regardless of their case, like in `elem` selections.
+        - key_field (str, optional): The property to look up in a mapping. Defaults to
+            "elem".
+        - rebuild (bool, optional): Whether to rebuild the representations of the
+            selection afterwards (needed e.g. for `vdw`). Defaults to True.
+
+    Returns:
+        int: The number of atoms that were visited.
+
+    References:
+     - https://pymolwiki.org/index.php/Alter
+    """
+    if field not in _ATOM_TABLE_FIELDS or field in _READ_ONLY_ATOM_FIELDS:
+        raise ValueError(
+            f"Field `{field}` cannot be set. Please use any of the following: "
+            f"{[f for f in _ATOM_TABLE_FIELDS if f not in _READ_ONLY_ATOM_FIELDS]}"
+        )
+
+    dtype = _ATOM_TABLE_FIELDS[field]
+    cast = {"<i4": int, "<f4": float, None: str}[dtype]
+    if isinstance(values, dict):
+        if key_field not in _ATOM_TABLE_FIELDS:
+            raise ValueError(f"Key field `{key_field}` not supported.")
+        normalize = str.upper if key_field == "elem" else str
+        mapping = {normalize(str(key)): cast(value) for key, value in values.items()}
+        n_atoms = pymol_cmd.alter(
+            selection,
+            f"{field} = _mapping.get(_normalize(str({key_field})), {field})",
+            space={"_mapping": mapping, "_normalize": normalize},
+        )
+    else:
+        if isinstance(values, bytes):
+            if dtype is None:
+                raise ValueError(
+                    f"Field `{field}` holds strings, please send its values as a list."
+                )
+            values = decode_array(values)
+            if len(values.shape) != 1:
+                raise ValueError(f"Values must be 1-dimensional, got {values.shape}.")
+            values = values.tolist()
+        n_atoms = pymol_cmd.count_atoms(selection)
+        if len(values) != n_atoms:
             raise ValueError(
-                f"Invalid buffer type: {type(buffer)}. Must be `str` or `bytes`."
+                f"Got {len(values)} values for {n_atoms} atoms in `{selection}`."
             )
-        pymol_cmd.load(temp_pdb_file.name, object, state, format)
+        pymol_cmd.alter(
+            selection,
+            f"{field} = next(_values)",
+            space={"_values": map(cast, values)},
+        )
+
+    if rebuild:
+        pymol_cmd.rebuild(selection)
+    return n_atoms
+
+
+def set_atom_colors(selection: str, buffer: bytes) -> int:
+    """Color each atom of a selection with its own RGB color.
+
+    The colors are set as direct RGB colors (`0x40000000 | 0xRRGGBB`) with a single
+    `alter` and a single `recolor`, without registering named colors.
+
+    Args:
+        - selection (str): The selection of atoms to color.
+        - buffer (bytes): The packed `(n_atoms, 3)` array of colors in the order of the
+            selection, see `pymol_remote.encoding.encode_array`. Either uint8 values in
+            0-255 or float values in 0-1.
+
+    Returns:
+        int: The number of atoms that were colored.
+
+    References:
+     - https://pymolwiki.org/index.php/Color#Using_RGB_for_Atoms
+    """
+    colors = decode_array(buffer)
+    if len(colors.shape) != 2 or colors.shape[1] != 3:
+        raise ValueError(f"Colors must have shape (n_atoms, 3), got {colors.shape}.")
+    colors = colors.tolist()
+    scale = 255 if colors and isinstance(colors[0][0], float) else 1
+    packed_colors = []
+    for color in colors:
+        r, g, b = (max(0, min(255, round(c * scale))) for c in color)
+        packed_colors.append(0x40000000 | r << 16 | g << 8 | b)
+    n_atoms = set_atom_property(selection, "color", packed_colors, rebuild=False)
+    pymol_cmd.recolor(selection)
+    return n_atoms
+
+
+def select_indices(name: str, object: str, indices: dict) -> int:
+    """Define a selection from the atom indices of an object.
+
+    The indices are passed to `select_list` directly, instead of building (and
+    parsing) an `index 1+5+9+...` selection string.
+
+    Args:
+        - name (str): The name of the selection to create (or replace).
+        - object (str): The object the indices refer to.
+        - indices (dict): The (1-based) atom indices within `object`, see
+            `pymol_remote.encoding.encode_indices`.
+
+    Returns:
+        int: The number of atoms in the selection.
+
+    References:
+     - https://pymolwiki.org/index.php/Select_list
+    """
+    pymol_cmd.select_list(name, object, decode_indices(indices), mode="index")
+    return pymol_cmd.count_atoms(name)
+
+
+def get_selection_indices(selection: str = "sele", encoding: str | None = None) -> dict:
+    """Get the atom indices of a selection, by object.
+
+    Args:
+        - selection (str, optional): The selection. Defaults to "sele".
+        - encoding (str | None, optional): The encoding of the indices, any of
+            `pymol_remote.encoding.INDEX_ENCODINGS`. Defaults to None, which uses the
+            smallest one for each object.
+
+    Returns:
+        dict: The encoded (1-based) atom indices of each object in the selection, see
+            `pymol_remote.encoding.encode_indices`.
+
+    References:
+     - https://pymolwiki.org/index.php/Index
+    """
+    indices_by_object = {}
+    for object, index in pymol_cmd.index(selection):
+        indices_by_object.setdefault(object, []).append(index)
+    return {
+        object: encode_indices(indices, encoding)
+        for object, indices in indices_by_object.items()
+    }
+
+
+def begin_trajectory(object: str, topology: str | bytes, format: str = "pdb") -> str:
+    """Start uploading a trajectory into a multi-state object.
+
+    The topology is loaded into `object` (replacing any existing object of that name)
+    and the frames are then uploaded in chunks with `append_frames`, frame `i` becoming
+    state `i` of the object (the first frame replaces the coordinates of the topology).
+    Frames can be viewed while the upload is still running.
+
+    Uploads that are not committed are forgotten ten minutes after their last
+    `append_frames`, keeping the frames uploaded so far.
+
+    Args:
+        - object (str): The name of the object to create.
+        - topology (str | bytes): The structure that defines the atoms of the object,
+            see `set_state`.
+        - format (str, optional): The format of the topology. Defaults to "pdb".
+
+    Returns:
+        str: The id of the upload.
+    """
+    _expire_trajectory_uploads()
+    pymol_cmd.delete(object)
+    set_state(topology, object, 1, format)
+    upload_id = uuid.uuid4().hex
+    _TRAJECTORY_UPLOADS[upload_id] = {
+        "object": object,
+        "n_atoms": pymol_cmd.count_atoms(f"%{object}"),
+        "n_frames": 0,
+        "appended_at": time.monotonic(),
+    }
+    return upload_id
+
+
+def append_frames(upload_id: str, buffer: bytes) -> int:
+    """Append frames to a trajectory upload, as new states of its object.
+
+    Args:
+        - upload_id (str): The id of the upload, as returned by `begin_trajectory`.
+        - buffer (bytes): The packed `(n_frames, n_atoms, 3)` (or `(n_atoms, 3)` for a
+            single frame) array of coordinates, see `pymol_remote.encoding.encode_array`.
+
+    Returns:
+        int: The number of frames uploaded so far.
+    """
+    upload = _get_trajectory_upload(upload_id)
+    frames = decode_array(buffer)
+    if len(frames.shape) not in (2, 3):
+        raise ValueError(
+            f"Frames must have shape (n_frames, n_atoms, 3), got {frames.shape}."
+        )
+    is_single_frame = len(frames.shape) == 2
+    if isinstance(frames, memoryview):
+        frames = frames.tolist()  # ... NumPy is not installed
+    if is_single_frame:
+        frames = [frames]
+    for frame in frames:
+        if len(frame) != upload["n_atoms"]:
+            raise ValueError(
+                f"Frame has {len(frame)} atoms, object `{upload['object']}` has "
+                f"{upload['n_atoms']}."
+            )
+        pymol_cmd.load_coordset(frame, upload["object"], upload["n_frames"] + 1)
+        upload["n_frames"] += 1
+    upload["appended_at"] = time.monotonic()
+    return upload["n_frames"]
+
+
+def commit_trajectory(upload_id: str) -> int:
+    """Finish a trajectory upload.
+
+    Args:
+        - upload_id (str): The id of the upload, as returned by `begin_trajectory`.
+
+    Returns:
+        int: The number of frames that were uploaded.
+    """
+    upload = _get_trajectory_upload(upload_id)
+    del _TRAJECTORY_UPLOADS[upload_id]
+    return upload["n_frames"]
+
+
+def _expire_trajectory_uploads() -> None:
+    """Forget the uploads that received no frames for `_TRAJECTORY_UPLOAD_TTL` seconds.
+
+    The frames uploaded so far are kept, as if the upload had been committed.
+    """
+    appended_before = time.monotonic() - _TRAJECTORY_UPLOAD_TTL
+    for upload_id, upload in list(_TRAJECTORY_UPLOADS.items()):
+        if upload["appended_at"] < appended_before:
+            del _TRAJECTORY_UPLOADS[upload_id]
+
+
+def _get_trajectory_upload(upload_id: str) -> dict:
+    try:
+        return _TRAJECTORY_UPLOADS[upload_id]
+    except KeyError:
+        raise KeyError(f"Trajectory upload `{upload_id}` not found.")
+
+
+def stream_frame(object: str, buffer: bytes, seq: int, state: int = 1) -> dict:
+    """Stream a frame of coordinates to an object, keeping only the newest frame.
+
+    The frame is decoded right away (off the command queue) and replaces any frame of
+    the object that is still waiting to be shown, so a producer that is faster than
+    PyMOL never waits for it and PyMOL always shows the latest frame. Frames are
+    encoded by `pymol_remote.encoding.FrameEncoder`, as quantized keyframes or deltas
+    to the previous frame.
+
+    Args:
+        - object (str): The name of the object to update.
+        - buffer (bytes): The encoded frame.
+        - seq (int): The sequence number of the frame.
+        - state (int, optional): The state to update. Defaults to 1.
+
+    Returns:
+        dict: The counters of the object's stream (`n_received`, `n_applied` and
+            `n_dropped` frames) and `keyframe_required`, which is True if the frame was
+            a delta that could not be decoded and a keyframe has to be sent instead.
+    """
+    with _STREAMS_LOCK:
+        stream = _STREAMS.get(object)
+        if stream is None:
+            stream = _STREAMS[object] = {
+                "lock": threading.Lock(),
+                "decoder": FrameDecoder(),
+                "pending": None,
+                "n_received": 0,
+                "n_applied": 0,
+                "n_dropped": 0,
+            }
+
+    with stream["lock"]:
+        try:
+            frame = stream["decoder"].decode(seq, buffer)
+        except KeyframeRequiredError:
+            return _get_stream_stats(stream, keyframe_required=True)
+
+        stream["n_received"] += 1
+        if stream["pending"] is not None:
+            stream["n_dropped"] += 1
+        else:
+            # ... at most one frame per object waits in the command queue
+            _GLOBAL_PYMOL_XMLRPC_SERVER._command_queue.submit_with_priority(
+                PRIORITY_BULK, _apply_stream_frame, object, stream
+            )
+        stream["pending"] = (frame, state)
+        return _get_stream_stats(stream, keyframe_required=False)
+
+
+def _apply_stream_frame(object: str, stream: dict) -> None:
+    with stream["lock"]:
+        (frame, state), stream["pending"] = stream["pending"], None
+    pymol_cmd.load_coords(frame, object, state)
+    with stream["lock"]:
+        stream["n_applied"] += 1
+
+
+def _get_stream_stats(stream: dict, keyframe_required: bool) -> dict:
+    return {
+        "n_received": stream["n_received"],
+        "n_applied": stream["n_applied"],
+        "n_dropped": stream["n_dropped"],
+        "keyframe_required": keyframe_required,
+    }
+
+
+def close_stream(object: str) -> bool:
+    """Forget the stream of an object, see `stream_frame`. Returns True if it existed."""
+    with _STREAMS_LOCK:
+        return _STREAMS.pop(object, None) is not None
+
+
+def open_state_cursor(
+    selection: str = "(all)", state: int = -1, format: str = "pdb"
+) -> dict:
+    """Export the state of the PyMOL session to a scratch file to be read in chunks.
+
+    This is the server side of `PymolSession.iter_state`: the state is saved once and
+    then read with `read_state_chunk`, so that neither side has to hold the complete
+    (e.g. multi-state or `.pse`) export in memory.
+
+    Args:
+        - selection (str, optional): The selection of atoms to export. Defaults to "all".
+        - state (int, optional): The state to export, see `get_state`. Defaults to -1.
+        - format (str, optional): The format to export, see `get_state`. Defaults to "pdb".
+
+    Returns:
+        dict: The cursor, `{"id": str, "size": int, "text": bool}`, where `size` is the
+            size of the export in bytes and `text` whether it is UTF-8 text.
+    """
+    _check_state_format(format)
+    try:
+        scratch_dir = _get_scratch_dir()
+    except OSError:
+        scratch_dir = None  # ... fall back to the default temporary directory
+    fd, path = tempfile.mkstemp(suffix=f".{format}", dir=scratch_dir)
+    os.close(fd)
+    try:
+        pymol_cmd.save(path, selection, state, format)
+    except BaseException:
+        os.remove(path)
+        raise
+    return _open_state_cursor_file(path, text=format in _TEXT_STATE_FORMATS)
+
+
+def _open_state_cursor_file(path: str, text: bool) -> dict:
+    """Open a cursor over `path`, which is removed when the cursor is closed."""
+    _expire_state_cursors()
+    file = open(path, "rb")
+    cursor_id = uuid.uuid4().hex
+    size = os.fstat(file.fileno()).st_size
+    with _STATE_CURSORS_LOCK:
+        _STATE_CURSORS[cursor_id] = (file, path, time.monotonic())
+    return {"id": cursor_id, "size": size, "text": text}
+
+
+def read_state_chunk(cursor_id: str, size: int = 1 << 20) -> bytes:
+    """Read the next chunk of at most `size` bytes from a cursor.
+
+    The cursor is closed once it is exhausted, i.e. when an empty chunk is returned, or
+    once it has not been read from for `_STATE_CURSOR_TTL` seconds (10 minutes).
+
+    Args:
+        - cursor_id (str): The id of the cursor, as returned by `open_state_cursor`.
+        - size (int, optional): The maximum size of the chunk in bytes. Defaults to 1 MiB.
+
+    Returns:
+        bytes: The chunk, empty if the cursor is exhausted.
+    """
+    with _STATE_CURSORS_LOCK:
+        try:
+            file, path, _ = _STATE_CURSORS[cursor_id]
+        except KeyError:
+            raise KeyError(f"Cursor `{cursor_id}` not found.")
+        _STATE_CURSORS[cursor_id] = (file, path, time.monotonic())
+        chunk = file.read(max(1, size))
+        if not chunk:
+            _close_state_cursor(cursor_id)
+    return chunk
+
+
+def close_state_cursor(cursor_id: str) -> bool:
+    """Close a cursor and remove its scratch file.
+
+    Args:
+        - cursor_id (str): The id of the cursor, as returned by `open_state_cursor`.
+
+    Returns:
+        bool: True if the cursor was open.
+    """
+    with _STATE_CURSORS_LOCK:
+        return _close_state_cursor(cursor_id)
+
+
+def _close_state_cursor(cursor_id: str) -> bool:
+    # ... the caller holds `_STATE_CURSORS_LOCK`
+    cursor = _STATE_CURSORS.pop(cursor_id, None)
+    if cursor is None:
+        return False
+    file, path, _ = cursor
+    file.close()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return True
+
+
+def _expire_state_cursors() -> None:
+    """Close the cursors that have not been read from for `_STATE_CURSOR_TTL` seconds."""
+    read_before = time.monotonic() - _STATE_CURSOR_TTL
+    with _STATE_CURSORS_LOCK:
+        for cursor_id, (_, _, read_at) in list(_STATE_CURSORS.items()):
+            if read_at < read_before:
+                _close_state_cursor(cursor_id)
+
+
+def _get_python_namespace() -> dict:
+    if not _PYTHON_NAMESPACE:
+        _PYTHON_NAMESPACE.update(__name__="pymol_remote.python", cmd=pymol_cmd)
+    return _PYTHON_NAMESPACE
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_python(source: str) -> tuple:
+    """Compile `source` into its statements and (if it ends in one) its last expression."""
+    module = ast.parse(source)
+    expression = None
+    if module.body and isinstance(module.body[-1], ast.Expr):
+        expression = compile(
+            ast.Expression(module.body.pop().value), "<run_python>", "eval"
+        )
+    return compile(module, "<run_python>", "exec"), expression
+
+
+def run_python(source: str):
+    """Execute Python code in PyMOL and return the value of its last expression.
+
+    Unlike `do("python ... python end")`, the result is sent back to the client. The
+    code runs with `cmd` in its globals, which persist between calls, and is compiled
+    only once for repeated calls with the same source.
+
+    ```python
+    >>> session.run_python("len(cmd.get_names())")
+    3
+    ```
+
+    Args:
+        - source (str): The Python code to execute.
+
+    Returns:
+        The value of the last statement if it is an expression (it must be marshallable
+        by XML-RPC), otherwise None.
+    """
+    statements, expression = _compile_python(source)
+    namespace = _get_python_namespace()
+    exec(statements, namespace)
+    return eval(expression, namespace) if expression is not None else None
+
+
+def register_procedure(name: str, source: str) -> str:
+    """Register a Python function that can then be called by name with `call_procedure`.
+
+    The source is compiled once and kept by its content hash: registering the same
+    source again (e.g. from a new client session) does not recompile it.
+
+    Args:
+        - name (str): The name of the procedure. `source` must define a function of
+            this name.
+        - source (str): The Python source that defines the function. It is executed
+            in the globals of `run_python` (which include `cmd`), so the procedure
+            and `run_python` code see each other's names.
+
+    Returns:
+        str: The sha256 hash of the source.
+    """
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    if name in _PROCEDURES and _PROCEDURES[name][0] == digest:
+        return digest
+
+    namespace = _get_python_namespace()
+    # ... an earlier definition of `name` must not pass for one of this source
+    previous = namespace.pop(name, None)
+    try:
+        exec(compile(source, f"<procedure {name}>", "exec"), namespace)
+        if not callable(namespace.get(name)):
+            raise ValueError(f"The source of procedure `{name}` must define `{name}`.")
+    except BaseException:
+        if previous is not None:
+            namespace[name] = previous
+        raise
+    _PROCEDURES[name] = (digest, namespace[name])
+    return digest
+
+
+def call_procedure(name: str, /, *args, **kwargs):
+    """Call a procedure registered with `register_procedure`.
+
+    Args:
+        - name (str): The name of the procedure.
+        - *args, **kwargs: The arguments to call the procedure with.
+
+    Returns:
+        The (marshallable) return value of the procedure.
+
+    Raises:
+        Fault: With code `FAULT_UNKNOWN_PROCEDURE` if no procedure of this name is
+            registered, e.g. because the server has been restarted.
+    """
+    if name not in _PROCEDURES:
+        raise Fault(FAULT_UNKNOWN_PROCEDURE, f"Procedure `{name}` is not registered.")
+    _, procedure = _PROCEDURES[name]
+    return procedure(*args, **kwargs)
+
+
+def get_procedures() -> dict:
+    """Get the registered procedures.
+
+    Returns:
+        dict: The sha256 hash of the source of each procedure, by name.
+    """
+    return {name: digest for name, (digest, _) in _PROCEDURES.items()}
+
+
+def upload_preset(preset: dict) -> str:
+    """Upload a style preset, to apply it with `apply_preset`.
+
+    A preset is a dict with any of the following keys, which `apply_preset` applies in
+    this order:
+     - "element_properties" (dict[str, dict[str, float]]): Per-element atom properties,
+        e.g. `{"vdw": {"C": 1.7, "N": 1.55}}`, see `set_atom_property`.
+     - "colors" (dict[str, list[float]]): Named colors to define, as RGB in 0-1.
+     - "settings" (dict[str, Any]): Global settings, e.g. `{"antialias": 3}`.
+     - "commands" (list[list]): Other commands as `[name, args]`, e.g.
+        `[["bg_color", ["grey19"]]]`.
+
+    Args:
+        - preset (dict): The preset.
+
+    Returns:
+        str: The content hash of the preset, see `pymol_remote.encoding.preset_digest`.
+    """
+    keys = {"element_properties", "colors", "settings", "commands"}
+    unknown_keys = set(preset) - keys
+    if unknown_keys:
+        raise ValueError(f"Unknown preset keys: {sorted(unknown_keys)}.")
+    digest = preset_digest(preset)
+    _PRESETS[digest] = preset
+    return digest
+
+
+def apply_preset(digest: str) -> dict:
+    """Apply a preset uploaded with `upload_preset`.
+
+    Colors and settings that already have the value of the preset are skipped, and
+    the representations are rebuilt at most once, at the end (if the preset sets atom
+    properties or runs commands).
+
+    Args:
+        - digest (str): The content hash of the preset, as returned by `upload_preset`.
+
+    Returns:
+        dict: The number of atoms, colors, settings and commands that were applied or
+            skipped, and whether the representations were rebuilt.
+
+    Raises:
+        Fault: With code `FAULT_UNKNOWN_PRESET` if no preset with this hash has been
+            uploaded.
+    """
+    if digest not in _PRESETS:
+        raise Fault(FAULT_UNKNOWN_PRESET, f"Preset `{digest}` is not uploaded.")
+    preset = _PRESETS[digest]
+    stats = {
+        "n_atoms": 0,
+        "n_colors": 0,
+        "n_colors_skipped": 0,
+        "n_settings": 0,
+        "n_settings_skipped": 0,
+        "n_commands": 0,
+        "rebuilt": False,
+    }
+
+    for field, values in preset.get("element_properties", {}).items():
+        stats["n_atoms"] += set_atom_property("all", field, values, rebuild=False)
+
+    for name, rgb in preset.get("colors", {}).items():
+        if pymol_cmd.get_color_index(name) != -1 and all(
+            math.isclose(current, value, abs_tol=1e-3)
+            for current, value in zip(pymol_cmd.get_color_tuple(name), rgb)
+        ):
+            stats["n_colors_skipped"] += 1
+            continue
+        pymol_cmd.set_color(name, rgb)
+        stats["n_colors"] += 1
+
+    for name, value in preset.get("settings", {}).items():
+        if _setting_matches(pymol_cmd.get(name), value):
+            stats["n_settings_skipped"] += 1
+            continue
+        pymol_cmd.set(name, value)
+        stats["n_settings"] += 1
+
+    for name, args in preset.get("commands", []):
+        getattr(pymol_cmd, name)(*args)
+        stats["n_commands"] += 1
+
+    if stats["n_atoms"] or stats["n_commands"]:
+        pymol_cmd.rebuild()
+        stats["rebuilt"] = True
+    return stats
+
+
+def _setting_matches(current: str, value) -> bool:
+    """Whether the current value of a setting (as returned by `cmd.get`) equals `value`."""
+
+    def _normalize(value):
+        text = str(value).strip().lower()
+        text = {"on": "1", "off": "0", "true": "1", "false": "0"}.get(text, text)
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+    current, value = _normalize(current), _normalize(value)
+    if isinstance(current, float) and isinstance(value, float):
+        return math.isclose(current, value, abs_tol=1e-5)
+    return current == value
+
+
+def get_queue_stats(reset: bool = False) -> dict:
+    """Get the counters of the server's command queue.
+
+    All calls are executed one at a time from a command queue, either on a worker thread
+    or in batches on PyMOL's GUI thread (see `launch_server`). The counters help to tune
+    the time budget per GUI frame.
+
+    Args:
+        - reset (bool, optional): If True, reset the counters after reading them.
+            Defaults to False.
+
+    Returns:
+        dict: The counters, with keys:
+            - mode (str): `"thread"` or `"gui"`.
+            - queue_depth (int): The number of calls currently waiting in the queue.
+            - max_queue_depth (int): The maximum number of calls waiting in the queue.
+            - n_calls (int): The number of calls that were run.
+            - n_batches (int): The number of batches the calls were run in.
+            - max_batch_size (int): The maximum number of calls run in one batch.
+            - total_wait_time, mean_wait_time, max_wait_time (float): Time in seconds
+                between a call being queued and being started.
+            - total_run_time (float): Time in seconds spent running calls.
+    """
+    command_queue = _GLOBAL_PYMOL_XMLRPC_SERVER._command_queue
+    stats = command_queue.stats()
+    if reset:
+        command_queue.reset_stats()
+    return stats
+
+
+def suspend_updates() -> None:
+    """Suspend PyMOL's screen updates and feedback until `resume_updates` is called.
+
+    The server does this by itself for bursts of queued calls; this is a hint for a
+    client that sends a long series of calls one at a time. Calls that read or render
+    the scene (e.g. `get_state` or `png`) still see an up-to-date scene.
+    """
+    _GLOBAL_PYMOL_XMLRPC_SERVER.updates.suspend("explicit")
+
+
+def resume_updates() -> dict:
+    """Resume the updates suspended with `suspend_updates`, with a single refresh.
+
+    Returns:
+        dict: The counters of the suspensions, see `get_update_stats`.
+    """
+    updates = _GLOBAL_PYMOL_XMLRPC_SERVER.updates
+    updates.resume()
+    return updates.stats()
+
+
+def get_update_stats(reset: bool = False) -> dict:
+    """Get the counters of the suspension of PyMOL's updates during bursts of calls.
+
+    Args:
+        - reset (bool, optional): If True, reset the counters after reading them.
+            Defaults to False.
+
+    Returns:
+        dict: The counters, with keys:
+            - mode (str | None): `"burst"` or `"explicit"` while updates are suspended.
+            - n_suspensions (int): The number of times updates were suspended.
+            - n_refreshes (int): The number of refreshes done instead.
+            - n_saved_redraws (int): The number of calls that ran without a redraw.
+            - n_deferred_rebuilds (int): The number of `rebuild` calls that were deferred.
+            - n_rebuilds (int): The number of rebuilds they were coalesced into.
+    """
+    updates = _GLOBAL_PYMOL_XMLRPC_SERVER.updates
+    stats = updates.stats()
+    if reset:
+        updates.reset_stats()
+    return stats
+
+
+def get_compression_stats(reset: bool = False) -> dict:
+    """Get the totals of the compressed responses of the server.
+
+    Responses larger than `PYMOL_RPC_COMPRESS_THRESHOLD` bytes are compressed with the
+    first codec listed in the client's `Accept-Encoding` header. The compression of
+    requests is reported by the client, see `PymolSession.compression_stats`.
+
+    Args:
+        - reset (bool, optional): If True, reset the totals after reading them.
+            Defaults to False.
+
+    Returns:
+        dict: The totals by `"response:<codec>"`, each with the keys `n_calls`,
+            `raw_size` and `size` (in bytes), `ratio` and `cpu_time` (in seconds).
+    """
+    compression_stats = _GLOBAL_PYMOL_XMLRPC_SERVER.compression_stats
+    stats = compression_stats.summary()
+    if reset:
+        compression_stats.reset()
+    return stats
+
+
+def submit_job(
+    name: str,
+    args: list | None = None,
+    kwargs: dict | None = None,
+    priority: int = PRIORITY_JOB,
+) -> str:
+    """Queue a long-running call as a job and return its id immediately.
+
+    The job is executed from the server's command queue like any other call, but with
+    the given priority. Regular calls are queued with priority 0, so with the default
+    job priority interactive calls like `get_names` or `zoom` jump ahead of queued jobs.
+
+    Jobs whose result is not fetched with `get_job_result` are forgotten one hour after
+    they have finished.
+
+    Args:
+        - name (str): The name of the function to call, e.g. "ray" or "get_state".
+        - args (list, optional): The positional arguments of the call.
+        - kwargs (dict, optional): The keyword arguments of the call.
+        - priority (int, optional): The priority of the job, lower values run first.
+            Defaults to 10.
+
+    Returns:
+        str: The id of the job, to be used with `poll_job`, `get_job_result` and `cancel_job`.
+    """
+    _expire_jobs()
+    server = _GLOBAL_PYMOL_XMLRPC_SERVER
+    job_id = uuid.uuid4().hex
+    future = server._command_queue.submit_with_priority(
+        priority,
+        server._dispatch_with_kwargs,
+        name,
+        default(args, []),
+        default(kwargs, {}),
+    )
+    _JOBS[job_id] = future
+    future.add_done_callback(
+        lambda _: _FINISHED_JOBS.setdefault(job_id, time.monotonic())
+    )
+    return job_id
+
+
+def poll_job(job_id: str) -> str:
+    """Get the status of a job.
+
+    Args:
+        - job_id (str): The id of the job, as returned by `submit_job`.
+
+    Returns:
+        str: One of "pending", "running", "done", "failed" or "cancelled".
+    """
+    return _get_job_status(_get_job(job_id))
+
+
+def get_job_result(job_id: str, timeout: float = 0.0) -> dict:
+    """Wait for a job to finish and get its result.
+
+    Once a job has finished and its result (or error) has been returned, the job is
+    forgotten.
+
+    Args:
+        - job_id (str): The id of the job, as returned by `submit_job`.
+        - timeout (float, optional): The maximum time in seconds to wait for the job to
+            finish. Defaults to 0 (do not wait).
+
+    Returns:
+        dict: `{"status": status}` if the job is not finished yet, or
+            `{"status": "done", "result": result}` if it is.
+
+    Raises:
+        - Exception: The exception raised by the job, if it failed.
+        - concurrent.futures.CancelledError: If the job was cancelled.
+    """
+    future = _get_job(job_id)
+    wait([future], timeout=timeout)
+    if not future.done():
+        return {"status": _get_job_status(future)}
+
+    _JOBS.pop(job_id, None)
+    _FINISHED_JOBS.pop(job_id, None)
+    return {"status": "done", "result": future.result()}
+
+
+def cancel_job(job_id: str) -> bool:
+    """Cancel a job.
+
+    Jobs can only be cancelled while they are still pending, i.e. a PyMOL command that
+    has already started will run to completion.
+
+    Args:
+        - job_id (str): The id of the job, as returned by `submit_job`.
+
+    Returns:
+        bool: True if the job was cancelled.
+    """
+    return _get_job(job_id).cancel()
+
+
+def _expire_jobs() -> None:
+    """Forget the jobs that finished more than `_JOB_TTL` seconds ago."""
+    finished_before = time.monotonic() - _JOB_TTL
+    for job_id, finished_at in list(_FINISHED_JOBS.items()):
+        if finished_at < finished_before:
+            _JOBS.pop(job_id, None)
+            _FINISHED_JOBS.pop(job_id, None)
+
+
+def _get_job(job_id: str) -> Future:
+    try:
+        return _JOBS[job_id]
+    except KeyError:
+        raise KeyError(f"Job `{job_id}` not found.")
+
+
+def _get_job_status(future: Future) -> str:
+    if future.cancelled():
+        return "cancelled"
+    if future.done():
+        return "failed" if future.exception() is not None else "done"
+    return "running" if future.running() else "pending"
 
 
 def help(command: str | None = None) -> str:
@@ -258,6 +2335,10 @@ def launch_server(
     hostname: str = pymol_rpc_host,
     port: int = pymol_rpc_port,
     n_ports_to_try: int = pymol_rpc_n_ports_to_try,
+    executor: str = pymol_rpc_executor,
+    time_budget: float = pymol_rpc_gui_time_budget,
+    marshal_pool: str = pymol_rpc_marshal_pool,
+    bulk_port: int | None = pymol_rpc_bulk_port,
 ) -> None:
     """Launches the XML-RPC server in a separate thread.
 
@@ -269,6 +2350,17 @@ def launch_server(
         port (int, optional): The initial port to try for the server. Defaults to 9123.
         n_ports_to_try (int, optional): The number of consecutive ports to try if the initial port is unavailable.
                                 Defaults to 5.
+        executor (str, optional): Where PyMOL commands are executed: `"thread"` runs them on a
+                                dedicated worker thread, `"gui"` runs them in batches on PyMOL's
+                                GUI thread (falls back to `"thread"` if there is no Qt GUI).
+                                Defaults to "thread".
+        time_budget (float, optional): The maximum time in seconds spent running queued calls per
+                                GUI timer tick (only used with `executor="gui"`). Defaults to 0.008.
+        marshal_pool (str, optional): Whether large payloads are marshalled on a pool of `"thread"`s
+                                or `"process"`es. Defaults to "thread".
+        bulk_port (int | None, optional): The port of an additional listener for bulk-data
+                                transfers (e.g. `get_state`). If None, bulk transfers use the
+                                `/bulk` path on the main port. Defaults to None.
 
     Returns:
         None
@@ -288,6 +2380,7 @@ def launch_server(
     #  are not displayed to the pymol console)
     hostname = hostname.lower()
     port = int(port)
+    bulk_port = None if bulk_port is None else int(bulk_port)
     print(f"Attempting to launch server on {hostname}:{port} ...")
 
     try:
@@ -306,7 +2399,14 @@ def launch_server(
 
     for i in range(n_ports_to_try):
         try:
-            _GLOBAL_PYMOL_XMLRPC_SERVER = PymolXMLRPCServer(hostname, port + i)
+            _GLOBAL_PYMOL_XMLRPC_SERVER = PymolXMLRPCServer(
+                hostname,
+                port + i,
+                marshal_pool=marshal_pool,
+                executor=executor,
+                time_budget=time_budget,
+                bulk_port=bulk_port,
+            )
         except Exception as e:  # noqa: E722
             _GLOBAL_PYMOL_XMLRPC_SERVER = None
             print(f"Warning: Failed to launch server on {hostname}:{port + i}: {e}")
@@ -330,15 +2430,82 @@ def launch_server(
                 _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(func, name)
 
         # register custom functions
-        _GLOBAL_PYMOL_XMLRPC_SERVER.register_function(is_alive, "is_alive")
+        _GLOBAL_PYMOL_XMLRPC_SERVER.register_function(
+            is_alive, "is_alive", queued=False
+        )
         _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
             get_state, "get_state"
         )
         _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
             set_state, "set_state"
         )
-        _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(help, "help")
+        # ... per-atom arrays (coordinates, properties, colors and index sets) travel as
+        #  packed buffers, as NumPy arrays such as those of `cmd.get_coords` cannot be
+        #  marshalled
+        for array_function in (
+            get_coords,
+            get_ensemble_coords,
+            set_coords,
+            get_atom_table,
+            set_atom_property,
+            set_atom_colors,
+            select_indices,
+            get_selection_indices,
+        ):
+            _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
+                array_function, array_function.__name__
+            )
+        for trajectory_function in (begin_trajectory, append_frames, commit_trajectory):
+            _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
+                trajectory_function, trajectory_function.__name__
+            )
+        _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
+            open_state_cursor, "open_state_cursor"
+        )
+        # ... streamed frames are decoded as they arrive, and queued by `stream_frame`
+        for stream_function in (stream_frame, close_stream):
+            _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
+                stream_function, stream_function.__name__, queued=False
+            )
+        # ... reading the scratch file does not touch PyMOL
+        for cursor_function in (read_state_chunk, close_state_cursor):
+            _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
+                cursor_function, cursor_function.__name__, queued=False
+            )
+        for python_function in (
+            run_python,
+            register_procedure,
+            call_procedure,
+            get_procedures,
+        ):
+            _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
+                python_function, python_function.__name__
+            )
+        for preset_function in (upload_preset, apply_preset):
+            _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
+                preset_function, preset_function.__name__
+            )
+        for update_function in (suspend_updates, resume_updates):
+            _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
+                update_function, update_function.__name__
+            )
+        for stats_function in (
+            get_queue_stats,
+            get_compression_stats,
+            get_update_stats,
+        ):
+            _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
+                stats_function, stats_function.__name__, queued=False
+            )
+        for job_function in (submit_job, poll_job, get_job_result, cancel_job):
+            _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
+                job_function, job_function.__name__, queued=False
+            )
+        _GLOBAL_PYMOL_XMLRPC_SERVER.register_function_with_kwargs(
+            help, "help", queued=False
+        )
         _GLOBAL_PYMOL_XMLRPC_SERVER.register_introspection_functions()
+        _GLOBAL_PYMOL_XMLRPC_SERVER.register_multicall_functions()
         server_thread = threading.Thread(
             target=_GLOBAL_PYMOL_XMLRPC_SERVER.serve_forever
         )
@@ -346,7 +2513,15 @@ def launch_server(
         server_thread.start()
 
         # Log output to pymol console to help user find the server
-        print(f"xml-rpc server running on host {hostname}, port {port}")
+        print(
+            f"xml-rpc server running on host {hostname}, port {port} "
+            f"(executor: {_GLOBAL_PYMOL_XMLRPC_SERVER._command_queue.mode})"
+        )
+        if bulk_port is not None:
+            print(
+                f"bulk-data listener running on port {bulk_port} "
+                "(forward it as well when using SSH port forwarding)"
+            )
         if hostname == ALL_INTERFACES:
             print(
                 f"WARNING: Running on all interfaces ({ALL_INTERFACES}) exposes your PyMOL server to all network "
@@ -0,0 +1,218 @@
+import struct
+from xmlrpc.client import Fault, dumps, gzip_decode, loads
+
+import pytest
+
+from pymol_remote.encoding import (
+    CODECS,
+    AtomTable,
+    CompressionStats,
+    FrameDecoder,
+    FrameEncoder,
+    KeyframeRequiredError,
+    compress,
+    decode_array,
+    decode_indices,
+    decompress,
+    dump_response,
+    encode_array,
+    encode_indices,
+    encode_table,
+    load_request,
+    negotiate_codec,
+    pack_array,
+    preset_digest,
+    unpack_array,
+)
+
+
+@pytest.mark.parametrize(
+    "result",
+    [
+        "HETATM    1  C1  LIG A   1 <&> é\n" * 100,
+        b"\x00\x01binary\xff" * 100,
+        {"nested": [1, 2.5, None, "a<b"]},
+    ],
+)
+def test_dump_response_matches_marshaller(result):
+    """Test that responses decode to the same value as those of `xmlrpc.client.dumps`."""
+    body, content_encoding, _, _ = dump_response((result,))
+    assert content_encoding == "identity"
+    reference = dumps((result,), methodresponse=True, allow_none=True).encode()
+    assert loads(body, use_builtin_types=True) == loads(
+        reference, use_builtin_types=True
+    )
+
+
+def test_dump_response_gzip_and_faults():
+    """Test that large responses are gzipped and that faults are encoded as such."""
+    body, content_encoding, raw_size, _ = dump_response(
+        ("x" * 10_000,), codec="gzip", compress_threshold=1400
+    )
+    assert content_encoding == "gzip"
+    assert loads(gzip_decode(body))[0] == ("x" * 10_000,)
+    assert raw_size > 10_000
+
+    body, _, _, _ = dump_response((object(),))
+    with pytest.raises(Fault, match="cannot marshal"):
+        loads(body)
+
+
+def test_load_request():
+    """Test decoding a request body."""
+    data = dumps(([1], {"b": 2}), "add").encode()
+    assert load_request(data) == (([1], {"b": 2}), "add")
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_compress_roundtrip(codec):
+    """Test that all codecs round trip and that small payloads are not compressed."""
+    data = b"ATOM      1  N   ALA A   1      11.104   6.134  -6.504  1.00 20.00\n" * 100
+    payload = compress(data, codec, threshold=1400)
+    assert payload.content_encoding == codec
+    assert payload.ratio > 5
+    assert decompress(payload.body, codec) == data
+    assert compress(data[:100], codec, threshold=1400).content_encoding == "identity"
+
+
+def test_pdb_dictionary():
+    """Test that the preset dictionary helps with small PDB blocks."""
+    data = (
+        b"HETATM    1  C1  LIG A   1      -1.234   2.345  -3.456  1.00 20.00           C  \n"
+        b"HETATM    2  O1  LIG A   1      -0.134   2.945  -3.956  1.00 20.00           O  \n"
+    )
+    assert len(compress(data, "x-pdb-deflate").body) < len(
+        compress(data, "deflate").body
+    )
+
+
+def test_negotiate_codec():
+    """Test picking the first supported codec of an `Accept-Encoding` header."""
+    assert negotiate_codec("br, xz;q=0.9, gzip") == "xz"
+    assert negotiate_codec("xz;q=0, GZIP") == "gzip"
+    assert negotiate_codec("identity") is None
+    assert negotiate_codec("") is None
+
+
+def test_compression_stats():
+    """Test the totals of recorded payloads."""
+    stats = CompressionStats()
+    stats.record("response", compress(b"x" * 1000, "gzip"), 0.5)
+    stats.record("response", compress(b"x" * 1000, "gzip"), 0.5)
+    totals = stats.summary()["response:gzip"]
+    assert totals["n_calls"] == 2
+    assert totals["raw_size"] == 2000
+    assert totals["cpu_time"] == 1.0
+    assert totals["ratio"] > 10
+    stats.reset()
+    assert stats.summary() == {}
+
+
+@pytest.mark.parametrize("dtype", ["<f4", ">f4", "<f8", "<i4"])
+def test_pack_array(dtype):
+    """Test that packed arrays decode to the same shape and values."""
+    values = [[1, 2, 3], [4, 5, 6]]
+    fmt = {"f4": "f", "f8": "d", "i4": "i"}[dtype[1:]]
+    data = struct.pack(f"{dtype[0]}6{fmt}", *sum(values, []))
+    packed = pack_array(data, (2, 3), dtype)
+
+    buffer, shape, unpacked_dtype = unpack_array(packed)
+    assert (bytes(buffer), shape, unpacked_dtype) == (data, (2, 3), dtype)
+    assert decode_array(packed).tolist() == values
+    assert len(decode_array(pack_array(b"", (0, 3), dtype)).tolist()) == 0
+
+
+def test_pack_array_errors():
+    """Test that mismatched buffers and foreign data are rejected."""
+    with pytest.raises(ValueError, match="does not match"):
+        pack_array(b"\x00" * 10, (2, 3))
+    with pytest.raises(ValueError, match="not a packed array"):
+        unpack_array(b"\x00" * 32)
+
+
+def test_encode_array():
+    """Test packing nested lists (or NumPy arrays, if installed)."""
+    values = [[1.5, 2.0, 3.0], [4.0, 5.0, -6.25]]
+    packed = encode_array(values)
+    assert unpack_array(packed)[1:] == ((2, 3), "<f4")
+    assert decode_array(packed).tolist() == values
+    assert decode_array(encode_array(values, "<f8")).tolist() == values
+
+
+def test_frame_encoding():
+    """Test that frames are quantized and sent as the smallest deltas that fit."""
+    pytest.importorskip("numpy")
+    encoder, decoder = FrameEncoder(), FrameDecoder()
+    frames = [
+        [[1.0, 2.0, 3.0]],
+        [[1.1, 2.0, 3.0]],  # ... moved by 100 quanta (int8)
+        [[1.1, 12.0, 3.0]],  # ... moved by 10000 quanta (int16)
+        [[1.1, 112.0, 3.0]],  # ... keyframe
+    ]
+    dtypes = []
+    for frame in frames:
+        seq, buffer = encoder.encode(frame)
+        dtypes.append(unpack_array(buffer)[2])
+        assert decoder.decode(seq, buffer).tolist() == [
+            [pytest.approx(x, abs=1e-4) for x in frame[0]]
+        ]
+    assert dtypes == ["<i4", "<i1", "<i2", "<i4"]
+
+    # ... a delta to a frame the decoder has not seen
+    encoder.encode(frames[0])
+    seq, buffer = encoder.encode(frames[0])
+    with pytest.raises(KeyframeRequiredError):
+        decoder.decode(seq, buffer)
+
+
+def test_encode_table():
+    """Test that tables round trip and that string columns are dictionary-encoded."""
+    chains = ["A", "A", "B", "A"]
+    table = AtomTable(
+        encode_table(
+            {"chain": chains, "resv": [1, 2, 1, 3], "b": [10.0, 20.5, 30.0, 0.25]},
+            {"chain": None, "resv": "<i4", "b": "<f4"},
+        )
+    )
+    assert len(table) == 4
+    assert table.fields == ["chain", "resv", "b"]
+    assert table.categories["chain"] == ["A", "B"]
+    assert table.codes("chain").tolist() == [0, 0, 1, 0]
+    assert list(table["chain"]) == chains
+    assert table["resv"].tolist() == [1, 2, 1, 3]
+    assert table["b"].tolist() == [10.0, 20.5, 30.0, 0.25]
+    with pytest.raises(KeyError):
+        table.codes("b")
+
+    empty = AtomTable(encode_table({"chain": []}, {"chain": None}))
+    assert len(empty) == 0 and len(empty["chain"]) == 0
+
+
+@pytest.mark.parametrize(
+    "indices, smallest",
+    [
+        ([3, 7, 100000], "uint32"),
+        (list(range(1, 5001)) + list(range(6001, 9001)), "runs"),
+        (list(range(1, 100000, 3)), "bitset"),
+        ([], "uint32"),
+    ],
+)
+def test_encode_indices(indices, smallest):
+    """Test that indices roundtrip in all encodings and the smallest one is picked."""
+    assert encode_indices(indices)["encoding"] == smallest
+    for encoding in ("uint32", "runs", "bitset"):
+        encoded = encode_indices(indices[::-1] + indices[:1], encoding)
+        assert encoded["n_indices"] == len(indices)
+        assert decode_indices(encoded) == indices
+    with pytest.raises(ValueError):
+        encode_indices(indices, "csv")
+
+
+def test_preset_digest():
+    """Test that presets hash the same after an XML-RPC roundtrip."""
+    preset = {"colors": {"coral": (1.0, 0.5, 0.31)}, "settings": {"antialias": 3}}
+    (roundtripped,), _ = loads(dumps((preset,)))
+    assert preset_digest(roundtripped) == preset_digest(preset)
+    assert preset_digest({**preset, "settings": {"antialias": 2}}) != preset_digest(
+        preset
+    )
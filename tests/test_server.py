@@ -1,11 +1,325 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from typing import Callable
+from xmlrpc.client import Fault, ServerProxy
+
 import pytest
 
+from pymol_remote import client
+from pymol_remote import server as server_module
+from pymol_remote.async_client import AsyncPymolSession
+from pymol_remote.client import PymolSession, ResponseCache, TimeoutTransport
+from pymol_remote.common import FAULT_UNKNOWN_PRESET, FAULT_UNKNOWN_PROCEDURE
+from pymol_remote.encoding import encode_array
 from pymol_remote.server import (
+    PymolXMLRPCServer,
+    _CommandQueue,
     _get_local_ip,
+    _get_scratch_dir,
+    _open_state_cursor_file,
+    _setting_matches,
+    _UpdateSuspension,
+    append_frames,
+    apply_preset,
+    begin_trajectory,
+    call_procedure,
+    cancel_job,
+    close_state_cursor,
+    close_stream,
+    commit_trajectory,
+    get_atom_table,
+    get_coords,
+    get_ensemble_coords,
+    get_job_result,
+    get_procedures,
+    get_selection_indices,
     get_state,
+    get_update_stats,
+    is_alive,
+    poll_job,
+    read_state_chunk,
+    register_procedure,
+    resume_updates,
+    run_python,
+    select_indices,
+    set_atom_colors,
+    set_atom_property,
+    set_coords,
+    set_state,
+    stream_frame,
+    submit_job,
+    suspend_updates,
+    upload_preset,
+)
+from pymol_remote.style import PRETTY_PRESET, make_pymol_pretty
+
+
+def _add(a: int, b: int = 0) -> int:
+    return a + b
+
+
+def _fail() -> None:
+    raise ValueError("boom")
+
+
+# ... a ligand with three atoms, in the columns of the PDB format
+_PDB = "".join(
+    f"HETATM{i:5d} {name:<4} LIG A   1    {x:8.3f}{0.0:8.3f}{0.0:8.3f}"
+    f"{1.0:6.2f}{b:6.2f}          {elem:>2}\n"
+    for i, (name, elem, x, b) in enumerate(
+        [("C1", "C", 0.0, 10.0), ("N1", "N", 1.5, 20.0), ("O1", "O", 3.0, 30.0)],
+        start=1,
+    )
 )
 
 
+class _FakeCmd:
+    """A minimal stand-in for PyMOL's `cmd` module, which keeps atoms as dicts.
+
+    Tests delete `get_str` and `load_raw` to mimic older versions of PyMOL, which lack
+    them.
+    """
+
+    def __init__(self):
+        self.atoms = []
+        self.selections = {}
+        self.colors = {}
+        self.settings = {"antialias": "0", "ray_trace_mode": "0"}
+        self.calls = []
+        self.get_str = self._get_str
+        self.load_raw = self._load_raw
+
+    def load_pdb(self, text: str, object: str) -> None:
+        index = len(self._select(object))
+        for line in text.splitlines():
+            if line.startswith(("ATOM", "HETATM")):
+                index += 1
+                self.atoms.append(
+                    {
+                        "model": object,
+                        "index": index,
+                        "ID": int(line[6:11]),
+                        "rank": index - 1,
+                        "name": line[12:16].strip(),
+                        "alt": "",
+                        "resn": line[17:20].strip(),
+                        "chain": line[21].strip(),
+                        "segi": "",
+                        "resi": line[22:26].strip(),
+                        "resv": int(line[22:26]),
+                        "q": float(line[54:60]),
+                        "b": float(line[60:66]),
+                        "elem": line[76:78].strip(),
+                        "type": line[0:6].strip(),
+                        "text_type": "",
+                        "ss": "",
+                        "label": "",
+                        "vdw": 1.5,
+                        "color": 0,
+                        "formal_charge": 0,
+                        "partial_charge": 0.0,
+                        "numeric_type": -9999,
+                        "coords": [[float(line[i : i + 8]) for i in (30, 38, 46)]],
+                    }
+                )
+
+    def _load_raw(
+        self, content: str, format: str, object: str = "", state: int = 0
+    ) -> None:
+        if format != "pdb":
+            raise ValueError(f"Cannot load {format} from memory.")
+        self.load_pdb(content, object)
+
+    def load(
+        self, filename: str, object: str = "", state: int = 0, format: str = ""
+    ) -> None:
+        self.calls.append(("load", filename))
+        with open(filename, "r") as file:
+            self.load_pdb(file.read(), object)
+
+    def _select(self, selection: str) -> list[dict]:
+        name = selection.strip("()%")
+        if name == "all":
+            return list(self.atoms)
+        if name in self.selections:
+            keys = self.selections[name]
+            return [
+                atom for atom in self.atoms if (atom["model"], atom["index"]) in keys
+            ]
+        return [atom for atom in self.atoms if atom["model"] == name]
+
+    def select_list(
+        self, name: str, object: str, id_list: list, state: int = 0, mode: str = "id"
+    ) -> None:
+        self.selections[name] = {(object, index) for index in id_list}
+
+    def index(self, selection: str = "sele") -> list[tuple[str, int]]:
+        return [(atom["model"], atom["index"]) for atom in self._select(selection)]
+
+    def get_names(self, type: str = "objects") -> list[str]:
+        self.calls.append(("get_names", type))
+        return list(dict.fromkeys(atom["model"] for atom in self.atoms))
+
+    def get_view(self) -> tuple:
+        return (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0) + (0.0,) * 9
+
+    def count_atoms(self, selection: str = "all") -> int:
+        return len(self._select(selection))
+
+    def count_states(self, selection: str = "all") -> int:
+        return max((len(atom["coords"]) for atom in self._select(selection)), default=0)
+
+    def get_coords(self, selection: str = "all", state: int = 1):
+        import numpy as np
+
+        states = range(self.count_states(selection)) if state == 0 else [state - 1]
+        coords = [atom["coords"][i] for i in states for atom in self._select(selection)]
+        return np.array(coords, dtype=np.float32) if coords else None
+
+    def iterate(self, selection: str, expression: str, space: dict = None) -> int:
+        atoms = self._select(selection)
+        for atom in atoms:
+            exec(expression, dict(space or {}), dict(atom))
+        return len(atoms)
+
+    def iterate_state(
+        self, state: int, selection: str, expression: str, space: dict = None
+    ) -> int:
+        atoms = self._select(selection)
+        for atom in atoms:
+            x, y, z = atom["coords"][max(state, 1) - 1]
+            exec(expression, dict(space or {}), dict(atom, x=x, y=y, z=z))
+        return len(atoms)
+
+    def alter(self, selection: str, expression: str, space: dict = None) -> int:
+        atoms = self._select(selection)
+        for atom in atoms:
+            properties = dict(atom)
+            exec(expression, dict(space or {}), properties)
+            atom.update((field, properties[field]) for field in atom)
+        return len(atoms)
+
+    def rebuild(self, selection: str = "all", representation: str = "everything"):
+        self.calls.append(("rebuild", selection))
+
+    def recolor(self, selection: str = "all", representation: str = "everything"):
+        self.calls.append(("recolor", selection))
+
+    def get_color_index(self, color: str) -> int:
+        return list(self.colors).index(color) if color in self.colors else -1
+
+    def get_color_tuple(self, color: str) -> tuple:
+        return tuple(self.colors[color])
+
+    def set_color(self, name: str, rgb: list) -> None:
+        self.colors[name] = list(rgb)
+
+    def get(self, name: str) -> str:
+        return self.settings[name]
+
+    def set(self, name: str, value) -> None:
+        self.settings[name] = str(value)
+
+    def bg_color(self, color: str = "black") -> None:
+        self.calls.append(("bg_color", color))
+
+    def space(self, space: str = "rgb") -> None:
+        self.calls.append(("space", space))
+
+    def load_coords(self, coords, selection: str, state: int = 1) -> None:
+        for atom, xyz in zip(self._select(selection), coords):
+            atom["coords"][state - 1] = [float(value) for value in xyz]
+
+    def load_coordset(self, coords, object: str, state: int = 0) -> None:
+        for atom, xyz in zip(self._select(object), coords):
+            del atom["coords"][state - 1 :]
+            atom["coords"].append([float(value) for value in xyz])
+
+    def delete(self, name: str) -> None:
+        self.atoms = [atom for atom in self.atoms if atom["model"] != name]
+
+    def _get_str(self, format: str, selection: str = "all", state: int = -1) -> str:
+        return "".join(
+            f"HETATM{i:5d} {atom['name']:<4} {atom['resn']:3} {atom['chain']:1}"
+            f"{atom['resi']:>4}    {x:8.3f}{y:8.3f}{z:8.3f}{1.0:6.2f}{atom['b']:6.2f}"
+            f"          {atom['elem']:>2}\n"
+            for i, atom in enumerate(self._select(selection), start=1)
+            for x, y, z in [atom["coords"][max(state, 1) - 1]]
+        )
+
+    def save(
+        self, filename: str, selection: str = "all", state: int = -1, format: str = ""
+    ) -> None:
+        self.calls.append(("save", filename))
+        if format == "png":
+            with open(filename, "wb") as file:
+                file.write(b"\x89PNG")
+        else:
+            with open(filename, "w") as file:
+                file.write(self._get_str(format, selection, state))
+
+
+@pytest.fixture
+def fake_cmd(monkeypatch):
+    """Replaces PyMOL's `cmd` module on the server with a `_FakeCmd`."""
+    cmd = _FakeCmd()
+    monkeypatch.setattr(server_module, "pymol_cmd", cmd, raising=False)
+    return cmd
+
+
+def _register(server: PymolXMLRPCServer, *functions: Callable) -> None:
+    """Register functions of the server module, as `launch_server` does."""
+    for function in functions:
+        server.register_function_with_kwargs(function, function.__name__)
+
+
+@pytest.fixture
+def rpc_server(monkeypatch):
+    """Runs a `PymolXMLRPCServer` (without PyMOL functions) on a random local port."""
+    server = PymolXMLRPCServer("localhost", 0)
+    monkeypatch.setattr(server_module, "_GLOBAL_PYMOL_XMLRPC_SERVER", server)
+    server.register_function(is_alive, "is_alive", queued=False)
+    server.register_function_with_kwargs(_add, "add")
+    server.register_function_with_kwargs(_fail, "fail")
+    for job_function in (submit_job, poll_job, get_job_result, cancel_job):
+        server.register_function_with_kwargs(
+            job_function, job_function.__name__, queued=False
+        )
+    server.register_multicall_functions()
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+    server_thread.join()
+
+
+@pytest.fixture
+def rpc_session(rpc_server):
+    """Creates a PymolSession connected to the `rpc_server` fixture."""
+    _, port = rpc_server.server_address
+    yield PymolSession(hostname="localhost", port=port, force_new=True)
+
+    # ... do not leak the connection to the test server into other tests
+    client._GLOBAL_SERVER_PROXY = None
+    client._GLOBAL_BULK_SERVER_PROXY = None
+
+
+@pytest.fixture
+def cached_session(rpc_server):
+    """Creates a PymolSession with a response cache connected to `rpc_server`."""
+    _, port = rpc_server.server_address
+    yield PymolSession(hostname="localhost", port=port, force_new=True, cache_size=128)
+
+    client._GLOBAL_SERVER_PROXY = None
+    client._GLOBAL_BULK_SERVER_PROXY = None
+
+
 def test_get_local_ip():
     """Test local IP address retrieval."""
     ip = _get_local_ip()
@@ -18,3 +332,1014 @@ def test_invalid_format():
     """Test get_state with invalid format."""
     with pytest.raises(ValueError):
         get_state(format="invalid_format")
+
+
+def test_scratch_dir():
+    """Test that the scratch directory is created once and reused."""
+    scratch_dir = _get_scratch_dir()
+    assert os.path.isdir(scratch_dir)
+    assert _get_scratch_dir() == scratch_dir
+
+
+@pytest.mark.parametrize("shm_writable", [True, False])
+def test_scratch_dir_fallback(monkeypatch, tmp_path, shm_writable):
+    """Test that the scratch directory is on tmpfs if possible, else in the temp dir."""
+    parents = []
+
+    def _mkdtemp(prefix=None, dir=None):
+        parents.append(dir)
+        return str(tmp_path)
+
+    monkeypatch.setattr(server_module, "_SCRATCH_DIR", None)
+    monkeypatch.setattr(server_module.atexit, "register", lambda *args, **kwargs: None)
+    monkeypatch.setattr(server_module.tempfile, "mkdtemp", _mkdtemp)
+    monkeypatch.setattr(server_module.os, "access", lambda path, mode: shm_writable)
+    assert _get_scratch_dir() == str(tmp_path)
+    assert parents == ["/dev/shm" if shm_writable else None]
+
+
+@pytest.mark.parametrize("in_memory", [True, False])
+def test_get_state(fake_cmd, in_memory):
+    """Test that text formats are exported with `get_str` if PyMOL has it."""
+    if not in_memory:
+        del fake_cmd.get_str
+    fake_cmd.load_pdb(_PDB, "ligand")
+    assert get_state("ligand") == _PDB
+    assert len(fake_cmd.calls) == (0 if in_memory else 1)
+    # ... binary formats are always written to a file, in the scratch directory
+    assert get_state(format="png") == b"\x89PNG"
+    assert os.path.dirname(fake_cmd.calls[-1][1]) == _get_scratch_dir()
+
+
+@pytest.mark.parametrize(
+    "in_memory, format, loaded_from",
+    [(True, "pdb", "memory"), (False, "pdb", "file"), (True, "xyz", "file")],
+)
+def test_set_state(fake_cmd, in_memory, format, loaded_from):
+    """Test that buffers are loaded with `load_raw` if PyMOL has it and accepts them."""
+    if not in_memory:
+        del fake_cmd.load_raw
+    # ... the fake `load_raw` rejects all formats but "pdb"
+    assert set_state(_PDB, "ligand", format=format) == loaded_from
+    assert [atom["name"] for atom in fake_cmd.atoms] == ["C1", "N1", "O1"]
+    if loaded_from == "file":
+        ((_, filename),) = fake_cmd.calls
+        assert os.path.dirname(filename) == _get_scratch_dir()
+        assert not os.path.exists(filename)
+    else:
+        assert not fake_cmd.calls
+    with pytest.raises(ValueError):
+        set_state(None)
+
+
+def test_get_state_without_scratch_dir(fake_cmd, monkeypatch, tmp_path):
+    """Test that files are written to the default temp dir without a scratch dir."""
+
+    def _get_scratch_dir():
+        raise OSError("read-only file system")
+
+    monkeypatch.setattr(server_module, "_get_scratch_dir", _get_scratch_dir)
+    monkeypatch.setattr(server_module.tempfile, "tempdir", str(tmp_path))
+    fake_cmd.load_pdb(_PDB, "ligand")
+    assert get_state(format="png") == b"\x89PNG"
+    assert os.path.dirname(fake_cmd.calls[-1][1]) == str(tmp_path)
+    assert not list(tmp_path.iterdir())
+
+
+def test_multicall_kwargs(rpc_server):
+    """Test that `system.multicall_kwargs` runs calls in order and reports errors positionally."""
+    results = rpc_server.system_multicall_kwargs(
+        [
+            {"methodName": "add", "args": [1], "kwargs": {"b": 2}},
+            {"methodName": "fail"},
+            {"methodName": "is_alive"},
+            {"methodName": "is_alive", "kwargs": {"unexpected": 1}},
+        ]
+    )
+    assert results[0] == [3]
+    assert "boom" in results[1]["faultString"]
+    assert results[2] == [True]
+    assert "does not accept keyword arguments" in results[3]["faultString"]
+
+
+def test_batch(rpc_session):
+    """Test that a batch sends all queued calls and returns their results positionally."""
+    with rpc_session.batch(raise_on_error=False) as batch:
+        assert batch.add(1, b=2) == 0
+        batch.fail()
+        batch.add(3)
+    assert len(batch.results) == 3
+    assert batch.results[0] == 3
+    assert isinstance(batch.results[1], Fault)
+    assert batch.results[2] == 3
+
+    with pytest.raises(Fault, match="boom"):
+        with rpc_session.batch() as batch:
+            batch.fail()
+
+
+def test_keepalive_connection_reuse(rpc_server):
+    """Test that consecutive calls reuse the same HTTP/1.1 connection."""
+    _, port = rpc_server.server_address
+    transport = TimeoutTransport(timeout=5.0)
+    proxy = ServerProxy(f"http://localhost:{port}", transport=transport)
+
+    assert proxy.is_alive()
+    sock = transport._connection[1].sock
+    assert sock is not None
+    assert proxy.is_alive()
+    assert transport._connection[1].sock is sock
+
+    # ... idle connections are re-opened transparently
+    transport.idle_timeout = 0.0
+    assert proxy.is_alive()
+    assert transport._connection[1].sock is not sock
+
+
+def test_async_session(rpc_server):
+    """Test concurrent calls through the asyncio client."""
+    _, port = rpc_server.server_address
+
+    async def _run():
+        async with AsyncPymolSession(hostname="localhost", port=port) as session:
+            results = await asyncio.gather(*(session.add(i, b=1) for i in range(10)))
+            assert results == [i + 1 for i in range(10)]
+            assert len(session._idle_connections[port]) > 1
+            with pytest.raises(Fault, match="boom"):
+                await session.fail()
+            assert await session.is_alive()
+
+    asyncio.run(_run())
+
+
+def test_partial_request_does_not_block(rpc_server):
+    """Test that a client sending an incomplete request does not stall other clients."""
+    _, port = rpc_server.server_address
+    with socket.create_connection(("localhost", port)) as slow_client:
+        slow_client.sendall(
+            b"POST /RPC2 HTTP/1.1\r\nContent-Length: 1000\r\n\r\n<?xml version="
+        )
+        proxy = ServerProxy(
+            f"http://localhost:{port}", transport=TimeoutTransport(timeout=2.0)
+        )
+        assert proxy.is_alive()
+
+
+@pytest.mark.parametrize(
+    "request_bytes, status",
+    [
+        (b"POST /" + b"x" * (1 << 17) + b" HTTP/1.1\r\n\r\n", b"400"),
+        (b"POST /RPC2 HTTP/1.1\r\nX-Long: " + b"x" * (1 << 17) + b"\r\n\r\n", b"431"),
+        (b"POST /RPC2 HTTP/1.1\r\nContent-Length: 1099511627776\r\n\r\n", b"413"),
+        (b"POST /RPC2 HTTP/1.1\r\nContent-Length: -1\r\n\r\n", b"400"),
+    ],
+)
+def test_invalid_request(rpc_server, request_bytes, status):
+    """Test that oversized or malformed requests are answered with an error status."""
+    _, port = rpc_server.server_address
+    with socket.create_connection(("localhost", port), timeout=5.0) as raw_client:
+        raw_client.sendall(request_bytes)
+        assert raw_client.recv(1024).startswith(b"HTTP/1.1 " + status)
+    with ServerProxy(
+        f"http://localhost:{port}", transport=TimeoutTransport(2.0)
+    ) as proxy:
+        assert proxy.is_alive()
+
+
+def test_serve_after_shutdown(rpc_server):
+    """Test that the server can be served again after `shutdown`."""
+    _, port = rpc_server.server_address
+    rpc_server.shutdown()
+    server_thread = threading.Thread(
+        target=rpc_server.serve_forever, args=(0.01,), daemon=True
+    )
+    server_thread.start()
+    with ServerProxy(
+        f"http://localhost:{port}", transport=TimeoutTransport(2.0)
+    ) as proxy:
+        assert proxy.is_alive()
+
+
+def test_command_queue_drain():
+    """Test that the command queue runs calls in order within its time budget."""
+    command_queue = _CommandQueue(time_budget=0.0)
+    futures = [command_queue.submit(_add, i, b=1) for i in range(5)]
+    assert command_queue.stats()["queue_depth"] == 5
+
+    # ... at least one call is run per batch, even with a zero time budget
+    assert command_queue.drain() == 1
+    assert command_queue.drain(time_budget=10.0) == 4
+    assert [future.result() for future in futures] == [1, 2, 3, 4, 5]
+
+    stats = command_queue.stats()
+    assert stats["n_calls"] == 5
+    assert stats["n_batches"] == 2
+    assert stats["max_batch_size"] == 4
+    assert stats["max_queue_depth"] == 5
+    assert stats["queue_depth"] == 0
+
+
+def test_command_queue_priorities():
+    """Test that calls with a lower priority value run first."""
+    command_queue = _CommandQueue()
+    order = []
+    command_queue.submit_with_priority(10, order.append, "job")
+    command_queue.submit_with_priority(20, order.append, "batch job")
+    command_queue.submit(order.append, "interactive")
+    command_queue.drain(time_budget=10.0)
+    assert order == ["interactive", "job", "batch job"]
+
+
+@pytest.mark.parametrize("cancel_futures", [True, False])
+def test_command_queue_shutdown(cancel_futures):
+    """Test that shutdown waits for the worker and cancels queued calls if asked to."""
+    command_queue = _CommandQueue()
+    command_queue.start_worker_thread()
+    release = threading.Event()
+    running_future = command_queue.submit(release.wait, 5.0)
+    queued_future = command_queue.submit(_add, 1, b=2)
+    while not running_future.running():
+        time.sleep(0.01)
+
+    threading.Timer(0.05, release.set).start()
+    command_queue.shutdown(wait=True, cancel_futures=cancel_futures)
+    assert running_future.result(timeout=0) is True
+    if cancel_futures:
+        assert queued_future.cancelled()
+    else:
+        assert queued_future.result(timeout=0) == 3
+    assert not command_queue._thread.is_alive()
+    with pytest.raises(RuntimeError):
+        command_queue.submit(_add, 1)
+
+
+def test_jobs(rpc_server, rpc_session):
+    """Test submitting, polling, cancelling and waiting for jobs."""
+    release = threading.Event()
+    rpc_server.register_function_with_kwargs(release.wait, "block")
+
+    blocking_job = rpc_session.submit("block", 5.0)
+    queued_job = rpc_session.submit("add", 1, b=2)
+    while rpc_session.poll(blocking_job) != "running":
+        time.sleep(0.01)
+
+    # ... the server keeps answering while the job is running
+    assert rpc_session.is_alive()
+    assert rpc_session.poll(queued_job) == "pending"
+    assert rpc_session.cancel(queued_job)
+    assert rpc_session.poll(queued_job) == "cancelled"
+    with pytest.raises(TimeoutError):
+        rpc_session.result(blocking_job, timeout=0.1)
+
+    release.set()
+    assert rpc_session.result(blocking_job, timeout=5.0) is True
+    assert rpc_session.result(rpc_session.submit("add", 1, b=2), timeout=5.0) == 3
+    with pytest.raises(Fault, match="boom"):
+        rpc_session.result(rpc_session.submit("fail"), timeout=5.0)
+    # ... `args` and `kwargs` are optional for clients calling `submit_job` directly
+    assert rpc_session.result(rpc_session.submit_job("is_alive"), timeout=5.0)
+
+
+def test_job_expiry(rpc_server, rpc_session, monkeypatch):
+    """Test that jobs are forgotten once fetched, or some time after they finished."""
+    monkeypatch.setattr(server_module, "_JOBS", {})
+    monkeypatch.setattr(server_module, "_FINISHED_JOBS", {})
+    fetched_job = rpc_session.submit("add", 1, b=2)
+    assert rpc_session.result(fetched_job, timeout=5.0) == 3
+    assert fetched_job not in server_module._JOBS
+
+    unfetched_job = rpc_session.submit("add", 1, b=2)
+    while unfetched_job not in server_module._FINISHED_JOBS:
+        time.sleep(0.01)
+    monkeypatch.setattr(server_module, "_JOB_TTL", 0.0)
+    rpc_session.submit("add", 1, b=2)
+    with pytest.raises(Fault, match="not found"):
+        rpc_session.poll(unfetched_job)
+
+
+def test_process_marshal_pool():
+    """Test that large responses can be marshalled in a process pool."""
+    server = PymolXMLRPCServer("localhost", 0, marshal_pool="process")
+    server.register_function(lambda: b"\x00" * 1_000_000, "get_buffer")
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    try:
+        _, port = server.server_address
+        proxy = ServerProxy(
+            f"http://localhost:{port}", transport=TimeoutTransport(timeout=30.0)
+        )
+        assert proxy.get_buffer().data == b"\x00" * 1_000_000
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_bulk_lane(monkeypatch):
+    """Test that bulk transfers are routed to the bulk listener or the `/bulk` path."""
+    monkeypatch.setattr(client, "_GLOBAL_SERVER_PROXY", None)
+    monkeypatch.setattr(client, "_GLOBAL_BULK_SERVER_PROXY", None)
+    server = PymolXMLRPCServer("localhost", 0, bulk_port=0)
+    server.register_function(is_alive, "is_alive", queued=False)
+    server.register_function_with_kwargs(lambda size: "x" * size, "get_state")
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    try:
+        _, port = server.server_address
+        for bulk_port in (None, server.bulk_port):
+            session = PymolSession(
+                hostname="localhost", port=port, force_new=True, bulk_port=bulk_port
+            )
+            assert session._get_proxy("get_state") is session._bulk_server
+            assert session._get_proxy("is_alive") is session._server
+            assert session.get_state(size=100_000) == "x" * 100_000
+            assert session.is_alive()
+
+        async def _main():
+            async with AsyncPymolSession(
+                hostname="localhost", port=port, bulk_port=server.bulk_port
+            ) as session:
+                return await session.get_state(size=10)
+
+        assert asyncio.run(_main()) == "x" * 10
+        # ... the bulk listener serves all methods
+        bulk_proxy = ServerProxy(f"http://localhost:{server.bulk_port}")
+        assert bulk_proxy.is_alive()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_iter_state(rpc_server, rpc_session, tmp_path):
+    """Test that `iter_state` streams a server-side cursor and decodes text chunks."""
+    text = "HETATM Å ångström " * 100
+
+    def _open_state_cursor(selection="(all)", state=-1, format="pdb"):
+        path = tmp_path / f"state.{format}"
+        if format == "pdb":
+            path.write_text(text, encoding="utf-8")
+        else:
+            path.write_bytes(b"\x89PNG" * 100)
+        return _open_state_cursor_file(str(path), text=format == "pdb")
+
+    rpc_server.register_function_with_kwargs(_open_state_cursor, "open_state_cursor")
+    for cursor_function in (read_state_chunk, close_state_cursor):
+        rpc_server.register_function_with_kwargs(
+            cursor_function, cursor_function.__name__, queued=False
+        )
+
+    # ... an odd chunk size splits the multi-byte characters across chunks
+    chunks = list(rpc_session.iter_state(chunk_size=7))
+    assert "".join(chunks) == text
+    assert b"".join(rpc_session.iter_state(format="png", chunk_size=64)) == (
+        b"\x89PNG" * 100
+    )
+    assert not (tmp_path / "state.pdb").exists()
+
+    # ... stopping early closes the cursor
+    iterator = rpc_session.iter_state(chunk_size=7)
+    next(iterator)
+    iterator.close()
+    assert not server_module._STATE_CURSORS
+
+
+def test_state_cursor_expiry(monkeypatch, tmp_path):
+    """Test that idle cursors are closed and their scratch files removed."""
+    monkeypatch.setattr(server_module, "_STATE_CURSORS", {})
+    paths = [tmp_path / f"state{i}.pdb" for i in range(2)]
+    for path in paths:
+        path.write_text("HETATM")
+    idle_cursor = _open_state_cursor_file(str(paths[0]), text=True)
+    monkeypatch.setattr(server_module, "_STATE_CURSOR_TTL", 0.0)
+    cursor = _open_state_cursor_file(str(paths[1]), text=True)
+    assert list(server_module._STATE_CURSORS) == [cursor["id"]]
+    assert not paths[0].exists()
+    with pytest.raises(KeyError):
+        read_state_chunk(idle_cursor["id"])
+    assert read_state_chunk(cursor["id"]) == b"HETATM"
+    assert close_state_cursor(cursor["id"])
+
+
+def test_state_cursor_expiry_while_reading(monkeypatch, tmp_path):
+    """Test that cursors expired by other threads are never closed mid-read."""
+    monkeypatch.setattr(server_module, "_STATE_CURSORS", {})
+    monkeypatch.setattr(server_module, "_STATE_CURSOR_TTL", 0.0)
+    text = b"HETATM" * 1000
+    errors = []
+
+    class _SlowFile:
+        """A file whose reads give other threads the time to expire its cursor."""
+
+        def __init__(self, path, mode):
+            self._file = open(path, mode)
+
+        def read(self, size):
+            time.sleep(0.001)
+            return self._file.read(size)
+
+        def fileno(self):
+            return self._file.fileno()
+
+        def close(self):
+            self._file.close()
+
+    monkeypatch.setattr(server_module, "open", _SlowFile, raising=False)
+
+    def _read(thread_index):
+        for i in range(20):
+            path = tmp_path / f"state{thread_index}-{i}.pdb"
+            path.write_bytes(text)
+            # ... opening a cursor expires those of the other threads
+            cursor = _open_state_cursor_file(str(path), text=True)
+            chunks = []
+            try:
+                while chunk := read_state_chunk(cursor["id"], 600):
+                    chunks.append(chunk)
+            except KeyError:
+                pass  # ... expired
+            except Exception as e:
+                errors.append(e)
+            if not text.startswith(b"".join(chunks)):
+                errors.append(f"Chunks of {path} are not a prefix of the file.")
+
+    threads = [threading.Thread(target=_read, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert not server_module._STATE_CURSORS
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("compression", ["gzip", "xz", "x-pdb-deflate", None])
+def test_compression(rpc_server, compression):
+    """Test that requests and responses are compressed with the negotiated codec."""
+    _, port = rpc_server.server_address
+    session = PymolSession(
+        hostname="localhost", port=port, force_new=True, compression=compression
+    )
+    text = "ATOM      1  N   ALA A   1      11.104   6.134  -6.504\n" * 1000
+    try:
+        # ... the `is_alive` check on connect has learnt the codecs the server accepts
+        assert session.add(text, b="") == text
+        assert session.add(text, b="") == text
+        stats = session.compression_stats()
+    finally:
+        client._GLOBAL_SERVER_PROXY = None
+        client._GLOBAL_BULK_SERVER_PROXY = None
+
+    if compression is None:
+        assert stats == {}
+        assert rpc_server.compression_stats.summary() == {}
+    else:
+        assert stats[f"request:{compression}"]["n_calls"] == 2
+        assert stats[f"response:{compression}"]["n_calls"] == 2
+        assert stats[f"response:{compression}"]["ratio"] > 5
+        server_stats = rpc_server.compression_stats.summary()
+        assert server_stats[f"response:{compression}"]["n_calls"] == 2
+
+
+def test_set_coords(rpc_server, rpc_session, fake_cmd):
+    """Test that coordinates are sent as a packed array and updated in place."""
+    _register(rpc_server, set_coords)
+    fake_cmd.load_pdb(_PDB, "ligand")
+    coords = [[1.0, 2.0, 3.0], [-4.5, 5.25, 6.0], [0.0, 0.0, 0.0]]
+    assert rpc_session.set_coords("ligand", coords) == 3
+    assert [atom["coords"] for atom in fake_cmd.atoms] == [[xyz] for xyz in coords]
+    with pytest.raises(Fault, match="must have shape"):
+        rpc_session.set_coords("ligand", [1.0, 2.0, 3.0])
+
+
+def test_get_coords(rpc_server, rpc_session, fake_cmd):
+    """Test that coordinates of one or several states are received as packed arrays."""
+    pytest.importorskip("numpy")
+    _register(rpc_server, get_coords, get_ensemble_coords)
+    fake_cmd.load_pdb(_PDB, "ligand")
+    for atom in fake_cmd.atoms:
+        atom["coords"] += [[float(state), 0.0, 0.0] for state in range(2, 6)]
+    assert rpc_session.get_coords("ligand").tolist() == [
+        [0.0, 0.0, 0.0],
+        [1.5, 0.0, 0.0],
+        [3.0, 0.0, 0.0],
+    ]
+    assert rpc_session.get_coords("none").shape == (0, 3)
+
+    ensemble = rpc_session.get_ensemble_coords("ligand", start=2, step=2)
+    assert ensemble.shape == (2, 3, 3)
+    assert ensemble[:, :, 0].tolist() == [[2.0] * 3, [4.0] * 3]
+    assert rpc_session.get_ensemble_coords("ligand").shape == (5, 3, 3)
+
+
+def test_trajectory_upload(rpc_server, rpc_session, fake_cmd, monkeypatch):
+    """Test that trajectory frames are uploaded in chunks, as states of the object."""
+    monkeypatch.setattr(server_module, "_TRAJECTORY_UPLOADS", {})
+    _register(rpc_server, begin_trajectory, append_frames, commit_trajectory)
+    fake_cmd.load_pdb(_PDB, "traj")
+    n_chunks = []
+
+    def _append_frames(upload_id, buffer):
+        n_chunks.append(1)
+        return append_frames(upload_id, buffer)
+
+    rpc_server.register_function_with_kwargs(_append_frames, "append_frames")
+    frames = [[[float(i), 0.0, 0.0]] * 3 for i in range(5)]
+    # ... two frames of 3 atoms per chunk
+    with rpc_session.begin_trajectory("traj", _PDB, chunk_size=72) as upload:
+        assert upload.append_frames(frames) == 5
+    assert upload.n_frames == 5
+    assert len(n_chunks) == 3
+    # ... the object was replaced, and frame `i` is its state `i`
+    assert len(fake_cmd.atoms) == 3
+    assert [atom["coords"] for atom in fake_cmd.atoms] == [
+        [frame[0] for frame in frames]
+    ] * 3
+    assert not server_module._TRAJECTORY_UPLOADS
+
+    upload = rpc_session.begin_trajectory("traj", _PDB)
+    with pytest.raises(Fault, match="Frame has 2 atoms"):
+        upload.append_frames([[[0.0, 0.0, 0.0]] * 2])
+    # ... a single `(n_atoms, 3)` frame is not read as `n_atoms` frames
+    assert upload.append_frames([[1.0, 2.0, 3.0]] * 3) == 1
+    with pytest.raises(ValueError, match="shape"):
+        upload.append_frames([[[1.0, 2.0]] * 3])
+
+
+def test_trajectory_upload_expiry(fake_cmd, monkeypatch):
+    """Test that uploads that are never committed are forgotten once idle."""
+    monkeypatch.setattr(server_module, "_TRAJECTORY_UPLOADS", {})
+    upload_id = begin_trajectory("traj", _PDB)
+    append_frames(upload_id, encode_array([[0.0, 0.0, 0.0]] * 3))
+    monkeypatch.setattr(server_module, "_TRAJECTORY_UPLOAD_TTL", 0.0)
+    begin_trajectory("traj", _PDB)
+    assert upload_id not in server_module._TRAJECTORY_UPLOADS
+    assert len(server_module._TRAJECTORY_UPLOADS) == 1
+
+
+def test_stream_frame_latest_wins(rpc_server, rpc_session):
+    """Test that only the newest streamed frame waits for the busy command queue."""
+    pytest.importorskip("numpy")
+    for stream_function in (stream_frame, close_stream):
+        rpc_server.register_function_with_kwargs(
+            stream_function, stream_function.__name__, queued=False
+        )
+    release = threading.Event()
+    blocking_future = rpc_server._command_queue.submit(release.wait, 5.0)
+    try:
+        for i in range(5):
+            stats = rpc_session.stream_frame("ligand", [[0.0, 0.0, 0.01 * i]] * 10)
+        assert stats == {"n_received": 5, "n_applied": 0, "n_dropped": 4}
+        frame, _ = server_module._STREAMS["ligand"]["pending"]
+        assert frame.tolist() == [[0.0, 0.0, pytest.approx(0.04)]] * 10
+    finally:
+        release.set()
+        blocking_future.result()
+        rpc_session.close_stream("ligand")
+    assert "ligand" not in server_module._STREAMS
+
+
+def test_atom_table(rpc_server, rpc_session, fake_cmd):
+    """Test that atom tables are read with a single `iterate` and decoded on the client."""
+    _register(rpc_server, get_atom_table)
+    fake_cmd.load_pdb(_PDB, "ligand")
+    table = rpc_session.get_atom_table("ligand", fields=["name", "resv", "b", "x"])
+    assert list(table["name"]) == ["C1", "N1", "O1"]
+    assert list(table["resv"]) == [1, 1, 1]
+    assert list(table["b"]) == [10.0, 20.0, 30.0]
+    assert list(table["x"]) == [0.0, 1.5, 3.0]
+    assert list(rpc_session.get_atom_table("none", fields=["name"])["name"]) == []
+    assert list(rpc_session.get_atom_table("ligand").fields) == [
+        "chain",
+        "resi",
+        "resn",
+        "name",
+        "elem",
+        "b",
+        "q",
+    ]
+    with pytest.raises(Fault, match="not supported"):
+        rpc_session.get_atom_table(fields=["mass"])
+    with pytest.raises(Fault, match="at least one field"):
+        rpc_session.get_atom_table(fields=[])
+
+
+def test_set_atom_property(rpc_server, rpc_session, fake_cmd):
+    """Test that per-atom values, mappings and strings are set with a single `alter`."""
+    _register(rpc_server, set_atom_property)
+    fake_cmd.load_pdb(_PDB, "ligand")
+    assert rpc_session.set_atom_property("ligand", "b", [0.5, 1.5, 2.5]) == 3
+    assert rpc_session.set_atom_property("ligand", "vdw", {"C": 1.7, "N": 1.55}) == 3
+    assert rpc_session.set_atom_property("ligand", "label", ["a", "b", "c"]) == 3
+    assert [atom["b"] for atom in fake_cmd.atoms] == [0.5, 1.5, 2.5]
+    assert [atom["vdw"] for atom in fake_cmd.atoms] == [1.7, 1.55, 1.5]
+    assert [atom["label"] for atom in fake_cmd.atoms] == ["a", "b", "c"]
+    assert fake_cmd.calls == [("rebuild", "ligand")] * 3
+
+    # ... integer properties are sent as int32, float32 would round these colors
+    colors = [0x40FF8041, 0x40000001, 0x4000FF81]
+    assert rpc_session.set_atom_property("ligand", "color", colors) == 3
+    assert [atom["color"] for atom in fake_cmd.atoms] == colors
+
+    # ... string fields are sent as lists, not as float32 ("1.0")
+    assert rpc_session.set_atom_property("ligand", "resi", [1, 2, 10]) == 3
+    assert [atom["resi"] for atom in fake_cmd.atoms] == ["1", "2", "10"]
+    # ... XML-RPC keys are strings, non-string key fields are compared as strings
+    assert rpc_session.set_atom_property("ligand", "q", {1: 0.5}, "resv") == 3
+    assert [atom["q"] for atom in fake_cmd.atoms] == [0.5, 0.5, 0.5]
+
+    with pytest.raises(Fault, match="Got 2 values for 3 atoms"):
+        rpc_session.set_atom_property("ligand", "b", [0.5, 1.5])
+    with pytest.raises(ValueError, match="send its values as a list"):
+        set_atom_property("ligand", "resi", encode_array([1, 2, 3]))
+    with pytest.raises(Fault, match="cannot be set"):
+        rpc_session.set_atom_property("ligand", "index", [1, 2, 3])
+
+
+@pytest.mark.parametrize(
+    "colors",
+    [
+        [[255, 0, 0], [0, 128, 255], [0, 0, 0]],
+        [[1.0, 0.0, 0.0], [0.0, 0.5, 1.0], [0.0, 0.0, 0.0]],
+    ],
+)
+def test_set_atom_colors(rpc_server, rpc_session, fake_cmd, colors):
+    """Test that integer and float colors are set as direct RGB colors."""
+    _register(rpc_server, set_atom_colors)
+    fake_cmd.load_pdb(_PDB, "ligand")
+    assert rpc_session.set_atom_colors("ligand", colors) == 3
+    assert [atom["color"] for atom in fake_cmd.atoms] == [
+        0x40FF0000,
+        0x400080FF,
+        0x40000000,
+    ]
+    assert fake_cmd.calls == [("recolor", "ligand")]
+
+
+def test_selection_indices(rpc_server, rpc_session, fake_cmd):
+    """Test that selections are defined and read as encoded indices."""
+    _register(rpc_server, select_indices, get_selection_indices)
+    fake_cmd.load_pdb(_PDB * 6667, "6lyz")
+    fake_cmd.load_pdb(_PDB, "ligand")
+    indices = list(range(1, 20001, 2))
+    assert rpc_session.select_indices("odd", "6lyz", indices) == 10000
+    assert fake_cmd.selections["odd"] == {("6lyz", index) for index in indices}
+    assert rpc_session.get_selection_indices("odd") == {"6lyz": indices}
+    assert rpc_session.get_selection_indices("odd", encoding="runs") == {
+        "6lyz": indices
+    }
+    assert rpc_session.get_selection_indices("all") == {
+        "6lyz": list(range(1, 20002)),
+        "ligand": [1, 2, 3],
+    }
+
+
+def test_run_python(rpc_server, rpc_session, monkeypatch):
+    """Test that the value of the last expression is returned and sources are cached."""
+    monkeypatch.setattr(server_module, "pymol_cmd", None, raising=False)
+    monkeypatch.setattr(server_module, "_PYTHON_NAMESPACE", {})
+    rpc_server.register_function_with_kwargs(run_python, "run_python")
+    assert rpc_session.run_python("x = 20\nx + 1") == 21
+    assert rpc_session.run_python("x = 1") is None
+    assert rpc_session.run_python("x + 1") == 2
+    assert rpc_session.run_python("cmd is None")
+
+    hits = server_module._compile_python.cache_info().hits
+    rpc_session.run_python("x + 1")
+    assert server_module._compile_python.cache_info().hits == hits + 1
+
+
+def test_procedures(rpc_server, rpc_session, monkeypatch):
+    """Test that procedures are called by name and re-registered if the server lost them."""
+    monkeypatch.setattr(server_module, "pymol_cmd", None, raising=False)
+    monkeypatch.setattr(server_module, "_PYTHON_NAMESPACE", {})
+    monkeypatch.setattr(server_module, "_PROCEDURES", {})
+    for python_function in (
+        register_procedure,
+        call_procedure,
+        get_procedures,
+        run_python,
+    ):
+        rpc_server.register_function_with_kwargs(
+            python_function, python_function.__name__
+        )
+
+    def scale(values, factor=2, name="x"):
+        return {name: [value * factor for value in values]}
+
+    scale_remote = rpc_session.register_procedure(scale)
+    assert scale_remote([1, 2], factor=3) == {"x": [3, 6]}
+    assert rpc_session.call_procedure("scale", [1], name="y") == {"y": [2]}
+
+    # ... e.g. after a restart of the server
+    server_module._PROCEDURES.clear()
+    assert scale_remote([1]) == {"x": [2]}
+
+    digest = rpc_session.get_procedures()["scale"]
+    rpc_session.register_procedure("def scale(): pass", "scale")
+    assert rpc_session.get_procedures()["scale"] != digest
+
+    with pytest.raises(Fault, match="must define"):
+        rpc_session.register_procedure("y = 1", "scale_twice")
+    # ... procedures share the globals of `run_python`
+    rpc_session.register_procedure("def offset(x): return x + OFFSET", "offset")
+    rpc_session.run_python("OFFSET = 10")
+    assert rpc_session.call_procedure("offset", 1) == 11
+    assert rpc_session.run_python("offset(2)") == 12
+    with pytest.raises(Fault, match="must define"):
+        rpc_session.register_procedure("y = 1", "offset")
+    assert rpc_session.run_python("offset(3)") == 13
+    with pytest.raises(Fault) as exc_info:
+        rpc_session.call_procedure("scale_twice")
+    assert exc_info.value.faultCode == FAULT_UNKNOWN_PROCEDURE
+
+    # ... errors of the procedure itself never re-register it
+    registered = []
+
+    def _register_procedure(name, source):
+        registered.append(name)
+        return register_procedure(name, source)
+
+    rpc_server.register_function_with_kwargs(_register_procedure, "register_procedure")
+    lookup = rpc_session.register_procedure(
+        "def lookup(): raise KeyError('Procedure is not registered.')", "lookup"
+    )
+    with pytest.raises(Fault) as exc_info:
+        lookup()
+    assert exc_info.value.faultCode == 1
+    assert registered == ["lookup"]
+
+
+def test_apply_preset(rpc_server, rpc_session, fake_cmd, monkeypatch):
+    """Test that presets are uploaded once, applied by their hash and skip no-ops."""
+    monkeypatch.setattr(server_module, "_PRESETS", {})
+    _register(rpc_server, upload_preset, apply_preset)
+    fake_cmd.load_pdb(_PDB, "ligand")
+    preset = {
+        "element_properties": {"vdw": {"C": 1.7, "N": 1.55}},
+        "colors": {"coral": [1.0, 0.5, 0.31]},
+        "settings": {"antialias": 3, "ray_trace_mode": 0},
+        "commands": [["bg_color", ["grey19"]]],
+    }
+    stats = rpc_session.apply_preset(preset)
+    assert stats == {
+        "n_atoms": 3,
+        "n_colors": 1,
+        "n_colors_skipped": 0,
+        "n_settings": 1,
+        "n_settings_skipped": 1,
+        "n_commands": 1,
+        "rebuilt": True,
+    }
+    assert [atom["vdw"] for atom in fake_cmd.atoms] == [1.7, 1.55, 1.5]
+    assert fake_cmd.colors == {"coral": [1.0, 0.5, 0.31]}
+    assert fake_cmd.settings == {"antialias": "3", "ray_trace_mode": "0"}
+    assert fake_cmd.calls == [("bg_color", "grey19"), ("rebuild", "all")]
+
+    # ... the preset is applied by its hash, without uploading it again
+    del rpc_server.funcs["upload_preset"]
+    stats = rpc_session.apply_preset(preset)
+    assert (stats["n_colors_skipped"], stats["n_settings_skipped"]) == (1, 2)
+
+    # ... e.g. after a restart of the server
+    _register(rpc_server, upload_preset)
+    server_module._PRESETS.clear()
+    assert rpc_session.apply_preset(preset)["n_atoms"] == 3
+    with pytest.raises(Fault) as exc_info:
+        apply_preset("0" * 64)
+    assert exc_info.value.faultCode == FAULT_UNKNOWN_PRESET
+    with pytest.raises(Fault, match="Unknown preset keys"):
+        rpc_session.apply_preset({"setting": {}})
+
+
+def test_make_pymol_pretty(rpc_server, rpc_session, fake_cmd, monkeypatch):
+    """Test the radii, colors and commands of the pretty preset."""
+    monkeypatch.setattr(server_module, "_PRESETS", {})
+    _register(rpc_server, upload_preset, apply_preset)
+    fake_cmd.load_pdb(_PDB, "ligand")
+    # ... elements are matched regardless of case, like `elem Cl` selections
+    fake_cmd.atoms[0]["elem"] = "CL"
+    fake_cmd.settings = dict.fromkeys(PRETTY_PRESET["settings"], "")
+    make_pymol_pretty(rpc_session)
+    assert [atom["vdw"] for atom in fake_cmd.atoms] == [1.75, 1.55, 1.52]
+    assert fake_cmd.colors == PRETTY_PRESET["colors"]
+    assert fake_cmd.colors["lightblue"] == [142 / 255, 236 / 255, 245 / 255]
+    # ... the representations are rebuilt once, after `space cmyk`
+    assert fake_cmd.calls == [
+        ("bg_color", "grey19"),
+        ("space", "cmyk"),
+        ("rebuild", "all"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "current, value, matches",
+    [
+        ("off", "off", True),
+        ("off", 0, True),
+        ("on", 1, True),
+        ("0.50000", 0.5, True),
+        ("3", 3, True),
+        ("black", "Black", True),
+        ("0.45000", 0.5, False),
+        ("on", "off", False),
+    ],
+)
+def test_setting_matches(current, value, matches):
+    assert _setting_matches(current, value) == matches
+
+
+def test_update_suspension():
+    """Test that rebuilds are coalesced and a single refresh is done per burst."""
+    calls = []
+
+    class _Cmd(object):
+        def __getattr__(self, name):
+            return lambda *args: calls.append((name, *args))
+
+    updates = _UpdateSuspension(_Cmd())
+    updates.suspend("burst")
+    for _ in range(3):
+        updates.record_call()
+        updates.defer_rebuild()
+    updates.suspend("explicit")
+    updates.flush()
+    updates.record_call()
+    updates.resume()
+    assert calls == [
+        ("set", "suspend_updates", 1),
+        ("feedback", "disable", "all", "actions"),
+        ("rebuild",),
+        ("set", "suspend_updates", 0),
+        ("refresh",),
+        ("set", "suspend_updates", 1),
+        ("set", "suspend_updates", 0),
+        ("refresh",),
+        ("feedback", "enable", "all", "actions"),
+    ]
+    assert updates.stats() == {
+        "mode": None,
+        "n_suspensions": 1,
+        "n_refreshes": 2,
+        "n_saved_redraws": 2,
+        "n_deferred_rebuilds": 3,
+        "n_rebuilds": 1,
+    }
+
+
+def test_burst_suspends_updates(rpc_server, rpc_session):
+    """Test that batches and explicit hints suspend updates and defer rebuilds."""
+    rebuilds = []
+    rpc_server.register_function_with_kwargs(lambda: rebuilds.append(1), "rebuild")
+    for update_function in (suspend_updates, resume_updates, get_update_stats):
+        rpc_server.register_function_with_kwargs(
+            update_function, update_function.__name__
+        )
+
+    with rpc_session.batch() as batch:
+        for i in range(5):
+            batch.add(i, 1)
+        batch.rebuild()
+        batch.rebuild()
+    assert batch.results[:5] == [1, 2, 3, 4, 5]
+    assert not rebuilds
+    stats = rpc_session.get_update_stats(reset=True)
+    assert stats["mode"] is None
+    assert stats["n_saved_redraws"] == 4
+    assert (stats["n_deferred_rebuilds"], stats["n_rebuilds"]) == (2, 1)
+
+    # ... small batches are run as usual
+    with rpc_session.batch() as batch:
+        batch.add(1, 1)
+        batch.rebuild()
+    assert rebuilds == [1]
+
+    with rpc_session.suspend_updates():
+        assert rpc_server.updates.mode == "explicit"
+        for i in range(3):
+            rpc_session.add(i, 1)
+    assert rpc_session.get_update_stats()["n_saved_redraws"] == 2
+
+
+def test_burst_ending_on_job_resumes_updates(rpc_server, rpc_session):
+    """Test that a burst is ended by its last call, even if that is a job."""
+    release = threading.Event()
+    blocking_future = rpc_server._command_queue.submit(release.wait, 5.0)
+    futures = [
+        rpc_server._command_queue.submit(
+            rpc_server._dispatch_queued, "add", ([i], {"b": 1})
+        )
+        for i in range(3)
+    ]
+    job_id = rpc_session.submit("add", 1, b=2)
+    release.set()
+    blocking_future.result()
+    assert [future.result()[1] for future in futures] == [1, 2, 3]
+    assert rpc_session.result(job_id, timeout=5.0) == 3
+    assert rpc_server.updates.mode is None
+    stats = rpc_server.updates.stats()
+    assert (stats["n_suspensions"], stats["n_refreshes"]) == (1, 1)
+
+
+def test_response_cache(rpc_server, cached_session):
+    """Test that cached reads are revalidated by generation and invalidated by changes."""
+    calls = []
+
+    def _get_names(type="objects"):
+        calls.append(type)
+        return ["6lyz", "ligand"]
+
+    rpc_server.register_function_with_kwargs(_get_names, "get_names")
+    assert cached_session.get_names() == ["6lyz", "ligand"]
+    assert cached_session.get_names() == ["6lyz", "ligand"]
+    assert len(calls) == 1
+    assert cached_session.get_names("all") == ["6lyz", "ligand"]
+    assert len(calls) == 2
+
+    # ... any other call may have changed the session
+    cached_session.add(1, 1)
+    assert cached_session.get_names() == ["6lyz", "ligand"]
+    assert len(calls) == 3
+    assert cached_session.cache.stats() == {
+        "n_hits": 0,
+        "n_not_modified": 1,
+        "n_misses": 3,
+        "size": 2,
+    }
+
+    _, port = rpc_server.server_address
+    session = PymolSession(
+        port=port, force_new=True, cache_size=128, cache_max_age=60.0
+    )
+    session.get_names()
+    session.get_names()
+    assert len(calls) == 4
+    assert session.cache.stats()["n_hits"] == 1
+
+
+def test_job_invalidates_response_cache(rpc_server, cached_session, fake_cmd):
+    """Test that a job that ran since a cached read invalidates it."""
+    rpc_server.register_function_with_kwargs(fake_cmd.get_names, "get_names")
+    cached_session.get_names()
+    job_id = cached_session.submit("add", 1, b=2)
+    assert cached_session.result(job_id, timeout=5.0) == 3
+    cached_session.get_names()
+    assert len(fake_cmd.calls) == 2
+
+
+def test_stream_frame_invalidates_response_cache(rpc_server, cached_session, fake_cmd):
+    """Test that an applied streamed frame invalidates a cached read."""
+    pytest.importorskip("numpy")
+    for stream_function in (stream_frame, close_stream):
+        rpc_server.register_function_with_kwargs(
+            stream_function, stream_function.__name__, queued=False
+        )
+    rpc_server.register_function_with_kwargs(fake_cmd.get_names, "get_names")
+    fake_cmd.load_pdb(_PDB, "ligand")
+    assert cached_session.get_names() == ["ligand"]
+    try:
+        cached_session.stream_frame("ligand", [[1.0, 2.0, 3.0]] * 3)
+        deadline = time.monotonic() + 5.0
+        while (
+            not server_module._STREAMS["ligand"]["n_applied"]
+            and time.monotonic() < deadline
+        ):
+            time.sleep(0.01)
+    finally:
+        cached_session.close_stream("ligand")
+    assert fake_cmd.atoms[0]["coords"] == [[1.0, 2.0, 3.0]]
+    cached_session.get_names()
+    assert len(fake_cmd.calls) == 2
+
+
+def test_reads_keep_response_cache(rpc_server, cached_session, fake_cmd):
+    """Test that calls that only read the session do not invalidate cached reads."""
+    _register(rpc_server, get_state)
+    for read_function in (fake_cmd.get_view, fake_cmd.count_atoms):
+        rpc_server.register_function_with_kwargs(read_function, read_function.__name__)
+    fake_cmd.load_pdb(_PDB, "ligand")
+    assert cached_session.get_state("ligand") == _PDB
+    assert len(cached_session.get_view()) == 18
+    assert cached_session.count_atoms("ligand") == 3
+    assert cached_session.get_state("ligand") == _PDB
+    assert cached_session.cache.stats()["n_not_modified"] == 1
+
+
+def test_response_cache_disk(tmp_path):
+    """Test that responses evicted from memory are kept on disk."""
+    cache = ResponseCache(max_size=1, directory=str(tmp_path), max_disk_size=1)
+    for i in range(3):
+        cache.put(f"key{i}", f'"etag{i}"', i, [i])
+    assert cache.stats()["size"] == 1
+    assert len(list(tmp_path.iterdir())) == 1
+    assert cache.get("key0") is None
+    etag, generation, _, response = cache.get("key1")
+    assert (etag, generation, response) == ('"etag1"', 1, [1])
+
+    # ... entries are stored as XML-RPC, unreadable files are ignored
+    cache.put("key3", '"etag3"', 3, {"png": b"\x89PNG", "names": ["6lyz"]})
+    cache.put("key4", '"etag4"', 4, None)
+    assert cache.get("key3")[3] == {"png": b"\x89PNG", "names": ["6lyz"]}
+    (tmp_path / "key9.xml").write_bytes(b"\x80\x04not xml")
+    assert cache.get("key9") is None
+    cache.clear()
+    assert cache.get("key1") is None
+    assert not list(tmp_path.iterdir())